@@ -0,0 +1,124 @@
+import os
+import numpy as np
+from _parallel import simulateMany
+from _output import ArrayOutput, MemmapOutput
+
+
+class GridScan (object):
+    """Runs a time course simulation for every point of the Cartesian product of several
+    parameter ranges, without any plotting. The result is an array of shape
+    (len(values1), ..., len(valuesN), numberOfPoints, len(selections)) where the
+    first selection is always time. The labels of each axis are kept in
+    self.parameters, self.values and self.selections.
+
+    parameters is either a list of (id, values) pairs or a dictionary, in which case
+    the ids are scanned in sorted order.
+
+    The scan can be run in chunks with runChunk(). If a filename is given, the result
+    is kept in a .npy file on disk together with the number of finished points, so a
+    scan that is interrupted picks up where it stopped when it is created again with
+    the same arguments. Any other scan output sink, for example one that only keeps
+    the final values, can be passed as output; its rows are then the grid points in
+    C order, reshaped to the grid when the sink holds an array. Grid points found in
+    a SimulationCache passed as cache are not simulated again. With a
+    PreEquilibration passed as preEquilibration, every grid point starts from the
+    equilibrated state for the values of its upstream parameters.
+
+    g = GridScan(rr, {'k1': [0.1, 0.2, 0.3], 'k2': np.linspace(0, 1, 20)}, ['S1', 'S2'])
+    result = g.run()
+    """
+    def __init__(self, rr, parameters, selections, startTime=0, endTime=20, numberOfPoints=50,
+                 integrator='cvode', workers=None, filename=None, output=None, cache=None,
+                 preEquilibration=None):
+        self.rr = rr
+        if isinstance(parameters, dict):
+            parameters = sorted(parameters.items())
+        self.parameters = [param for param, values in parameters]
+        self.values = [np.asarray(values, dtype=float) for param, values in parameters]
+        if not isinstance(selections, list):
+            selections = [selections]
+        if 'time' not in [item.lower() for item in selections]:
+            selections = ['time'] + selections
+        self.selections = selections
+        self.startTime = startTime
+        self.endTime = endTime
+        self.numberOfPoints = numberOfPoints
+        self.integrator = integrator
+        self.workers = workers
+        self.filename = filename
+        self.output = output
+        self.cache = cache
+        self.preEquilibration = preEquilibration
+        self.shape = tuple(len(values) for values in self.values)
+        self.size = int(np.prod(self.shape))
+        self.completed = 0
+        self.result = None
+        self._opened = False
+
+        for param in self.parameters:
+            if param not in rr.model.keys():
+                raise ValueError('"{0}" cannot be found in loaded model'.format(param))
+
+    def _allocate(self):
+        if self.output is None:
+            if self.filename is None:
+                self.output = ArrayOutput()
+            else:
+                self.output = MemmapOutput(self.filename, resume=True)
+        self.output.open(self.size)
+        if self.filename is not None and os.path.exists(self._progressFile()):
+            with open(self._progressFile()) as f:
+                self.completed = int(f.read())
+        self._opened = True
+
+    def _progressFile(self):
+        return self.filename + '.progress'
+
+    def _saveProgress(self):
+        with open(self._progressFile(), 'w') as f:
+            f.write(str(self.completed))
+
+    def _shaped(self, result):
+        if isinstance(result, np.ndarray):
+            return result.reshape(self.shape + result.shape[1:])
+        return result
+
+    def getAssignments(self, start, stop):
+        """Returns the list of (id, value) pairs for the flat grid indices start to stop."""
+        index = np.unravel_index(np.arange(start, stop), self.shape)
+        return [[(param, self.values[d][index[d][k]]) for d, param in enumerate(self.parameters)]
+                for k in range(stop - start)]
+
+    def isFinished(self):
+        return self._opened and self.completed >= self.size
+
+    def runChunk(self, chunkSize=None):
+        """Simulates the next chunkSize grid points, or all remaining ones if chunkSize
+        is None. Returns the number of points simulated."""
+        if not self._opened:
+            self._allocate()
+        start = self.completed
+        stop = self.size if chunkSize is None else min(self.size, start + chunkSize)
+        simulateMany(self.rr, self.getAssignments(start, stop), self.startTime, self.endTime,
+                     self.numberOfPoints, self.selections, integrator=self.integrator,
+                     workers=self.workers, out=self.output, offset=start, cache=self.cache,
+                     preEquilibration=self.preEquilibration)
+        self.completed = stop
+        if self.isFinished():
+            self.result = self._shaped(self.output.close())
+        else:
+            self.output.flush()
+            self.result = self._shaped(self.output.result)
+        if self.filename is not None:
+            self._saveProgress()
+        return stop - start
+
+    def run(self, chunkSize=None):
+        """Runs all remaining grid points, chunkSize at a time, and returns the result."""
+        if not self._opened:
+            self._allocate()
+        while not self.isFinished():
+            self.runChunk(chunkSize)
+        if self.result is None:
+            self.result = self._shaped(self.output.close())
+        return self.result
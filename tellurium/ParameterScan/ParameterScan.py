@@ -1,9 +1,11 @@
-import matplotlib.pyplot as plt
 from matplotlib.collections import PolyCollection
-from mpl_toolkits.mplot3d import Axes3D
 from matplotlib.ticker import LinearLocator, FormatStrFormatter
 import numpy as np
-import matplotlib
+import matplotlib.cm
+# pyplot is imported on first use, after a headless backend has been selected if needed
+from tellurium.tellurium import plt
+from _parallel import simulateMany
+from GridScan import GridScan
 
 class ParameterScan (object):
     def __init__(self, rr):
@@ -31,6 +33,11 @@ class ParameterScan (object):
         self.antialias = True
         self.sameColor = False
         self.legend = True
+        self.workers = None
+        self.output = None
+        self.cache = None
+        self.preEquilibration = None
+        self.scanResult = None
 
     
     def sim(self):
@@ -83,7 +90,18 @@ class ParameterScan (object):
 
     def graduatedSim(self):
         """Runs successive simulations with incremental changes in one species, and returns
-        results for a plotting function. Not intended to be called by user."""
+        results for a plotting function. Not intended to be called by user.
+
+        The results are written into a single preallocated array of shape
+        (numberOfPoints, polyNumber, len(selection)), which is also kept as
+        self.scanResult. The first selection is always time. If self.workers is set to
+        more than one, the simulations are shared among that many processes. If
+        self.cache is set to a SimulationCache, simulations that are found in it are
+        not run again.
+
+        If self.output is set to a scan output sink, each trajectory is written to it
+        as soon as it is finished instead, and self.scanResult holds the sink's result
+        with one row per scan value."""
         mdl = self.rr.model
         if self.value is None:
             self.value = mdl.getFloatingSpeciesIds()[0]
@@ -112,29 +130,29 @@ class ParameterScan (object):
                 if not isinstance(item, str) or (item not in mdl.getFloatingSpeciesIds() and item not in mdl.getBoundarySpeciesIds()):
                     if item.lower() != 'time':
                         raise ValueError('{0} cannot be found in loaded model'.format(item))
-        self.selection = ['time'] + self.selection            
-        polyNumber = float(self.polyNumber)
-        mdl[self.value] = self.startValue
-        m = self.rr.simulate(self.startTime, self.endTime, self.numberOfPoints,
-                             self.selection, integrator = self.integrator)
-        interval = ((self.endValue - self.startValue) / (polyNumber - 1))
-        start = self.startValue
-        while start < self.endValue - .00001:
-            self.rr.reset()
-            start += interval
-            mdl[self.value] = start
-            m1 = self.rr.simulate(self.startTime, self.endTime, self.numberOfPoints,
-                                  self.selection, integrator = self.integrator)
-            m1 = np.delete(m1, 0, 1)
-            m = np.hstack((m, m1))
+        self.selection = ['time'] + self.selection
+        scanValues = np.linspace(self.startValue, self.endValue, self.polyNumber)
+        if self.output is None:
+            self.scanResult = np.empty((self.numberOfPoints, self.polyNumber, len(self.selection)))
+            out = self.scanResult.swapaxes(0, 1)
+        else:
+            out = self.output.open(self.polyNumber)
+        simulateMany(self.rr, [[(self.value, value)] for value in scanValues],
+                     self.startTime, self.endTime, self.numberOfPoints, self.selection,
+                     integrator = self.integrator, workers = self.workers, out = out,
+                     cache = self.cache, preEquilibration = self.preEquilibration)
+        if self.output is not None:
+            self.scanResult = self.output.close()
 
-        return m
+        return self.scanResult
 
     def plotGraduatedArray(self):
         """Plots array with either default multiple colors or user sepcified colors using
         results from graduatedSim().
 
         p.plotGraduatedArray()"""
+        if self.output is not None:
+            raise ValueError('plotGraduatedArray needs full trajectories, set self.output to None')
         result = self.graduatedSim()
         interval = ((self.endValue - self.startValue) / (self.polyNumber - 1))
         numSp = len(self.selection) - 1
@@ -146,7 +164,7 @@ class ParameterScan (object):
                         lbl = "{0}, {1} = {2}".format(species, self.value, round((self.startValue + (interval * i)), 2))
                     else:
                         lbl = "{0} = {1}".format(self.value, round((self.startValue + (interval * i)), 2))
-                    plt.plot(result[:,0], result[:,numSp*i+count], linewidth = self.width, color = 'b', label = lbl)
+                    plt.plot(result[:,i,0], result[:,i,count], linewidth = self.width, color = 'b', label = lbl)
                 count += 1
                     
         elif self.color is None:
@@ -157,7 +175,7 @@ class ParameterScan (object):
                         lbl = "{0}, {1} = {2}".format(species, self.value, round((self.startValue + (interval * i)), 2))
                     else:
                         lbl = "{0} = {1}".format(self.value, round((self.startValue + (interval * i)), 2))
-                    plt.plot(result[:,0], result[:,numSp*i+count], linewidth = self.width, label = lbl)
+                    plt.plot(result[:,i,0], result[:,i,count], linewidth = self.width, label = lbl)
                 count += 1
                     
         else:
@@ -170,7 +188,7 @@ class ParameterScan (object):
                         lbl = "{0}, {1} = {2}".format(species, self.value, round((self.startValue + (interval * i)), 2))
                     else:
                         lbl = "{0} = {1}".format(self.value, round((self.startValue + (interval * i)), 2))
-                    plt.plot(result[:,0], result[:,numSp*i+count], color = self.color[i],
+                    plt.plot(result[:,i,0], result[:,i,count], color = self.color[i],
                                  linewidth = self.width, label = lbl)
                 count += 1
                          
@@ -193,34 +211,29 @@ class ParameterScan (object):
         from graduatedSim().
 
         p.plotPolyArray()"""
+        if self.output is not None:
+            raise ValueError('plotPolyArray needs full trajectories, set self.output to None')
         result = self.graduatedSim()
         interval = ((self.endValue - self.startValue) / (self.polyNumber - 1))
         self.rr.reset()
+        from mpl_toolkits.mplot3d import Axes3D
         fig = plt.figure()
         ax = fig.gca(projection='3d')
         if self.startValue is None:
             self.startValue = self.rr.model[self.value]
         columnNumber = self.polyNumber + 1
-        lastPoint = [self.endTime]
-        firstPoint = [self.startTime]
-        for i in range(int(columnNumber) - 1):
-            lastPoint.append(0)
-            firstPoint.append(0)
-        lastPoint = np.array(lastPoint)
-        firstPoint = np.array(firstPoint)
-        zresult = np.vstack((result, lastPoint))
-        zresult = np.vstack((firstPoint, zresult))
+        time = np.concatenate(([self.startTime], result[:,0,0], [self.endTime]))
         zs = []
-        result = []
-        for i in range(int(columnNumber)-1):
+        verts = []
+        for i in range(self.polyNumber):
             zs.append(i)
-            result.append(zip(zresult[:,0], zresult[:,(i+1)]))   
+            verts.append(np.column_stack((time, np.concatenate(([0], result[:,i,1], [0])))))
         if self.color is None:
-            poly = PolyCollection(result)
+            poly = PolyCollection(verts)
         else:
             if len(self.color) != self.polyNumber:
                 self.color = self.colorCycle()
-            poly = PolyCollection(result, facecolors = self.color, closed = False)
+            poly = PolyCollection(verts, facecolors = self.color, closed = False)
 
         poly.set_alpha(self.alpha)
         ax.add_collection3d(poly, zs=zs, zdir='y')
@@ -246,6 +259,51 @@ class ParameterScan (object):
             ax.set_title(self.title)
         plt.show()
 
+    def surfaceSim(self):
+        """Runs the simulations for plotSurface and returns the grids X (time), Y (values of
+        self.independent[1]) and Z (self.dependent), each of shape
+        (numberOfPoints, numberOfPoints), without opening a figure.
+
+        The model state is saved once after a reset and put back before every run,
+        instead of resetting the model each time.
+
+        X, Y, Z = p.surfaceSim()"""
+        if self.independent is None:
+            self.independent = ['Time']
+            defaultParameter = self.rr.model.getGlobalParameterIds()[0]
+            self.independent.append(defaultParameter)
+            print 'Warning: self.independent not set. Using: {0}'.format(self.independent)
+        if self.dependent is None:
+            defaultSpecies = self.rr.model.getFloatingSpeciesIds()[0]
+            self.dependent = defaultSpecies
+            print 'Warning: self.dependent not set. Using: {0}'.format(self.dependent)
+            
+        if len(self.independent) < 2:
+            raise ValueError('self.independent must contain two independent variables')
+        
+        if not isinstance(self.independent, list):
+            raise ValueError('self.independent must be a list of strings')
+        if not isinstance(self.dependent, str):
+            raise ValueError('self.dependent must be a string')
+        if self.startValue is None:
+            if self.independent[0].lower() != 'time':
+                self.startValue = self.rr.model[self.independent[0]]
+            else:
+                self.startValue = self.rr.model[self.independent[1]]
+        if self.endValue is None:
+            self.endValue = self.startValue + 5
+
+        X = np.linspace(self.startTime, self.endTime, self.numberOfPoints)
+        Y = np.linspace(self.startValue, self.endValue, self.numberOfPoints)
+        Z = np.empty((self.numberOfPoints, self.numberOfPoints))
+        simulateMany(self.rr, [[(self.independent[1], value)] for value in Y],
+                     self.startTime, self.endTime, self.numberOfPoints, [self.dependent],
+                     integrator = self.integrator, workers = self.workers,
+                     out = Z[:,:,np.newaxis], cache = self.cache,
+                     preEquilibration = self.preEquilibration)
+        X, Y = np.meshgrid(X, Y)
+        return X, Y, Z
+
     def plotSurface(self):
         """ Plots results of simulation as a colored surface. Takes three variables, two
         independent and one dependent. Legal colormap names can be found at
@@ -253,59 +311,10 @@ class ParameterScan (object):
 
         p.plotSurface()"""
         try:
-#            if self.independent is None and self.dependent is None:
-#                self.independent = ['Time']
-#                defaultParameter = self.rr.model.getGlobalParameterIds()[0]
-#                self.independent.append(defaultParameter)
-#                defaultSpecies = self.rr.model.getFloatingSpeciesIds()[0]
-#                self.dependent = [defaultSpecies]
-#                print 'Warning: self.independent and self.dependent not set. Using' \
-#                ' self.independent = %s and self.dependent = %s' % (self.independent, self.dependent)
-            if self.independent is None:
-                self.independent = ['Time']
-                defaultParameter = self.rr.model.getGlobalParameterIds()[0]
-                self.independent.append(defaultParameter)
-                print 'Warning: self.independent not set. Using: {0}'.format(self.independent)
-            if self.dependent is None:
-                defaultSpecies = self.rr.model.getFloatingSpeciesIds()[0]
-                self.dependent = defaultSpecies
-                print 'Warning: self.dependent not set. Using: {0}'.format(self.dependent)
-                
-            if len(self.independent) < 2:
-                raise ValueError('self.independent must contain two independent variables')
-            
-            if not isinstance(self.independent, list):
-                raise ValueError('self.independent must be a list of strings')
-            if not isinstance(self.dependent, str):
-                raise ValueError('self.dependent must be a string')
-            if self.startValue is None:
-                if self.independent[0].lower() != 'time':
-                    self.startValue = self.rr.model[self.independent[0]]
-                else:
-                    self.startValue = self.rr.model[self.independent[1]]
-            if self.endValue is None:
-                self.endValue = self.startValue + 5
-    
-    
+            X, Y, Z = self.surfaceSim()
+            from mpl_toolkits.mplot3d import Axes3D
             fig = plt.figure()
             ax = fig.gca(projection='3d')
-            interval = (self.endTime - self.startTime) / float(self.numberOfPoints - 1)
-            X = np.arange(self.startTime, (self.endTime + (interval - 0.001)), interval)
-            interval = (self.endValue - self.startValue) / float(self.numberOfPoints - 1)
-            Y = np.arange(self.startValue, (self.endValue + (interval - 0.001)), interval)
-            X, Y = np.meshgrid(X, Y)
-            self.rr.reset()
-            self.rr.model[self.independent[1]] = self.startValue
-            Z = self.rr.simulate(self.startTime, self.endTime, (self.numberOfPoints),
-                                 [self.dependent], integrator = self.integrator)
-            Z = Z.T
-            for i in range(self.numberOfPoints - 1):
-                self.rr.reset()
-                self.rr.model[self.independent[1]] = self.startValue + ((i + 1) * interval)
-                Z1 = self.rr.simulate(self.startTime, self.endTime, (self.numberOfPoints),
-                                     [self.dependent], integrator = self.integrator)
-                Z1 = Z1.T
-                Z = np.concatenate ((Z, Z1))
     
             if self.antialias is False:
                 surf = ax.plot_surface(X, Y, Z, rstride=1, cstride=1, cmap = self.colormap,
@@ -356,24 +365,27 @@ class ParameterScan (object):
         if self.color is None:
             self.color = ['b', 'g', 'r', 'k']
 
+        if self.selection is None:
+            selection = self.rr.timeCourseSelections
+        else:
+            if 'time' not in [item.lower() for item in self.selection]:
+                self.selection = ['time'] + self.selection
+            for item in self.selection:
+                if item not in mdl.getFloatingSpeciesIds() and item not in mdl.getBoundarySpeciesIds():
+                    if item.lower() != 'time':
+                        raise ValueError('"{0}" is not a valid species in loaded model'.format(item))
+            selection = self.selection
+        scan = GridScan(self.rr, [(param1, param1Range), (param2, param2Range)], selection,
+                        self.startTime, self.endTime, self.numberOfPoints,
+                        integrator = self.integrator, workers = self.workers, cache = self.cache,
+                        preEquilibration = self.preEquilibration)
+        results = scan.run()
+
         for i, k1 in enumerate(param1Range):
             for j, k2 in enumerate(param2Range):
-                self.rr.reset()
-                mdl[param1], mdl[param2] = k1, k2
-                if self.selection is None:
-                    result = self.rr.simulate(self.startTime, self.endTime, self.numberOfPoints,
-                                                integrator = self.integrator) 
-                else:
-                    if 'time' not in [item.lower() for item in self.selection]:
-                        self.selection = ['time'] + self.selection                    
-                    for item in self.selection:
-                        if item not in mdl.getFloatingSpeciesIds() and item not in mdl.getBoundarySpeciesIds():
-                            if item.lower() != 'time':
-                                raise ValueError('"{0}" is not a valid species in loaded model'.format(item))
-                    result = self.rr.simulate(self.startTime, self.endTime, self.numberOfPoints,
-                                                  self.selection, integrator = self.integrator)
+                result = results[i, j]
                 columns = result.shape[1]
-                legendItems = self.rr.timeCourseSelections[1:]
+                legendItems = selection[1:]
                 if columns-1 != len(legendItems):
                     raise Exception('Legend list must match result array')
                 for c in range(columns-1):
@@ -445,7 +457,7 @@ class ParameterScan (object):
         count = 0
         if isinstance(self.colormap, str) is True:
             for i in range(self.polyNumber):
-                color.append(eval('matplotlib.pylab.cm.%s(%s)' % (self.colormap, count)))
+                color.append(eval('matplotlib.cm.%s(%s)' % (self.colormap, count)))
                 count += interval
         else:
             for i in range(self.polyNumber):
@@ -480,31 +492,67 @@ class SteadyStateScan (object):
         self.colorbar = True
         self.antialias = True
         self.sameColor = False
+        self.continuation = False
+        self.preEquilibration = None
 
     def steadyStateSim(self):
+        """Solves for the steady state at numberOfPoints values of self.value between
+        startValue and endValue, and returns an array with the scanned value in the first
+        column followed by one column for each item in self.selection. Not intended to be
+        called by user.
+
+        If self.continuation is True, each solve starts from the previous steady state
+        instead of the reset model. The model is only reset when the solver fails.
+        With a PreEquilibration in self.preEquilibration, solves start from the
+        equilibrated state instead of the reset model."""
         if self.value is None:
             self.value = self.rr.model.getFloatingSpeciesIds()[0]
             print 'Warning: self.value not set. Using self.value = %s' % self.value
+        if self.selection is None:
+            self.selection = self.rr.model.getFloatingSpeciesIds()
+        elif not isinstance(self.selection, list):
+            self.selection = [self.selection]
         if self.startValue is None:
             self.startValue = self.rr.model[self.value]
         if self.endValue is None:
             self.endValue = self.startValue + 5
-        interval = (float(self.endValue - self.startValue) / float(self.numberOfPoints - 1))
-        a = []
-        for i in range(len(self.selection) + 1):
-            a.append(0.)
-        result = np.array(a)
-        start = self.startValue
-        for i in range(self.numberOfPoints):
+        scanValues = np.linspace(self.startValue, self.endValue, self.numberOfPoints)
+        result = np.empty((self.numberOfPoints, len(self.selection) + 1))
+        result[:,0] = scanValues
+        previousSelections = self.rr.steadyStateSelections
+        self.rr.steadyStateSelections = self.selection
+        try:
             self.rr.reset()
-            start += interval
-            self.rr.model[self.value] = start
-            self.rr.steadyState()
-            b = [self.rr.model[self.value]]
-            for i in range(len(self.selection)):
-                b.append(self.rr.model[self.selection[i]])
-            result = np.vstack((result, b))
-        result = np.delete(result, 0, 0)
+            initial = self.rr.snapshot()
+            if self.preEquilibration is not None:
+                self.preEquilibration.start(self.rr)
+
+            def startFrom(value):
+                assignments = [(self.value, value)]
+                if self.preEquilibration is None:
+                    self.rr.restore(initial)
+                else:
+                    upstream, assignments = self.preEquilibration.split(assignments)
+                    self.rr.restore(self.preEquilibration.state(self.rr, upstream))
+                for key, value in assignments:
+                    self.rr.model[key] = value
+
+            for i, value in enumerate(scanValues):
+                if i == 0 or not self.continuation:
+                    startFrom(value)
+                else:
+                    self.rr.model[self.value] = value
+                try:
+                    self.rr.steadyState()
+                except RuntimeError:
+                    if not self.continuation:
+                        raise
+                    startFrom(value)
+                    self.rr.steadyState()
+                result[i,1:] = self.rr.getSteadyStateValues()
+        finally:
+            # leave the steady state selections of the caller as they were
+            self.rr.steadyStateSelections = previousSelections
         return result
 
     def plotArray(self):
@@ -0,0 +1,156 @@
+import numpy as np
+from _parallel import simulateSamples
+from _output import ArrayOutput, MemmapOutput
+
+# Sobol direction numbers (Joe and Kuo, new-joe-kuo-6.21201) for dimensions 2 to 32,
+# as (degree, polynomial coefficients, initial direction numbers)
+_SOBOL_DIRECTIONS = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+    (6, 19, [1, 1, 1, 15, 7, 5]),
+    (6, 22, [1, 3, 1, 15, 13, 25]),
+    (6, 25, [1, 1, 5, 5, 19, 61]),
+    (7, 1, [1, 3, 7, 11, 23, 15, 103]),
+    (7, 4, [1, 3, 7, 13, 13, 15, 69]),
+    (7, 7, [1, 1, 3, 13, 7, 35, 63]),
+    (7, 8, [1, 3, 5, 9, 1, 25, 53]),
+    (7, 14, [1, 3, 1, 13, 9, 35, 107]),
+    (7, 19, [1, 3, 1, 5, 27, 61, 31]),
+    (7, 21, [1, 1, 5, 11, 19, 41, 61]),
+    (7, 28, [1, 3, 5, 3, 3, 13, 69]),
+    (7, 31, [1, 1, 7, 13, 1, 19, 1]),
+    (7, 32, [1, 3, 7, 5, 13, 19, 59]),
+    (7, 37, [1, 1, 3, 9, 25, 29, 41]),
+    (7, 41, [1, 3, 5, 13, 23, 1, 55]),
+    (7, 42, [1, 3, 7, 3, 13, 59, 17]),
+]
+
+_SOBOL_BITS = 32
+
+
+def sobolDirections(dimensions):
+    """Returns the (bits x dimensions) array of Sobol direction numbers."""
+    if dimensions > len(_SOBOL_DIRECTIONS) + 1:
+        raise ValueError('Sobol designs are limited to {0} parameters'.format(len(_SOBOL_DIRECTIONS) + 1))
+    bits = _SOBOL_BITS
+    directions = np.zeros((bits, dimensions), dtype=np.uint64)
+    directions[:, 0] = [1 << (bits - 1 - i) for i in range(bits)]
+    for j in range(1, dimensions):
+        s, a, m = _SOBOL_DIRECTIONS[j - 1]
+        v = [0] * bits
+        for i in range(s):
+            v[i] = m[i] << (bits - 1 - i)
+        for i in range(s, bits):
+            v[i] = v[i - s] ^ (v[i - s] >> s)
+            for k in range(1, s):
+                v[i] ^= ((a >> (s - 1 - k)) & 1) * v[i - k]
+        directions[:, j] = v
+    return directions
+
+
+def sobolPoints(directions, start, stop):
+    """Returns points start to stop of the Sobol sequence in the unit cube, using the
+    Gray code construction for all points at once."""
+    n = np.arange(start, stop, dtype=np.uint64)
+    gray = n ^ (n >> np.uint64(1))
+    x = np.zeros((len(n), directions.shape[1]), dtype=np.uint64)
+    for b in range(directions.shape[0]):
+        x ^= ((gray >> np.uint64(b)) & np.uint64(1))[:, None] * directions[b]
+    return x / float(2 ** _SOBOL_BITS)
+
+
+class SamplingScan (object):
+    """Runs a time course simulation for each sample of a space-filling design over
+    several parameters. method is either 'lhs' for a Latin hypercube or 'sobol' for the
+    first size points of a Sobol sequence (up to 32 parameters).
+
+    parameterRanges is either a list of (id, (low, high)) pairs or a dictionary, in
+    which case the ids are used in sorted order. The samples are generated and
+    simulated batchSize rows at a time, and each batch is written to the result before
+    the next one is started. If a filename is given, the result is a .npy file on disk
+    of shape (size, numberOfPoints, len(selections)), so only one batch is held in
+    memory. The first selection is always time. Any other scan output sink, for
+    example one that reduces each trajectory to its final values, can be passed as
+    output.
+
+    s = SamplingScan(rr, {'k1': (0.1, 1), 'k2': (0, 5)}, ['S1'], 10000, method='sobol')
+    result = s.run()
+    """
+    def __init__(self, rr, parameterRanges, selections, size, method='lhs',
+                 startTime=0, endTime=20, numberOfPoints=50, integrator='cvode',
+                 seed=None, batchSize=1000, workers=None, filename=None, output=None):
+        if method not in ('lhs', 'sobol'):
+            raise ValueError('method must be "lhs" or "sobol"')
+        self.rr = rr
+        if isinstance(parameterRanges, dict):
+            parameterRanges = sorted(parameterRanges.items())
+        self.parameters = [param for param, bounds in parameterRanges]
+        bounds = np.array([bounds for param, bounds in parameterRanges], dtype=float)
+        self.lower = bounds[:, 0]
+        self.upper = bounds[:, 1]
+        if not isinstance(selections, list):
+            selections = [selections]
+        if 'time' not in [item.lower() for item in selections]:
+            selections = ['time'] + selections
+        self.selections = selections
+        self.size = size
+        self.method = method
+        self.startTime = startTime
+        self.endTime = endTime
+        self.numberOfPoints = numberOfPoints
+        self.integrator = integrator
+        self.seed = np.random.randint(2 ** 31 - 1) if seed is None else seed
+        self.batchSize = batchSize
+        self.workers = workers
+        self.filename = filename
+        self.output = output
+        self.result = None
+
+        if method == 'sobol':
+            self._directions = sobolDirections(len(self.parameters))
+        else:
+            rng = np.random.RandomState(self.seed)
+            self._strata = np.empty((len(self.parameters), size), dtype=np.int32)
+            for d in range(len(self.parameters)):
+                self._strata[d] = rng.permutation(size)
+
+    def getDesign(self, start, stop):
+        """Returns rows start to stop of the design, scaled to the parameter ranges."""
+        if self.method == 'sobol':
+            unit = sobolPoints(self._directions, start, stop)
+        else:
+            jitter = np.random.RandomState([self.seed, start]).random_sample((stop - start, len(self.parameters)))
+            unit = (self._strata[:, start:stop].T + jitter) / float(self.size)
+        return self.lower + unit * (self.upper - self.lower)
+
+    def run(self):
+        """Simulates every sample of the design, batchSize at a time, and returns the result."""
+        if self.output is not None:
+            output = self.output
+        elif self.filename is not None:
+            output = MemmapOutput(self.filename)
+        else:
+            output = ArrayOutput()
+        output.open(self.size)
+        for start in range(0, self.size, self.batchSize):
+            stop = min(self.size, start + self.batchSize)
+            simulateSamples(self.rr, self.parameters, self.getDesign(start, stop), self.startTime,
+                            self.endTime, self.numberOfPoints, self.selections,
+                            integrator=self.integrator, workers=self.workers,
+                            out=output, offset=start)
+            output.flush()
+        self.result = output.close()
+        return self.result
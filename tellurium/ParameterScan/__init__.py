@@ -1,2 +1,5 @@
 from ParameterScan import ParameterScan
 from ParameterScan import SteadyStateScan
+from GridScan import GridScan
+from SamplingScan import SamplingScan
+from _output import ScanOutput, ArrayOutput, MemmapOutput, NpyAppendOutput, HDF5Output
@@ -0,0 +1,189 @@
+"""
+Output sinks for scan engines. A sink receives each simulation result as soon as it
+is finished, optionally reduces it, and stores it in memory, in a .npy file or in an
+HDF5 file. Scan engines write to a sink by index, sink[i] = trajectory or
+sink[start:stop] = trajectories, with trajectories of shape (numberOfPoints,
+len(selections)) whose first column is time.
+
+Reductions replace a trajectory by one value per selection, leaving out time:
+'final' (value at the end time), 'min', 'max' and 'auc' (area under the curve).
+A function that maps an array of trajectories (n, numberOfPoints, len(selections))
+to an array with n rows can be given instead.
+"""
+import os
+import numpy as np
+
+
+def reduceTrajectories(trajectories, reduction):
+    """Applies reduction to an array of trajectories of shape
+    (n, numberOfPoints, len(selections)) and returns an array with n rows."""
+    if reduction is None:
+        return trajectories
+    if callable(reduction):
+        return np.asarray(reduction(trajectories))
+    values = trajectories[:, :, 1:]
+    if reduction == 'final':
+        return values[:, -1]
+    elif reduction == 'min':
+        return values.min(axis=1)
+    elif reduction == 'max':
+        return values.max(axis=1)
+    elif reduction == 'auc':
+        dt = np.diff(trajectories[:, :, 0], axis=1)[:, :, np.newaxis]
+        return (dt * (values[:, 1:] + values[:, :-1])).sum(axis=1) / 2.
+    raise ValueError('Unknown reduction "{0}"'.format(reduction))
+
+
+class ScanOutput (object):
+    """Base class for scan output sinks. Subclasses create the storage for count rows
+    of a given shape in _create and write blocks of rows in _write. A sink can be
+    used in a with statement, which closes it at the end."""
+    def __init__(self, reduction=None):
+        if not (reduction is None or callable(reduction) or
+                reduction in ('final', 'min', 'max', 'auc')):
+            raise ValueError('Unknown reduction "{0}"'.format(reduction))
+        self.reduction = reduction
+        self.count = None
+        self.rowShape = None
+        self.result = None
+
+    def open(self, count):
+        """Prepares the sink for count simulation results. The storage itself is created
+        when the first result arrives and its reduced shape is known."""
+        self.count = count
+        self.rowShape = None
+        self.result = None
+        return self
+
+    def __setitem__(self, index, trajectories):
+        if isinstance(index, slice):
+            start = 0 if index.start is None else index.start
+            block = reduceTrajectories(np.asarray(trajectories), self.reduction)
+        else:
+            start = index
+            block = reduceTrajectories(np.asarray(trajectories)[np.newaxis], self.reduction)
+        if self.rowShape is None:
+            self.rowShape = block.shape[1:]
+            self._create(self.rowShape)
+        self._write(start, block)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Flushes the sink and returns the stored results."""
+        self.flush()
+        return self.result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _create(self, rowShape):
+        raise NotImplementedError
+
+    def _write(self, start, block):
+        self.result[start:start + len(block)] = block
+
+
+class ArrayOutput (ScanOutput):
+    """Keeps the results in an in-memory NumPy array."""
+    def _create(self, rowShape):
+        self.result = np.empty((self.count,) + rowShape)
+
+
+class MemmapOutput (ScanOutput):
+    """Keeps the results in a .npy file that is memory mapped, so that only the pages
+    being written are held in memory. With resume=True an existing file of the right
+    shape is opened and written into instead of being replaced."""
+    def __init__(self, filename, reduction=None, resume=False):
+        ScanOutput.__init__(self, reduction)
+        self.filename = filename
+        self.resume = resume
+
+    def open(self, count):
+        ScanOutput.open(self, count)
+        if self.resume and os.path.exists(self.filename):
+            self.result = np.lib.format.open_memmap(self.filename, mode='r+')
+            if len(self.result) != count:
+                raise ValueError('"{0}" holds a scan of a different size'.format(self.filename))
+            self.rowShape = self.result.shape[1:]
+        return self
+
+    def _create(self, rowShape):
+        self.result = np.lib.format.open_memmap(self.filename, mode='w+', dtype=float,
+                                                shape=(self.count,) + rowShape)
+
+    def flush(self):
+        if self.result is not None:
+            self.result.flush()
+
+
+class NpyAppendOutput (ScanOutput):
+    """Appends the results to a .npy file through an ordinary file handle, without
+    memory mapping it. Results must arrive in order."""
+    def __init__(self, filename, reduction=None):
+        ScanOutput.__init__(self, reduction)
+        self.filename = filename
+        self._file = None
+        self._next = 0
+
+    def _create(self, rowShape):
+        self._file = open(self.filename, 'wb')
+        header = {'descr': np.lib.format.dtype_to_descr(np.dtype(float)),
+                  'fortran_order': False, 'shape': (self.count,) + rowShape}
+        np.lib.format.write_array_header_1_0(self._file, header)
+        self._next = 0
+
+    def _write(self, start, block):
+        if start != self._next:
+            raise ValueError('NpyAppendOutput can only append results in order')
+        self._file.write(np.ascontiguousarray(block, dtype=float).tostring())
+        self._next += len(block)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self.result = np.load(self.filename, mmap_mode='r')
+        return self.result
+
+
+class HDF5Output (ScanOutput):
+    """Writes the results to a dataset of an HDF5 file. Requires h5py. The file stays
+    open until close(), which returns the results memory mapped from the closed file."""
+    def __init__(self, filename, dataset='scan', reduction=None):
+        ScanOutput.__init__(self, reduction)
+        self.filename = filename
+        self.dataset = dataset
+        self._file = None
+
+    def _create(self, rowShape):
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError('HDF5Output requires the h5py package')
+        self._file = h5py.File(self.filename, 'a')
+        if self.dataset in self._file:
+            del self._file[self.dataset]
+        self.result = self._file.create_dataset(self.dataset, (self.count,) + rowShape, dtype=float)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            dataset = self.result
+            offset = dataset.id.get_offset()
+            dtype, shape = dataset.dtype, dataset.shape
+            # read the data if it is not stored in one piece, or nothing was written yet
+            data = dataset[...] if offset is None else None
+            self._file.close()
+            self._file = None
+            if data is None:
+                data = np.memmap(self.filename, dtype=dtype, mode='r', offset=offset, shape=shape)
+            self.result = data
+        return self.result
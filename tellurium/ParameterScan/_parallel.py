@@ -0,0 +1,220 @@
+"""
+Runs batches of independent simulations of one model, either serially on the
+caller's RoadRunner instance or spread across a pool of worker processes.
+
+Each worker builds its own RoadRunner from the model SBML once, when the pool
+starts, with the same integrator settings as the caller's instance, and then only
+receives the values to change for every simulation. Every simulation starts from
+the same saved model state, so results do not depend on which simulations ran
+before them in the same process.
+"""
+import multiprocessing
+import numpy as np
+from tellurium.tellurium import ValueHandle, ModelSnapshot, _integratorSettings, _applyIntegratorSettings
+
+# RoadRunner instance owned by a worker process, its initial state and the value
+# handles it uses, see _assign
+_workerRR = None
+_workerState = None
+_workerHandles = None
+
+
+def _initWorker(sbml, integratorSettings=None):
+    global _workerRR, _workerState, _workerHandles
+    import roadrunner
+    _workerRR = roadrunner.RoadRunner(sbml)
+    if integratorSettings is not None:
+        _applyIntegratorSettings(_workerRR, *integratorSettings)
+    _workerState = ModelSnapshot(_workerRR)
+    _workerHandles = {}
+
+
+def _selectIntegrator(rr, integrator):
+    """Makes integrator the current integrator of rr, with the settings it already has
+    there, and returns the name of the one it replaces. simulate() has no integrator
+    argument, so this is done once for a whole batch of simulations."""
+    previous = rr.integrator.getName()
+    if integrator != previous:
+        rr.setIntegrator(integrator)
+    return previous
+
+
+def _assign(rr, handles, assignments):
+    """Sets the (id, value) pairs assignments on rr with a ValueHandle, one for each
+    distinct list of ids, which is kept in the dictionary handles for later runs."""
+    if not assignments:
+        return
+    ids = tuple(key for key, value in assignments)
+    handle = handles.get(ids)
+    if handle is None:
+        handle = handles[ids] = ValueHandle(rr, ids)
+    handle.set([value for key, value in assignments])
+
+
+def _simulate(rr, state, handles, assignments, startTime, endTime, numberOfPoints, selection):
+    state.restore(rr)
+    _assign(rr, handles, assignments)
+    return rr.simulate(startTime, endTime, numberOfPoints, selection)
+
+
+def _simulateTask(task):
+    state, task = task[0], task[1:]
+    return np.array(_simulate(_workerRR, _workerState if state is None else state, _workerHandles,
+                              *task))
+
+
+def _initialState(rr):
+    rr.reset()
+    return ModelSnapshot(rr)
+
+
+def _startingState(rr, state, preEquilibration, assignment):
+    """Returns the state a simulation with assignment starts from and the
+    assignments still to apply to it."""
+    if preEquilibration is None:
+        return state, assignment
+    upstream, others = preEquilibration.split(assignment)
+    return preEquilibration.state(rr, upstream), others
+
+
+def _simulatePending(rr, state, preEquilibration, assignments, *args):
+    """Yields the results of simulating each of assignments in turn."""
+    handles = {}
+    for assignment in assignments:
+        start, assignment = _startingState(rr, state, preEquilibration, assignment)
+        yield np.array(_simulate(rr, start, handles, assignment, *args))
+
+
+def _simulateSamples(rr, state, handle, samples, startTime, endTime, numberOfPoints, selection,
+                     out, offset=0):
+    for i, sample in enumerate(samples):
+        state.restore(rr)
+        handle.set(sample)
+        out[offset + i] = rr.simulate(startTime, endTime, numberOfPoints, selection)
+    return out
+
+
+def _simulateSamplesTask(task):
+    ids, samples, startTime, endTime, numberOfPoints, selection = task
+    out = np.empty((len(samples), numberOfPoints, len(selection)))
+    return _simulateSamples(_workerRR, _workerState, ValueHandle(_workerRR, ids), samples,
+                            startTime, endTime, numberOfPoints, selection, out)
+
+
+def simulateMany(rr, assignments, startTime, endTime, numberOfPoints, selection,
+                 integrator='cvode', workers=None, out=None, offset=0, cache=None,
+                 preEquilibration=None):
+    """Runs one simulation for each entry of assignments, a list of (id, value) pair
+    lists that are applied to the reset model. Results are returned in order as an array of
+    shape (len(assignments), numberOfPoints, len(selection)), or written into out
+    starting at row offset as soon as each one is finished. out can be an array or a
+    scan output sink.
+
+    If workers is greater than one, the current SBML of rr is sent once to a pool of
+    that many processes and the simulations are shared among them. If a
+    SimulationCache is given, results found in it are not simulated again and new
+    results are added to it.
+
+    With a PreEquilibration, each simulation starts from the equilibrated state for
+    the values of its upstream ids instead of the reset model. Each of these states
+    is only computed once, and the other assignments are applied to it."""
+    if out is None:
+        out = np.empty((len(assignments), numberOfPoints, len(selection)))
+    cached = {}
+    if cache is not None:
+        modelKey = cache.modelKey(rr)
+        if preEquilibration is not None:
+            modelKey = (modelKey, preEquilibration.key())
+        settings = _integratorSettings(rr, integrator)
+        keys = [cache.key(modelKey, sorted(assignment), startTime, endTime, numberOfPoints,
+                          selection, settings) for assignment in assignments]
+        for i, key in enumerate(keys):
+            result = cache.get(key)
+            if result is not None:
+                cached[i] = result
+    pending = [i for i in range(len(assignments)) if i not in cached]
+
+    previousIntegrator = _selectIntegrator(rr, integrator)
+    state = _initialState(rr)
+    pool = None
+    if pending and preEquilibration is not None:
+        preEquilibration.start(rr)
+    if not pending:
+        simulated = iter([])
+    elif workers is None or workers <= 1:
+        simulated = _simulatePending(rr, state, preEquilibration, [assignments[i] for i in pending],
+                                     startTime, endTime, numberOfPoints, selection)
+    else:
+        tasks = []
+        for i in pending:
+            start, assignment = None, assignments[i]
+            if preEquilibration is not None:
+                # equilibrated states are sent along with the tasks that start from them
+                start, assignment = _startingState(rr, state, preEquilibration, assignment)
+            tasks.append((start, assignment, startTime, endTime, numberOfPoints, selection))
+        chunkSize = max(1, len(tasks) // (4 * workers))
+        # getCurrentSBML writes out current values, so start the workers from the reset state
+        state.restore(rr)
+        rr.reset()
+        pool = multiprocessing.Pool(workers, _initWorker,
+                                    (rr.getCurrentSBML(), _integratorSettings(rr, integrator)))
+        simulated = pool.imap(_simulateTask, tasks, chunkSize)
+    try:
+        # rows are written in order, so that sinks which only append can take them
+        for i in range(len(assignments)):
+            if i in cached:
+                out[offset + i] = cached[i]
+                continue
+            result = next(simulated)
+            out[offset + i] = result
+            if cache is not None:
+                cache.put(keys[i], result)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        # leave the values of the model as they were before the first simulation
+        state.restore(rr)
+        rr.setIntegrator(previousIntegrator)
+    return out
+
+
+def simulateSamples(rr, ids, samples, startTime, endTime, numberOfPoints, selection,
+                    integrator='cvode', workers=None, out=None, offset=0):
+    """Runs one simulation for each row of samples, a 2D array whose columns hold the
+    values of ids. The values of a row are applied to the reset model with a ValueHandle.
+    Results are returned in order as an array of shape
+    (len(samples), numberOfPoints, len(selection)), or written into out starting at
+    row offset, as in simulateMany.
+
+    With more than one worker, the rows are split into blocks that are simulated in a
+    pool of processes started from the current SBML of rr."""
+    samples = np.asarray(samples, dtype=float)
+    if out is None:
+        out = np.empty((len(samples), numberOfPoints, len(selection)))
+    if workers is None or workers <= 1:
+        previousIntegrator = _selectIntegrator(rr, integrator)
+        state = _initialState(rr)
+        try:
+            _simulateSamples(rr, state, ValueHandle(rr, ids), samples, startTime,
+                             endTime, numberOfPoints, selection, out, offset)
+        finally:
+            state.restore(rr)
+            rr.setIntegrator(previousIntegrator)
+        return out
+
+    blockSize = max(1, len(samples) // (4 * workers))
+    blocks = range(0, len(samples), blockSize)
+    tasks = [(ids, samples[i:i + blockSize], startTime, endTime, numberOfPoints, selection)
+             for i in blocks]
+    rr.reset()
+    pool = multiprocessing.Pool(workers, _initWorker,
+                                (rr.getCurrentSBML(), _integratorSettings(rr, integrator)))
+    try:
+        for i, result in enumerate(pool.imap(_simulateSamplesTask, tasks)):
+            start = offset + blocks[i]
+            out[start:start + len(result)] = result
+    finally:
+        pool.terminate()
+        pool.join()
+    return out
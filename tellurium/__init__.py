@@ -1,8 +1,15 @@
 from tellurium import *
-import ParameterScan
-import Export
-import analysis
-import notebooktools
-import optimization
-import visualization
-import widgets
\ No newline at end of file
+from cache import SimulationCache
+from tellurium import _selectHeadlessBackend
+from _lazy import LazyModule
+
+# Subpackages are imported on first use, so that scripts which only simulate do not
+# load matplotlib, IPython and the other dependencies of plotting and notebook support.
+# Those that plot select a headless backend first, as tellurium.plt does.
+ParameterScan = LazyModule('tellurium.ParameterScan', _selectHeadlessBackend)
+Export = LazyModule('tellurium.Export')
+analysis = LazyModule('tellurium.analysis', _selectHeadlessBackend)
+notebooktools = LazyModule('tellurium.notebooktools')
+optimization = LazyModule('tellurium.optimization')
+visualization = LazyModule('tellurium.visualization', _selectHeadlessBackend)
+widgets = LazyModule('tellurium.widgets')
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""
+Conversion between Antimony and SBML. The antimony module keeps every model it
+loads in one global table, so all conversions go through here: they hold a lock
+while they use antimony, always clear its table afterwards, and remember the most
+recent results so that converting the same text again does not load it again.
+"""
+import threading
+from collections import OrderedDict
+import antimony
+
+_lock = threading.RLock()
+_cache = OrderedDict()
+_cacheSize = 100
+
+
+def setConversionCacheSize(size):
+    """Sets how many conversion results are remembered, 0 switches the cache off."""
+    global _cacheSize
+    with _lock:
+        _cacheSize = size
+        _trim()
+
+
+def clearConversionCache():
+    with _lock:
+        _cache.clear()
+
+
+def _trim():
+    while len(_cache) > max(_cacheSize, 0):
+        _cache.popitem(last=False)
+
+
+def _load(load, text, get, message='Antimony: '):
+    """Loads text with the antimony function load and returns get(), with the
+    antimony module table cleared afterwards. Must be called with the lock held."""
+    try:
+        if load(text) < 0:
+            raise Exception(message + antimony.getLastError())
+        return get()
+    finally:
+        antimony.clearPreviousLoads()
+
+
+def _convert(kind, text, load, get):
+    key = (kind, text)
+    with _lock:
+        if key in _cache:
+            result = _cache.pop(key)
+        else:
+            result = _load(load, text, get)
+        if _cacheSize > 0:
+            _cache[key] = result
+            _trim()
+        return result
+
+
+def antimonyToSBML(antStr, module='main'):
+    """Returns the SBML of the main module of antStr, or of the last one if module
+    is 'last'."""
+    if module == 'main':
+        get = lambda: antimony.getSBMLString(antimony.getMainModuleName())
+    else:
+        get = lambda: antimony.getSBMLString(antimony.getModuleNames()[-1])
+    return _convert(('sbml', module), antStr, antimony.loadAntimonyString, get)
+
+
+def sbmlToAntimony(sbml):
+    """Returns the Antimony script of an SBML string."""
+    return _convert('antimony', sbml, antimony.loadSBMLString,
+                    lambda: antimony.getAntimonyString(None))
+
+
+def loadCellML(cellML, get, message):
+    """Loads a CellML file or string and returns get(), for example
+    antimony.getAntimonyString(None). Results are not remembered."""
+    with _lock:
+        return _load(antimony.loadCellMLFile, cellML, get, message)
@@ -0,0 +1,40 @@
+"""
+Lazy loading of modules. A LazyModule stands in for a module and imports it the
+first time one of its attributes is used, so that importing tellurium does not
+pay for plotting, SED-ML or notebook support that a script never uses.
+"""
+import types
+import importlib
+
+
+class LazyModule (types.ModuleType):
+    """Placeholder for the module name, which is imported on first attribute access.
+    Import errors, for example of optional dependencies, are raised at that point.
+    If given, beforeImport is called without arguments just before the import."""
+    def __init__(self, name, beforeImport=None):
+        types.ModuleType.__init__(self, name)
+        self.__dict__['_lazyModule'] = None
+        self.__dict__['_beforeImport'] = beforeImport
+
+    def _load(self):
+        module = self.__dict__['_lazyModule']
+        if module is None:
+            if self.__dict__['_beforeImport'] is not None:
+                self.__dict__['_beforeImport']()
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_lazyModule'] = module
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        if self.__dict__['_lazyModule'] is None:
+            return "<lazy module '{0}' (not loaded)>".format(self.__name__)
+        return repr(self.__dict__['_lazyModule'])
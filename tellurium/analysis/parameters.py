@@ -1,17 +1,18 @@
 def plot2DParameterScan(
     r, param1, param1Range, param2, param2Range, start=0, end=100, steps=100
 ):
-    import matplotlib.pyplot as p
+    from tellurium.tellurium import plt as p
     f, axarr = p.subplots(
         len(param1Range),
         len(param2Range),
         sharex='col',
         sharey='row')
 
+    handle = r.getValueHandle([param1, param2])
     for i, k1 in enumerate(param1Range):
         for j, k2 in enumerate(param2Range):
             r.reset()
-            r[param1], r[param2] = k1, k2
+            handle.set([k1, k2])
             result = r.simulate(start, end, steps)
             columns = result.shape[1]
             legendItems = r.selections[1:]
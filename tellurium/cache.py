@@ -0,0 +1,213 @@
+"""
+Memoization of simulation results. A SimulationCache keeps the most recently used
+results in memory and, if a directory is given, also on disk, so that identical
+simulations are only run once, also across sessions.
+
+Results are keyed by a hash of the reset model, taken from getCurrentSBML(), the
+values changed before simulating, the time course selections, the integrator and
+its settings and the simulation arguments. Functions in keys are described by
+their code, defaults, closures and the global data they use. Results are only
+valid as long as simulations are deterministic, so do not cache stochastic
+simulations.
+
+    cache = SimulationCache(maxSize=500, directory='simcache')
+    result = cache.simulate(r, {'k1': 0.5}, 0, 100, 200)
+    print cache.hits, cache.misses
+"""
+import os
+import types
+import hashlib
+import cPickle
+import functools
+from collections import OrderedDict
+import numpy as np
+from tellurium import _integratorSettings
+
+
+def _canonical(value, active=()):
+    """Returns a representation of value whose repr() is the same for equal keys.
+    active holds the functions and objects being described, to stop at cycles."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _canonical(v, active)) for k, v in value.items()))
+    if isinstance(value, np.ndarray):
+        return ('array', value.dtype.str, value.shape, np.ascontiguousarray(value).tostring())
+    if isinstance(value, (list, tuple)):
+        return tuple(_canonical(v, active) for v in value)
+    if isinstance(value, (float, np.floating)):
+        return float(value)
+    if isinstance(value, (int, long, np.integer)):
+        return int(value)
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, types.CodeType):
+        return ('code', value.co_code, _canonical(value.co_consts, active), value.co_names)
+    if callable(value) or hasattr(value, '__dict__'):
+        if any(value is item for item in active):
+            return ('cycle', getattr(value, '__name__', type(value).__name__))
+        return _objectKey(value, active + (value,))
+    return value
+
+
+def _objectKey(value, active):
+    """Returns what calling the function value or using the object value depends on,
+    as far as it can be seen: the code, defaults and closure of a function and the
+    data in the module globals it uses, or the attributes of an object. State
+    behind objects that are not plain Python or numpy data, such as a RoadRunner
+    instance, is not part of it."""
+    if isinstance(value, (type, types.ClassType, types.ModuleType)):
+        return ('name', getattr(value, '__module__', None), value.__name__)
+    if isinstance(value, types.MethodType):
+        return ('method', _canonical(value.im_func, active), _canonical(value.im_self, active))
+    if isinstance(value, functools.partial):
+        return ('partial', _canonical(value.func, active), _canonical(value.args, active),
+                _canonical(value.keywords or {}, active))
+    if isinstance(value, types.FunctionType):
+        code = value.func_code
+        used = dict((name, value.func_globals[name]) for name in code.co_names
+                    if name in value.func_globals
+                    and not isinstance(value.func_globals[name], types.ModuleType))
+        closure = [cell.cell_contents for cell in value.func_closure or ()]
+        return ('function', value.__module__, value.__name__, _canonical(code, active),
+                _canonical(value.func_defaults or (), active), _canonical(closure, active),
+                _canonical(used, active))
+    if hasattr(value, '__dict__'):
+        return ('object', type(value).__module__, type(value).__name__, _canonical(vars(value), active))
+    # builtin functions
+    return ('name', getattr(value, '__module__', None), getattr(value, '__name__', repr(value)))
+
+
+def _modelValues(rr):
+    model = rr.model
+    return np.concatenate([model.getCompartmentVolumes(), model.getBoundarySpeciesConcentrations(),
+                           model.getGlobalParameterValues(), model.getFloatingSpeciesConcentrations()])
+
+
+class SimulationCache (object):
+    """Least recently used cache of simulation results.
+
+    maxSize - number of results kept in memory
+    directory (optional) - directory where results are also saved, one file each
+    maxDiskSize (optional) - number of results kept in directory, by default all
+
+    hits, misses and evictions count the lookups that were found, the lookups that
+    were not, and the results dropped from memory to stay within maxSize.
+    """
+    def __init__(self, maxSize=128, directory=None, maxDiskSize=None):
+        self.maxSize = maxSize
+        self.directory = directory
+        self.maxDiskSize = maxDiskSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def modelKey(self, rr):
+        """Resets rr and returns the hash of its current SBML. Exporting the SBML is
+        slow, so the hash is kept on rr and only computed again when the loaded model
+        or its values after a reset change."""
+        rr.reset()
+        sbml = rr.getSBML()
+        values = _modelValues(rr).tostring()
+        saved = getattr(rr, '_simulationCacheKey', None)
+        if saved is not None and saved[0] == sbml and saved[1] == values:
+            return saved[2]
+        key = hashlib.sha1(rr.getCurrentSBML()).hexdigest()
+        rr._simulationCacheKey = (sbml, values, key)
+        return key
+
+    def key(self, *parts):
+        """Returns the key for a result that depends on parts, for example a model key,
+        the changed values and the simulation arguments."""
+        return hashlib.sha1(repr(_canonical(parts))).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key):
+        """Returns the result stored for key, or None."""
+        if key in self.entries:
+            result = self.entries.pop(key)
+            self.entries[key] = result
+            self.hits += 1
+            return result
+        if self.directory is not None and os.path.exists(self._file(key)):
+            with open(self._file(key), 'rb') as f:
+                result = cPickle.load(f)
+            os.utime(self._file(key), None)
+            self._remember(key, result)
+            self.hits += 1
+            return result
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """Stores result for key."""
+        self._remember(key, result)
+        if self.directory is not None:
+            with open(self._file(key), 'wb') as f:
+                cPickle.dump(result, f, cPickle.HIGHEST_PROTOCOL)
+            if self.maxDiskSize is not None:
+                self._trimDirectory()
+
+    def _remember(self, key, result):
+        self.entries.pop(key, None)
+        self.entries[key] = result
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _trimDirectory(self):
+        files = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith('.pkl')]
+        if len(files) > self.maxDiskSize:
+            files.sort(key=os.path.getmtime)
+            for name in files[:len(files) - self.maxDiskSize]:
+                os.remove(name)
+
+    def clear(self):
+        """Removes all results from memory and disk and resets the statistics."""
+        self.entries.clear()
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith('.pkl'):
+                    os.remove(os.path.join(self.directory, name))
+        self.hits = self.misses = self.evictions = 0
+
+    def getStats(self):
+        """Returns a dictionary with the hits, misses, evictions and size of the cache."""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self.entries)}
+
+    def simulate(self, rr, values, *args, **kwargs):
+        """Returns rr.simulate(*args, **kwargs) for the reset model with values, a
+        dictionary or list of (id, value) pairs, set first. The keyword integrator
+        selects the integrator for this simulation. Afterwards rr is reset
+        and the values are set back to what they were before, so the next call
+        starts from the same model. The result is a copy of the cached array, so it
+        can be changed freely."""
+        if isinstance(values, dict):
+            values = values.items()
+        values = [(str(id), value) for id, value in values]
+        # simulate() has no integrator argument, the integrator is only selected for this run
+        integrator = kwargs.pop('integrator', None)
+        key = self.key(self.modelKey(rr), sorted(values), list(rr.timeCourseSelections),
+                       _integratorSettings(rr, integrator), args, kwargs)
+        result = self.get(key)
+        if result is None:
+            previous = [(id, rr[id]) for id, value in values]
+            previousIntegrator = rr.integrator.getName()
+            try:
+                if integrator is not None:
+                    rr.setIntegrator(integrator)
+                for id, value in values:
+                    rr[id] = value
+                result = np.array(rr.simulate(*args, **kwargs))
+            finally:
+                rr.setIntegrator(previousIntegrator)
+                rr.reset()
+                for id, value in previous:
+                    rr[id] = value
+            self.put(key, result)
+        return result.copy()
@@ -1,15 +1,159 @@
-class DiffEvolution():
+from _strategies import createStrategy
+
+# RoadRunner instance and functions owned by a worker process
+_workerRR = None
+_workerSimFcn = None
+_workerFitnessFcn = None
+_workerPartialFitnessFcn = None
+_workerPreEquilibration = None
+
+
+def _initWorker(sbml, simFcn, fitnessFcn, partialFitnessFcn=None, preEquilibration=None,
+                integratorSettings=None):
+    global _workerRR, _workerSimFcn, _workerFitnessFcn, _workerPartialFitnessFcn
+    global _workerPreEquilibration
+    import roadrunner
+    from tellurium.tellurium import _applyIntegratorSettings
+    _workerRR = roadrunner.RoadRunner(sbml)
+    if integratorSettings is not None:
+        _applyIntegratorSettings(_workerRR, *integratorSettings)
+    _workerSimFcn = simFcn
+    _workerFitnessFcn = fitnessFcn
+    _workerPartialFitnessFcn = partialFitnessFcn
+    _workerPreEquilibration = preEquilibration
+    if preEquilibration is not None:
+        preEquilibration.start(_workerRR)
+
+
+def _preEquilibrate(rr, preEquilibration, params):
+    """Puts rr into the equilibrated state for the upstream values in params, which
+    holds the values of the global parameters in order."""
+    if preEquilibration is not None:
+        upstream, others = preEquilibration.split(zip(rr.model.getGlobalParameterIds(), params))
+        preEquilibration.state(rr, upstream).restore(rr)
+
+
+def _evaluate(rr, simFcn, fitnessFcn, params, preEquilibration=None):
+    import numpy as np
+    try:
+        _preEquilibrate(rr, preEquilibration, params)
+        sim = np.copy(simFcn(rr, params))
+        fitness = fitnessFcn(sim)
+    except RuntimeError:
+        sim = None
+        fitness = float('inf')
+    return fitness, sim
+
+
+def _evaluatePartial(rr, partialFitnessFcn, params, bound, preEquilibration=None):
+    """Sums the fitness contributions that partialFitnessFcn yields for params,
+    and stops as soon as the sum reaches bound."""
+    fitness = 0.
+    try:
+        _preEquilibrate(rr, preEquilibration, params)
+        for contribution in partialFitnessFcn(rr, params):
+            fitness += contribution
+            if fitness >= bound:
+                break
+    except RuntimeError:
+        fitness = float('inf')
+    return fitness, None
+
+
+def _evaluateTask(task):
+    params, keepSim, bound = task
+    if bound is not None:
+        return _evaluatePartial(_workerRR, _workerPartialFitnessFcn, params, bound,
+                                _workerPreEquilibration)
+    fitness, sim = _evaluate(_workerRR, _workerSimFcn, _workerFitnessFcn, params,
+                             _workerPreEquilibration)
+    return fitness, (sim if keepSim else None)
+
+
+def squaredErrorInChunks(observed, selections, chunks=4, reset=True):
+    """Returns a function for the PARTIAL_FITNESS option of DiffEvolution. It
+    sets the global parameters of the reset model to params and simulates the
+    time points of observed, a 2D array with time in the first column and the
+    values of selections in the others, in chunks consecutive calls to
+    simulate. After each call it yields the sum of squared errors over that
+    chunk, so the contributions add up to the error over the whole time course.
+    The time points of observed must be evenly spaced. Every call to simulate
+    has a fixed cost, so a few chunks are best for small models. With the
+    PRE_EQUILIBRATE option, pass reset=False, so the model is not reset before
+    simulating and the simulation starts from the equilibrated state."""
+    import numpy as np
+    observed = np.asarray(observed, dtype=float)
+    bounds = np.linspace(0, len(observed) - 1, chunks + 1).astype(int)
+    bounds = np.unique(bounds)
+    selections = ['time'] + list(selections)
+
+    def partialFitness(rr, params):
+        if reset:
+            rr.reset()
+        rr.model.setGlobalParameterValues(np.asarray(params, dtype=float))
+        for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            sim = rr.simulate(observed[start, 0], observed[end, 0], end - start + 1, selections)
+            # the first point of later chunks is the last point of the previous one
+            first = 0 if i == 0 else 1
+            yield ((np.asarray(sim)[first:, 1:] - observed[start + first:end + 1, 1:]) ** 2).sum()
+    return partialFitness
+
+
+# Settings written to checkpoints, see DiffEvolution.saveCheckpoint
+_CHECKPOINT_SETTINGS = ['CHECKPOINT_INTERVAL', 'CROSSOVER_RATE', 'FITNESS_THRESHOLD',
+                        'HISTORY', 'MAX_GENS', 'MIXING_RATE', 'NON_NEGATIVE',
+                        'POPULATION', 'SAVE_RESULTS', 'STRATEGY']
+
+
+def _stackSims(sims):
+    """Stacks a list of simulation results into one array, with NaN for failed
+    simulations. Returns None if there are no results."""
+    import numpy as np
+    valid = [sim for sim in sims if sim is not None]
+    if not valid:
+        return None
+    stacked = np.empty((len(sims),) + valid[0].shape)
+    for i, sim in enumerate(sims):
+        stacked[i] = np.nan if sim is None else sim
+    return stacked
+
+
+def _unstackSims(stacked):
+    import numpy as np
+    return [None if np.isnan(sim).all() else sim for sim in stacked]
+
+
+class DiffEvolution(object):
     def __init__(self, rr, fitnessFcn, simFcn,
                  ASYNC=False,
+                 CACHE=None,
+                 CHECKPOINT=None,
+                 CHECKPOINT_INTERVAL=10,
                  CROSSOVER_RATE=0.5,
                  FITNESS_THRESHOLD=1e-6,
+                 HISTORY='all',
                  MAX_GENS=50,
                  MIXING_RATE=0.8,
                  NON_NEGATIVE=True,
                  paramRangeDict=None,
+                 PARTIAL_FITNESS=None,
                  POPULATION=500,
-                 SAVE_RESULTS=True
+                 PRE_EQUILIBRATE=None,
+                 SAVE_RESULTS=True,
+                 STRATEGY='current/1',
+                 WORKERS=None
                  ):
+        self._configure(rr, fitnessFcn, simFcn, ASYNC, CACHE, CHECKPOINT, CHECKPOINT_INTERVAL,
+                        CROSSOVER_RATE, FITNESS_THRESHOLD, HISTORY, MAX_GENS, MIXING_RATE,
+                        NON_NEGATIVE, paramRangeDict, PARTIAL_FITNESS, POPULATION,
+                        PRE_EQUILIBRATE, SAVE_RESULTS, STRATEGY, WORKERS)
+        self.seedPopulation()
+        self.BEST_FITNESS = self.generations[-1]['fitness'].min()
+
+    def _configure(self, rr, fitnessFcn, simFcn, ASYNC, CACHE, CHECKPOINT, CHECKPOINT_INTERVAL,
+                   CROSSOVER_RATE, FITNESS_THRESHOLD, HISTORY, MAX_GENS, MIXING_RATE,
+                   NON_NEGATIVE, paramRangeDict, PARTIAL_FITNESS, POPULATION,
+                   PRE_EQUILIBRATE, SAVE_RESULTS, STRATEGY, WORKERS):
         self.rr = rr
         self.paramRange = []
         self.generations = []
@@ -24,6 +168,57 @@ class DiffEvolution():
         self.MAX_GENS = MAX_GENS
         self.FITNESS_THRESHOLD = FITNESS_THRESHOLD
         self.SAVE_RESULTS = SAVE_RESULTS
+        # How trial members are made, see _strategies: 'current/1', 'rand/1',
+        # 'best/1', or the self-adaptive 'jde' and 'shade', which only use
+        # MIXING_RATE and CROSSOVER_RATE as starting values. A Strategy
+        # instance can be given instead of a name.
+        self.strategy = createStrategy(STRATEGY, MIXING_RATE, CROSSOVER_RATE)
+        self.STRATEGY = self.strategy.name
+        if POPULATION <= self.strategy.picks:
+            raise ValueError('POPULATION must be at least {0} for strategy "{1}", which picks {2} '
+                             'other members for each member'.format(
+                                 self.strategy.picks + 1, self.STRATEGY, self.strategy.picks))
+        # With more than one worker, members are simulated in a process pool
+        # whose workers each load the model SBML once. simFcn and fitnessFcn
+        # must then be picklable, i.e. defined at module level.
+        self.WORKERS = WORKERS
+        self.pool = None
+        # A SimulationCache for the fitness and simulation result of each
+        # parameter vector, so members that come up again, also in later runs
+        # with a cache directory, are not simulated again. Keys include the code,
+        # defaults, closures and global data of simFcn and fitnessFcn, but not
+        # state they reach through other objects, such as a model of their own.
+        self.CACHE = CACHE
+        self._cacheModelKey = None
+        # A function of (rr, params) that yields non-negative contributions
+        # adding up to the fitness, for example while simulating the time course
+        # in chunks (see squaredErrorInChunks). Trial members are then only
+        # evaluated until their fitness reaches that of their parent, and
+        # simFcn is only run for the trials that win, to keep their results.
+        self.PARTIAL_FITNESS = PARTIAL_FITNESS
+        if PARTIAL_FITNESS is not None and ASYNC:
+            raise ValueError('PARTIAL_FITNESS cannot be used with ASYNC')
+        # A PreEquilibration (see tellurium.PreEquilibration). Before simFcn or
+        # PARTIAL_FITNESS runs for a member, the model is put into the state
+        # equilibrated with the member's values of the upstream parameters,
+        # which is only computed once per distinct set of values (per worker).
+        # simFcn must then start from the current state and not reset the model.
+        self.PRE_EQUILIBRATE = PRE_EQUILIBRATE
+        if PRE_EQUILIBRATE is not None and ASYNC:
+            raise ValueError('PRE_EQUILIBRATE cannot be used with ASYNC')
+        # 'all' keeps every generation. 'best' keeps only the current
+        # generation in full and reduces earlier ones to their best member.
+        # A directory name does the same, but first saves each full
+        # generation there, see loadGeneration.
+        self.HISTORY = HISTORY
+        # Every CHECKPOINT_INTERVAL generations the state of the run is saved to
+        # the file CHECKPOINT, from which resume() continues it.
+        self.CHECKPOINT = CHECKPOINT
+        self.CHECKPOINT_INTERVAL = CHECKPOINT_INTERVAL
+        if HISTORY not in ('all', 'best'):
+            import os
+            if not os.path.isdir(HISTORY):
+                os.makedirs(HISTORY)
 
         defaultMin = 0
         defaultMax = 10
@@ -40,66 +235,197 @@ class DiffEvolution():
                 else:
                     self.paramRange.append((defaultMin, defaultMax))
 
-        firstGen = {
-            'members': [],
-            'fitness': [],
-            'sim': []
+    @classmethod
+    def resume(cls, path, rr, fitnessFcn, simFcn, **options):
+        """Continues a run from a file written with the CHECKPOINT option. The
+        settings of the run are read from the file; WORKERS, ASYNC or any other
+        option can be given again as keyword arguments. As long as simFcn and
+        fitnessFcn are deterministic, start() then gives the same generations
+        as the uninterrupted run. Earlier generations are restored reduced to
+        their best member, as with HISTORY='best'. A strategy without a name
+        must be passed again as STRATEGY, and PRE_EQUILIBRATE is not saved either."""
+        import numpy as np
+        data = np.load(path)
+        settings = {'CHECKPOINT': path, 'ASYNC': False, 'CACHE': None, 'WORKERS': None,
+                    'paramRangeDict': None, 'PARTIAL_FITNESS': None, 'PRE_EQUILIBRATE': None}
+        for name in _CHECKPOINT_SETTINGS:
+            settings[name] = data[name].item()
+        settings.update(options)
+        de = cls.__new__(cls)
+        de._configure(rr, fitnessFcn, simFcn, **settings)
+        prefix = 'strategy_'
+        de.strategy.setState(dict((name[len(prefix):], data[name]) for name in data.files
+                                  if name.startswith(prefix)))
+        if options.get('paramRangeDict') is None:
+            de.paramRange = [tuple(bounds) for bounds in data['paramRange']]
+
+        for members, fitness in zip(data['bestMembers'], data['bestFitness']):
+            de.generations.append({
+                'members': members[np.newaxis],
+                'fitness': np.array([fitness]),
+                'sim': []
+            })
+        sims = []
+        if 'sim' in data.files:
+            sims = _unstackSims(data['sim'])
+        elif de.SAVE_RESULTS:
+            sims = [None] * len(data['members'])
+        de.generations.append({
+            'members': data['members'],
+            'fitness': data['fitness'],
+            'sim': sims
+        })
+        de.BEST_FITNESS = data['BEST_FITNESS'].item()
+        np.random.set_state((str(data['rngName']), data['rngKeys'], int(data['rngPos']),
+                             int(data['rngHasGauss']), float(data['rngCachedGaussian'])))
+        return de
+
+    def saveCheckpoint(self, path=None):
+        """Saves the current generation, the best member of each earlier
+        generation, the best fitness so far, the settings of the run and the
+        state of the NumPy random generator to path, CHECKPOINT by default. The
+        file is written next to path first and then moved over it, so an
+        interrupted save leaves the previous checkpoint intact."""
+        import os
+        import numpy as np
+        if path is None:
+            path = self.CHECKPOINT
+        gen = self.generations[-1]
+        past = self.generations[:-1]
+        best = [g['fitness'].argmin() for g in past]
+        arrays = {
+            'members': gen['members'],
+            'fitness': gen['fitness'],
+            'bestMembers': np.array([g['members'][i] for g, i in zip(past, best)]
+                                    ).reshape(len(past), gen['members'].shape[1]),
+            'bestFitness': np.array([g['fitness'][i] for g, i in zip(past, best)]),
+            'paramRange': np.array(self.paramRange, dtype=float),
+            'BEST_FITNESS': np.array(self.BEST_FITNESS)
         }
+        for name in _CHECKPOINT_SETTINGS:
+            value = getattr(self, name)
+            arrays[name] = np.array('' if value is None else value)
+        for name, value in self.strategy.getState().items():
+            arrays['strategy_' + name] = value
+        name, keys, pos, hasGauss, cachedGaussian = np.random.get_state()
+        arrays.update(rngName=np.array(name), rngKeys=keys, rngPos=np.array(pos),
+                      rngHasGauss=np.array(hasGauss), rngCachedGaussian=np.array(cachedGaussian))
+        sims = _stackSims(gen['sim'])
+        if sims is not None:
+            arrays['sim'] = sims
+        tmpPath = path + '.tmp'
+        with open(tmpPath, 'wb') as f:
+            np.savez(f, **arrays)
+        if os.path.exists(path) and os.name == 'nt':
+            os.remove(path)
+        os.rename(tmpPath, path)
 
-        if self.ASYNC:
-            self.asyncSeedPopulation(firstGen)
-        else:
-            self.seedPopulation(firstGen)
+    def seedPopulation(self):
+        members = self.createRandomPopulation()
+        fitness, sims = self.evaluateMembers(members)
+        self.generations.append({
+            'members': members,
+            'fitness': fitness,
+            'sim': sims
+        })
+
+    def evaluateMembers(self, members, bounds=None):
+        """Simulates each row of the (POPULATION x nParams) array members and returns
+        an array of fitness values and a list of simulation results in the same order.
+        The list is empty if results are not saved, and holds None where the
+        simulation failed.
 
-        self.generations.append(firstGen)
-        self.BEST_FITNESS = max(firstGen['fitness'])
+        If bounds is given, the fitness of each row is computed with PARTIAL_FITNESS
+        and only until it reaches the bound of that row, and no results are returned."""
+        import numpy as np
+        if bounds is not None or self.CACHE is None:
+            results = self._evaluate(members, bounds)
+        else:
+            if self._cacheModelKey is None:
+                from tellurium.tellurium import _integratorSettings
+                # simFcn changes the model, so keep the key of the model it started from,
+                # together with the key of the functions, which is slow to compute
+                self._cacheModelKey = (self.CACHE.modelKey(self.rr), _integratorSettings(self.rr),
+                                       self.CACHE.key(self.simFcn, self.fitnessFcn))
+            modelKey = self._cacheModelKey
+            if self.PRE_EQUILIBRATE is not None:
+                modelKey = (modelKey, self.PRE_EQUILIBRATE.key())
+            keys = [self.CACHE.key(modelKey, params) for params in members]
+            results = [self.CACHE.get(key) for key in keys]
+            missing = [i for i, result in enumerate(results) if result is None]
+            if missing:
+                for i, result in zip(missing, self._evaluate(members[missing])):
+                    results[i] = result
+                    self.CACHE.put(keys[i], result)
+        fitness = np.array([f for f, sim in results], dtype=float)
+        sims = [sim for f, sim in results] if self.SAVE_RESULTS and bounds is None else []
+        return fitness, sims
 
-    def asyncSeedPopulation(self, firstGen):
-        asyncSims = []
-        for i in range(self.POPULATION):
-            newMember = self.createRandomMember()
-            firstGen['members'].append(newMember)
+    def _evaluate(self, members, bounds=None):
+        if bounds is not None and (self.WORKERS is None or self.WORKERS <= 1):
+            return [_evaluatePartial(self.rr, self.PARTIAL_FITNESS, params, bound,
+                                     self.PRE_EQUILIBRATE)
+                    for params, bound in zip(members, bounds)]
+        if self.ASYNC:
+            results = self._asyncEvaluate(members)
+        elif self.WORKERS is None or self.WORKERS <= 1:
+            results = [_evaluate(self.rr, self.simFcn, self.fitnessFcn, params,
+                                 self.PRE_EQUILIBRATE)
+                       for params in members]
+        else:
+            if self.pool is None:
+                import multiprocessing
+                from tellurium.tellurium import _integratorSettings
+                # getCurrentSBML writes out current values, so send the reset state
+                self.rr.reset()
+                self.pool = multiprocessing.Pool(
+                    self.WORKERS, _initWorker,
+                    (self.rr.getCurrentSBML(), self.simFcn, self.fitnessFcn,
+                     self.PARTIAL_FITNESS, self.PRE_EQUILIBRATE, _integratorSettings(self.rr)))
+            if bounds is None:
+                bounds = [None] * len(members)
+            keepSim = self.SAVE_RESULTS or self.CACHE is not None
+            tasks = [(params, keepSim, bound) for params, bound in zip(members, bounds)]
+            chunkSize = max(1, len(tasks) // (4 * self.WORKERS))
+            results = self.pool.map(_evaluateTask, tasks, chunkSize)
+        return results
 
-            sim = self.simFcn(self.rr, newMember.params)
-            asyncSims.append(sim)
+    def _asyncEvaluate(self, members):
+        import numpy as np
+        asyncSims = [self.simFcn(self.rr, params) for params in members]
+        results = []
         for output in asyncSims:
             try:
-                sim = output.get()[-1]
-                firstGen['fitness'].append(
-                    self.fitnessFcn(sim))
-                if self.SAVE_RESULTS:
-                    firstGen['sim'].append(sim)
+                sim = np.copy(output.get()[-1])
+                results.append((self.fitnessFcn(sim), sim))
             except Exception as ex:
                 if ex.message.find('CVODE') > -1:
-                    firstGen['fitness'].append(float('inf'))
-                    if self.SAVE_RESULTS:
-                        firstGen['sim'].append(None)
+                    results.append((float('inf'), None))
                 else:
                     raise(ex)
+        return results
 
-    def seedPopulation(self, firstGen):
-        import numpy as np
-        for i in range(self.POPULATION):
-            newMember = self.createRandomMember()
-            firstGen['members'].append(newMember)
-
-            try:
-                sim = np.copy(self.simFcn(self.rr, newMember.params))
-                newFitness = self.fitnessFcn(sim)
-            except RuntimeError:
-                sim = None
-                newFitness = float('inf')
-            if self.SAVE_RESULTS:
-                firstGen['sim'].append(sim)
-            firstGen['fitness'].append(newFitness)
+    def closePool(self):
+        """Shuts down the worker processes, if any."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
 
     def start(self):
         import time
         start = time.time()
-        while (len(self.generations) < self.MAX_GENS and
-               self.BEST_FITNESS > self.FITNESS_THRESHOLD):
-            gen = self.newGeneration()
-            self.generations.append(gen)
+        try:
+            while (len(self.generations) < self.MAX_GENS and
+                   self.BEST_FITNESS > self.FITNESS_THRESHOLD):
+                gen = self.newGeneration()
+                self.generations.append(gen)
+                self.retireGeneration(len(self.generations) - 2)
+                if (self.CHECKPOINT is not None and
+                        len(self.generations) % self.CHECKPOINT_INTERVAL == 0):
+                    self.saveCheckpoint()
+        finally:
+            self.closePool()
 
         print 'Finished after %s seconds' % str(time.time()-start)
         print ('with population of %s and %s generations'
@@ -108,133 +434,78 @@ class DiffEvolution():
         print 'Best parameters of %s' % self.getBestMember().params
 
     def newGeneration(self):
-        gen = {}
-
-        newMembers = []
-        newFitnesses = []
-        newSims = []
+        import numpy as np
+        members = self.generations[-1]['members']
+        fitness = self.generations[-1]['fitness']
+        sims = self.generations[-1]['sim']
 
-        if self.ASYNC:
-            self.asyncGetMembersAndFitnesses(newMembers, newFitnesses, newSims)
+        trialMembers = self.createTrialMembers(members, fitness)
+        # Simulate the whole generation of trial members at once
+        if self.PARTIAL_FITNESS is None:
+            trialFitness, trialSims = self.evaluateMembers(trialMembers)
+            better = trialFitness < fitness
         else:
-            self.getMembersAndFitnesses(newMembers, newFitnesses, newSims)
-
-        gen['members'] = newMembers
-        gen['fitness'] = newFitnesses
-        gen['sim'] = newSims
+            # Stop each trial once it can no longer beat its parent
+            trialFitness, trialSims = self.evaluateMembers(trialMembers, fitness)
+            better = trialFitness < fitness
+            if self.SAVE_RESULTS:
+                trialSims = [None] * self.POPULATION
+                winners = np.flatnonzero(better)
+                for i, sim in zip(winners, self.evaluateMembers(trialMembers[winners])[1]):
+                    trialSims[i] = sim
 
+        self.strategy.update(members, fitness, trialMembers, trialFitness, better)
+        # Replace members with trial members of better fitness
+        gen = {
+            'members': np.where(better[:, np.newaxis], trialMembers, members),
+            'fitness': np.where(better, trialFitness, fitness),
+            'sim': [trialSim if b else sim
+                    for b, trialSim, sim in zip(better, trialSims, sims)]
+        }
+        self.updateBestFitness(gen['fitness'].min())
         return gen
 
-    def asyncGetMembersAndFitnesses(self, newMembers, newFitnesses, newSims):
-        import numpy as np
-        numParams = len(self.paramRange)
-        asyncSims = []
-        asyncTrialMembers = []
-        for i, member in enumerate(self.generations[-1]['members']):
-            # Pick two other members
-            a = self.generations[-1]['members'][
-                np.random.randint(0, self.POPULATION)]
-            b = self.generations[-1]['members'][
-                np.random.randint(0, self.POPULATION)]
-            # Create mutant
-            mutant = self.mutate(member, a, b)
-            # Crossover to create trial member
-            trialP = []
-            pInd = np.random.randint(
-                0, numParams)  # random index of parameter to cross over
-            for j, (
-                    mutantP, originalP
-                    ) in enumerate(zip(mutant.params, member.params)):
-                r = np.random.uniform(0, 1)
-                if r < self.CROSSOVER_RATE or j == pInd:
-                    trialP.append(mutantP)
-                else:
-                    trialP.append(originalP)
-            trialMember = Member(trialP)
-
-            # In the async case, create list of trial members and
-            # async sim jobs to feed into fitness function
-            sim = self.simFcn(self.rr, trialMember.params)
-            asyncTrialMembers.append(trialMember)
-            asyncSims.append(sim)
-
-        # Async operation so still need to make members
-        for i, (simResult,
-                trialMember
-                ) in enumerate(zip(asyncSims, asyncTrialMembers)):
-            try:
-                sim = np.copy(simResult.get()[-1])
-                trialFitness = self.fitnessFcn(sim)
-            except Exception as ex:
-                if ex.message.find('CVODE') > -1:
-                    sim = None
-                    trialFitness = float('inf')
-                else:
-                    raise(ex)
-            member = self.generations[-1]['members'][i]
-            memberFitness = self.generations[-1]['fitness'][i]
-            memberSim = self.generations[-1]['sim'][i]
-            if (trialFitness < memberFitness):
-                newMembers.append(trialMember)
-                newFitnesses.append(trialFitness)
-                self.updateBestFitness(trialFitness)
-                if self.SAVE_RESULTS:
-                    newSims.append(sim)
-            else:
-                newMembers.append(member)
-                newFitnesses.append(memberFitness)
-                self.updateBestFitness(memberFitness)
-                if self.SAVE_RESULTS:
-                    newSims.append(memberSim)
+    def retireGeneration(self, index):
+        """Reduces generation index according to HISTORY once it is no longer the
+        current generation."""
+        if self.HISTORY == 'all':
+            return
+        gen = self.generations[index]
+        if self.HISTORY != 'best':
+            self.saveGeneration(index, gen)
+        ind = gen['fitness'].argmin()
+        self.generations[index] = {
+            'members': gen['members'][ind:ind + 1],
+            'fitness': gen['fitness'][ind:ind + 1],
+            'sim': gen['sim'][ind:ind + 1]
+        }
+
+    def _generationFile(self, index):
+        import os
+        return os.path.join(self.HISTORY, 'generation_%d.npz' % index)
 
-    def getMembersAndFitnesses(self, newMembers, newFitnesses, newSims):
+    def saveGeneration(self, index, gen):
+        """Saves a full generation to the HISTORY directory. Simulation results are
+        stacked into one array, with NaN for failed simulations."""
         import numpy as np
-        numParams = len(self.paramRange)
-        for i, member in enumerate(self.generations[-1]['members']):
-            # Pick two other members
-            a = self.generations[-1]['members'][
-                np.random.randint(0, self.POPULATION)]
-            b = self.generations[-1]['members'][
-                np.random.randint(0, self.POPULATION)]
-            # Create mutant
-            mutant = self.mutate(member, a, b)
-            # Crossover to create trial member
-            trialP = []
-            pInd = np.random.randint(
-                0, numParams)  # random index of parameter to cross over
-            for j, (
-                    mutantP, originalP
-                    ) in enumerate(zip(mutant.params, member.params)):
-                r = np.random.uniform(0, 1)
-                if r < self.CROSSOVER_RATE or j == pInd:
-                    trialP.append(mutantP)
-                else:
-                    trialP.append(originalP)
-            trialMember = Member(trialP)
+        arrays = {'members': gen['members'], 'fitness': gen['fitness']}
+        sims = _stackSims(gen['sim'])
+        if sims is not None:
+            arrays['sim'] = sims
+        np.savez(self._generationFile(index), **arrays)
 
-            # Fitness function should know how to handle trialmember
-            # and run simulation
-            try:
-                sim = np.copy(self.simFcn(self.rr, trialMember.params))
-                trialFitness = self.fitnessFcn(sim)
-            except RuntimeError:
-                sim = None
-                trialFitness = float('inf')
-            memberFitness = self.generations[-1]['fitness'][i]
-            memberSim = self.generations[-1]['sim'][i]
-            # Replace member with trial member if better fitness
-            if (trialFitness < memberFitness):
-                newMembers.append(trialMember)
-                newFitnesses.append(trialFitness)
-                self.updateBestFitness(trialFitness)
-                if self.SAVE_RESULTS:
-                    newSims.append(sim)
-            else:
-                newMembers.append(member)
-                newFitnesses.append(memberFitness)
-                self.updateBestFitness(memberFitness)
-                if self.SAVE_RESULTS:
-                    newSims.append(memberSim)
+    def loadGeneration(self, index):
+        """Returns a full generation saved in the HISTORY directory."""
+        import numpy as np
+        data = np.load(self._generationFile(index))
+        sims = []
+        if 'sim' in data.files:
+            sims = _unstackSims(data['sim'])
+        return {
+            'members': data['members'],
+            'fitness': data['fitness'],
+            'sim': sims
+        }
 
     def updateBestFitness(self, newFitness):
         if (newFitness < self.BEST_FITNESS):
@@ -242,44 +513,30 @@ class DiffEvolution():
             return True
         return False
 
-    def mutate(self, x, a, b):
+    def createTrialMembers(self, members, fitness):
+        """Returns a trial member for every member, made by the strategy."""
         import numpy as np
-        differential = [self.MIXING_RATE*(ai-bi)
-                        for ai, bi
-                        in
-                        zip(a.params, b.params)
-                        ]
-        mutantParams = [xi + diffi
-                        for xi, diffi
-                        in
-                        zip(x.params, differential)]
+        trialMembers = self.strategy.trialMembers(members, fitness)
         if (self.NON_NEGATIVE):
-            npParams = np.asarray(mutantParams)
-            negativeIndicies = npParams < 0
-            npParams[negativeIndicies] = 0
-            mutantParams = npParams.tolist()
-        return Member(mutantParams)
+            np.maximum(trialMembers, 0, out=trialMembers)
+        return trialMembers
 
-    def createRandomMember(self):
+    def createRandomPopulation(self):
         import numpy as np
-        newParams = [np.random.uniform(self.paramRange[i][0],
-                                       self.paramRange[i][1])
-                     for i, p
-                     in
-                     enumerate(self.rr.model.getGlobalParameterValues())]
-        newMember = Member(newParams)
-        return newMember
+        paramRange = np.array(self.paramRange, dtype=float)
+        return np.random.uniform(paramRange[:, 0], paramRange[:, 1],
+                                 (self.POPULATION, len(self.paramRange)))
 
     def plotFitnesses(self):
         import matplotlib.pyplot as plt
-        fitnesses = [min(g['fitness']) for g in self.generations]
+        fitnesses = [g['fitness'].min() for g in self.generations]
         plt.plot(fitnesses)
         return plt.show()
 
     def plotBest(self, observed=None):
         import matplotlib.pyplot as plt
-        ind = self.generations[-1]['fitness'].index(self.BEST_FITNESS)
-        params = self.generations[-1]['members'][ind].params
+        ind = self.generations[-1]['fitness'].argmin()
+        params = self.generations[-1]['members'][ind]
         if self.SAVE_RESULTS:
             sim = self.generations[-1]['sim'][ind]
         else:
@@ -298,8 +555,8 @@ class DiffEvolution():
         return plt.show()
 
     def getBestMember(self):
-        ind = self.generations[-1]['fitness'].index(self.BEST_FITNESS)
-        bestMember = self.generations[-1]['members'][ind]
+        ind = self.generations[-1]['fitness'].argmin()
+        bestMember = Member(self.generations[-1]['members'][ind].tolist())
         return bestMember
 
 
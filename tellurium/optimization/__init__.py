@@ -1 +1,2 @@
-from DiffEvolution import DiffEvolution
+from DiffEvolution import DiffEvolution, squaredErrorInChunks
+from _strategies import Strategy, CurrentToRandStrategy, RandStrategy, BestStrategy, JDEStrategy, SHADEStrategy
@@ -0,0 +1,258 @@
+"""
+Strategies for creating the trial members of a DiffEvolution generation. All of
+them work on the whole population at once: members is a (POPULATION x nParams)
+array and fitness the array of their fitness values. Each strategy picks a
+scale factor F and a crossover rate CR for every member, builds one mutant per
+member and crosses it with the member. After selection, update() tells the
+strategy which trials won, so self-adaptive strategies can learn from it.
+
+'current/1'  x + F*(a - b), with fixed F and CR
+'rand/1'     c + F*(a - b), with fixed F and CR
+'best/1'     best + F*(a - b), with fixed F and CR
+'jde'        rand/1 where every member carries its own F and CR, which are
+             resampled now and then and kept when the trial wins (Brest et al. 2006)
+'shade'      current-to-pbest/1 with an archive of replaced members and F and CR
+             drawn around a history of successful values (Tanabe and Fukunaga 2013)
+
+Here a, b and c are members picked at random, distinct from each other and from x.
+Random numbers come from the numpy.random module, so np.random.seed makes a run
+reproducible.
+"""
+import numpy as np
+
+
+def distinctIndices(population, count, size=None, exclude=None):
+    """Returns a (population x count) array where every row holds count distinct
+    indices below size (population by default) that differ from the row number,
+    and from the values in the same row of exclude if it is given."""
+    if size is None:
+        size = population
+    excluded = np.arange(population)[:, np.newaxis]
+    if exclude is not None:
+        excluded = np.column_stack([excluded, exclude])
+    picks = np.empty((population, count), dtype=int)
+    for j in range(count):
+        ordered = np.sort(excluded, axis=1)
+        isNew = np.ones(ordered.shape, dtype=bool)
+        isNew[:, 1:] = np.diff(ordered, axis=1) > 0
+        pick = (np.random.random_sample(population) * (size - isNew.sum(axis=1))).astype(int)
+        # step over the excluded indices in increasing order
+        for k in range(ordered.shape[1]):
+            pick += isNew[:, k] & (pick >= ordered[:, k])
+        picks[:, j] = pick
+        excluded = np.column_stack([excluded, pick])
+    return picks
+
+
+def binomialCrossover(members, mutants, crossoverRate):
+    """Returns trial members that take each parameter from the mutant with
+    probability crossoverRate, a number or one rate per member, and at least one
+    random parameter."""
+    population, numParams = members.shape
+    rate = np.asarray(crossoverRate, dtype=float)
+    if rate.ndim:
+        rate = rate[:, np.newaxis]
+    cross = np.random.uniform(0, 1, members.shape) < rate
+    cross[np.arange(population), np.random.randint(0, numParams, population)] = True
+    return np.where(cross, mutants, members)
+
+
+class Strategy(object):
+    """Base class of DE strategies with a fixed scale factor and crossover rate.
+    Subclasses build the mutants in mutants() and may draw their own F and CR in
+    parameters() and adapt them in update(). picks is the number of other members
+    that mutants() picks for each member, distinct from each other and from it."""
+    name = None
+    picks = 0
+
+    def __init__(self, mixingRate=0.8, crossoverRate=0.5):
+        self.mixingRate = mixingRate
+        self.crossoverRate = crossoverRate
+
+    def parameters(self, population):
+        """Returns the scale factor and crossover rate of every member."""
+        return (np.repeat(float(self.mixingRate), population),
+                np.repeat(float(self.crossoverRate), population))
+
+    def mutants(self, members, fitness, F):
+        raise NotImplementedError
+
+    def trialMembers(self, members, fitness):
+        F, CR = self.parameters(len(members))
+        self.F, self.CR = F, CR
+        return binomialCrossover(members, self.mutants(members, fitness, F[:, np.newaxis]), CR)
+
+    def update(self, members, fitness, trialMembers, trialFitness, better):
+        """Called with the outcome of selection, before members are replaced."""
+        pass
+
+    def getState(self):
+        """Returns the adapted state as a dictionary of arrays, for checkpoints."""
+        return {}
+
+    def setState(self, state):
+        pass
+
+
+class CurrentToRandStrategy (Strategy):
+    name = 'current/1'
+    picks = 2
+
+    def mutants(self, members, fitness, F):
+        picks = distinctIndices(len(members), 2)
+        return members + F * (members[picks[:, 0]] - members[picks[:, 1]])
+
+
+class RandStrategy (Strategy):
+    name = 'rand/1'
+    picks = 3
+
+    def mutants(self, members, fitness, F):
+        picks = distinctIndices(len(members), 3)
+        return members[picks[:, 0]] + F * (members[picks[:, 1]] - members[picks[:, 2]])
+
+
+class BestStrategy (Strategy):
+    name = 'best/1'
+    picks = 2
+
+    def mutants(self, members, fitness, F):
+        picks = distinctIndices(len(members), 2)
+        return members[fitness.argmin()] + F * (members[picks[:, 0]] - members[picks[:, 1]])
+
+
+class JDEStrategy (RandStrategy):
+    """rand/1 with self-adaptive F and CR per member. With probability tau each,
+    a member tries a new F from [lowerF, 1) and a new CR from [0, 1)."""
+    name = 'jde'
+
+    def __init__(self, mixingRate=0.5, crossoverRate=0.9, tau=0.1, lowerF=0.1):
+        RandStrategy.__init__(self, mixingRate, crossoverRate)
+        self.tau = tau
+        self.lowerF = lowerF
+        self.memberF = None
+        self.memberCR = None
+
+    def parameters(self, population):
+        if self.memberF is None or len(self.memberF) != population:
+            self.memberF, self.memberCR = Strategy.parameters(self, population)
+        newF = np.random.random_sample(population) < self.tau
+        newCR = np.random.random_sample(population) < self.tau
+        F = np.where(newF, self.lowerF + (1 - self.lowerF) * np.random.random_sample(population),
+                     self.memberF)
+        CR = np.where(newCR, np.random.random_sample(population), self.memberCR)
+        return F, CR
+
+    def update(self, members, fitness, trialMembers, trialFitness, better):
+        self.memberF = np.where(better, self.F, self.memberF)
+        self.memberCR = np.where(better, self.CR, self.memberCR)
+
+    def getState(self):
+        if self.memberF is None:
+            return {}
+        return {'memberF': self.memberF, 'memberCR': self.memberCR}
+
+    def setState(self, state):
+        if 'memberF' in state:
+            self.memberF = state['memberF']
+            self.memberCR = state['memberCR']
+
+
+class SHADEStrategy (Strategy):
+    """current-to-pbest/1 with success-history based adaptation of F and CR. The
+    mutant of x is x + F*(p - x) + F*(a - b), where p is one of the best
+    pBest*POPULATION members and b may also come from the archive of members that
+    were replaced by better trials."""
+    name = 'shade'
+    # b can only come from the archive once members have been replaced
+    picks = 2
+
+    def __init__(self, mixingRate=0.5, crossoverRate=0.5, historySize=None, pBest=0.2):
+        Strategy.__init__(self, mixingRate, crossoverRate)
+        self.historySize = historySize
+        self.pBest = pBest
+        self.memoryF = None
+        self.memoryCR = None
+        self.memoryIndex = 0
+        self.archive = None
+
+    def parameters(self, population):
+        if self.memoryF is None:
+            size = population if self.historySize is None else self.historySize
+            self.memoryF = np.repeat(float(self.mixingRate), size)
+            self.memoryCR = np.repeat(float(self.crossoverRate), size)
+        slot = np.random.randint(0, len(self.memoryF), population)
+        CR = np.clip(np.random.normal(self.memoryCR[slot], 0.1), 0, 1)
+        F = np.zeros(population)
+        redraw = np.ones(population, dtype=bool)
+        while redraw.any():
+            F[redraw] = (self.memoryF[slot[redraw]] +
+                         0.1 * np.random.standard_cauchy(redraw.sum()))
+            redraw = F <= 0
+        return np.minimum(F, 1), CR
+
+    def mutants(self, members, fitness, F):
+        population = len(members)
+        archive = members[:0] if self.archive is None else self.archive
+        pool = np.vstack([members, archive])
+        # pick p from the best 2/POPULATION to pBest of the population
+        p = np.random.uniform(min(2. / population, self.pBest), self.pBest, population)
+        top = np.maximum(2, np.round(p * population)).astype(int)
+        ranked = np.argsort(fitness, kind='mergesort')
+        pBest = members[ranked[(np.random.random_sample(population) * top).astype(int)]]
+        a = distinctIndices(population, 1)[:, 0]
+        b = distinctIndices(population, 1, len(pool), a)[:, 0]
+        return members + F * (pBest - members) + F * (members[a] - pool[b])
+
+    def update(self, members, fitness, trialMembers, trialFitness, better):
+        if not better.any():
+            return
+        replaced = members[better]
+        archive = replaced if self.archive is None else np.vstack([self.archive, replaced])
+        if len(archive) > len(members):
+            keep = np.random.permutation(len(archive))[:len(members)]
+            archive = archive[np.sort(keep)]
+        self.archive = archive
+
+        gain = np.abs(fitness[better] - trialFitness[better])
+        finite = np.isfinite(gain)
+        gain[~finite] = gain[finite].max() if finite.any() else 1.
+        if gain.sum() > 0:
+            weights = gain / gain.sum()
+        else:
+            weights = np.repeat(1. / len(gain), len(gain))
+        F, CR = self.F[better], self.CR[better]
+        self.memoryCR[self.memoryIndex] = (weights * CR).sum()
+        self.memoryF[self.memoryIndex] = (weights * F ** 2).sum() / (weights * F).sum()
+        self.memoryIndex = (self.memoryIndex + 1) % len(self.memoryF)
+
+    def getState(self):
+        if self.memoryF is None:
+            return {}
+        state = {'memoryF': self.memoryF, 'memoryCR': self.memoryCR,
+                 'memoryIndex': np.array(self.memoryIndex)}
+        if self.archive is not None:
+            state['archive'] = self.archive
+        return state
+
+    def setState(self, state):
+        if 'memoryF' in state:
+            self.memoryF = state['memoryF']
+            self.memoryCR = state['memoryCR']
+            self.memoryIndex = int(state['memoryIndex'])
+            self.archive = state.get('archive')
+
+
+STRATEGIES = dict((strategy.name, strategy) for strategy in
+                  [CurrentToRandStrategy, RandStrategy, BestStrategy, JDEStrategy, SHADEStrategy])
+
+
+def createStrategy(strategy, mixingRate, crossoverRate):
+    """Returns strategy if it is a Strategy instance, or a new strategy of that name.
+    Adaptive strategies start from the rates and adapt them as the run goes on."""
+    if isinstance(strategy, Strategy):
+        return strategy
+    if strategy not in STRATEGIES:
+        raise ValueError('Unknown strategy "{0}", use one of {1}'.format(
+            strategy, ', '.join(sorted(STRATEGIES))))
+    return STRATEGIES[strategy](mixingRate, crossoverRate)
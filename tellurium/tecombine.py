@@ -5,8 +5,8 @@ import os.path
 from os.path import exists, isfile, basename
 from zipfile import ZipFile
 import phrasedml
-import antimony
 import re
+from _conversion import antimonyToSBML
 
 class CombineAsset(object):
     # Get the URI for sbml, sedml, etc.
@@ -74,9 +74,7 @@ class CombineSBMLAsset(CombineAsset):
 
 class CombineAntimonyAsset(CombineAsset):
     def getSBMLStr(self):
-        antimony.clearPreviousLoads()
-        antimony.loadString(self.getRawStr())
-        return antimony.getSBMLString(antimony.getModuleNames()[-1])
+        return antimonyToSBML(self.getRawStr(), module='last')
 
     def getResourceURI(self):
         return CombineAsset.getCOMBINEResourceURI('sbml')
@@ -28,30 +28,42 @@ Support routines for tellurium
 #    shutil.copyfile(dst, backup)
 #    shutil.copyfile(src, dst)
 
-import matplotlib.pyplot as plt
 import roadrunner
-import roadrunner.testing
 import antimony
 import tellurium
+import _conversion
+from _conversion import setConversionCacheSize, clearConversionCache
 import numpy
 import os
 import glob
-try:
-    import tecombine as combine
-except ImportError as e:
-    roadrunner.Logger.log(roadrunner.Logger.LOG_WARNING, str(e))
-try:
-    import SedmlToRr
-except ImportError as e:
-    roadrunner.Logger.log(roadrunner.Logger.LOG_WARNING, str(e))    
-try:
-    import tephrasedml
-except ImportError as e:
-    roadrunner.Logger.log(roadrunner.Logger.LOG_WARNING, str(e))
-try:
-    from sbml2matlab import sbml2matlab
-except ImportError as e:
-    roadrunner.Logger.log(roadrunner.Logger.LOG_WARNING, str(e))
+import hashlib
+import tempfile
+import shutil
+import atexit
+from collections import OrderedDict
+from _lazy import LazyModule
+
+def _selectHeadlessBackend ():
+    """Use the Agg backend on a Linux machine without a display, unless a backend
+    has been chosen through MPLBACKEND. Only has an effect before matplotlib first
+    loads a backend."""
+    import sys
+    if ('matplotlib.backends' not in sys.modules and sys.platform.startswith('linux') and
+            not os.environ.get('DISPLAY') and not os.environ.get('MPLBACKEND')):
+        import matplotlib
+        matplotlib.use('Agg')
+
+# Imported on first use, see _lazy. Missing optional packages raise ImportError then.
+plt = LazyModule('matplotlib.pyplot', _selectHeadlessBackend)
+_testing = LazyModule('roadrunner.testing')
+combine = LazyModule('tellurium.tecombine')
+SedmlToRr = LazyModule('tellurium.SedmlToRr')
+tephrasedml = LazyModule('tellurium.tephrasedml')
+
+def sbml2matlab (sbml, *args, **kwargs):
+    """Convert an SBML string into a Matlab function, see the sbml2matlab package"""
+    from sbml2matlab import sbml2matlab as convert
+    return convert(sbml, *args, **kwargs)
 
 tehold = False # Same as matlab hold
 
@@ -158,6 +170,90 @@ def readFromFile (fileName):
 ##\ingroup loadingModels
 #@{
 
+# Models loaded by loadSBMLModel and loadAntimonyModel, by the SHA-1 of their text.
+# Each entry holds the SBML and, if roadrunner can save its state, a file with the
+# state of the compiled model, from which new instances are made without compiling.
+_modelCache = OrderedDict()
+_modelCacheSize = 20
+_modelCacheDir = None
+_modelCacheStats = {'hits': 0, 'misses': 0}
+
+##\brief Set the number of models kept by the model cache, 0 switches the cache off
+#
+#Example: setModelCacheSize (50)
+def setModelCacheSize (size):
+    """Set how many loaded models are remembered, so that loading the same SBML or
+    Antimony text again returns a new roadrunner instance without parsing and
+    compiling the model again. 0 switches the cache off."""
+    global _modelCacheSize
+    _modelCacheSize = size
+    _trimModelCache()
+
+##\brief Forget all models in the model cache
+def clearModelCache ():
+    """Forget all models remembered by the model cache and reset its statistics."""
+    while _modelCache:
+        _removeCachedModel(_modelCache.popitem(last=False)[1])
+    _modelCacheStats['hits'] = 0
+    _modelCacheStats['misses'] = 0
+
+##\brief Returns the hits, misses and size of the model cache
+def getModelCacheStats ():
+    return {'hits': _modelCacheStats['hits'], 'misses': _modelCacheStats['misses'],
+            'size': len(_modelCache)}
+
+def _removeCachedModel (entry):
+    sbml, stateFile = entry
+    if stateFile is not None and os.path.exists(stateFile):
+        os.remove(stateFile)
+
+def _trimModelCache ():
+    while len(_modelCache) > max(_modelCacheSize, 0):
+        _removeCachedModel(_modelCache.popitem(last=False)[1])
+
+def _saveModelState (rr, key):
+    global _modelCacheDir
+    if not hasattr(rr, 'saveState'):
+        return None
+    try:
+        if _modelCacheDir is None:
+            _modelCacheDir = tempfile.mkdtemp(prefix='tellurium_models_')
+            atexit.register(shutil.rmtree, _modelCacheDir, ignore_errors=True)
+        stateFile = os.path.join(_modelCacheDir, key + '.rrstate')
+        rr.saveState(stateFile)
+        return stateFile
+    except Exception:
+        return None
+
+def _modelKey (kind, text):
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return kind + '-' + hashlib.sha1(text).hexdigest()
+
+def _loadCachedModel (key, getSBML):
+    """Returns a new roadrunner instance for the model with key. getSBML is only called
+    for models that are not in the cache yet."""
+    if _modelCacheSize <= 0:
+        return roadrunner.RoadRunner(getSBML())
+    if key in _modelCache:
+        entry = _modelCache.pop(key)
+        _modelCache[key] = entry
+        _modelCacheStats['hits'] += 1
+        sbml, stateFile = entry
+        if stateFile is not None:
+            rr = roadrunner.RoadRunner()
+            rr.loadState(stateFile)
+            return rr
+        # roadrunner keeps the compiled code of every SBML it has loaded, so this
+        # only parses the SBML again
+        return roadrunner.RoadRunner(sbml)
+    _modelCacheStats['misses'] += 1
+    sbml = getSBML()
+    rr = roadrunner.RoadRunner(sbml)
+    _modelCache[key] = (sbml, _saveModelState(rr, key))
+    _trimModelCache()
+    return rr
+
 ##\brief Load an SBML model into roadRunner
 #
 #Example: rr = loadSBMLModel ('c:\\myfile.txt')
@@ -165,8 +261,9 @@ def readFromFile (fileName):
 #\param[in] sbml A filename or a string containing SBML
 #\return Returns a reference to the roadrunner model
 def loadSBMLModel (sbml):
-    rr = roadrunner.RoadRunner (sbml)
-    return rr
+    if os.path.isfile(sbml):
+        sbml = readFromFile(sbml)
+    return _loadCachedModel(_modelKey('sbml', sbml), lambda: sbml)
     
 ##\brief Reads an Antimony string into roadrunner
 #
@@ -179,18 +276,7 @@ def loadAntimonyModel (antStr):
     
     r = loadAntModel (antimonyStr)
     """
-    err = antimony.loadAntimonyString (antStr)
- 
-    if (err < 0):
-       raise Exception('Antimony: ' + antimony.getLastError())
-       
-    Id = antimony.getMainModuleName()
-    sbmlStr = antimony.getSBMLString(Id)
-    rr = roadrunner.RoadRunner(sbmlStr)
-    
-    antimony.clearPreviousLoads()
-    
-    return rr
+    return _loadCachedModel(_modelKey('antimony', antStr), lambda: antimonyTosbml(antStr))
 
 ##\brief Reads an Antimony string into roadrunner, short-cut to loadAntimonyModel()
 #
@@ -229,13 +315,7 @@ def antimonyTosbml (antStr):
 
     sbmlStr = antimonyTosbml (antimonyStr)
     """
-    err = antimony.loadAntimonyString (antStr)
-
-    if (err < 0):
-       raise Exception('Antimony: ' + antimony.getLastError())
-
-    Id = antimony.getMainModuleName()
-    return antimony.getSBMLString(Id)    
+    return _conversion.antimonyToSBML(antStr)
  
 ##\brief Converts a SBML model to Antimony
 #\return Returns the Antimony model as a string
@@ -244,12 +324,7 @@ def sbmlToAntimony (str):
 
     sbmlStr = sbmlToAntimony (antimonyStr)
     """
-    err = antimony.loadSBMLString (str)
-
-    if (err < 0):
-       raise Exception('Antimony: ' + antimony.getLastError())
-
-    return antimony.getAntimonyString(None)
+    return _conversion.sbmlToAntimony(str)
       
 def cellmlFileToAntimony (CellMLFileName):
     """Load a cellml file and return the
@@ -257,10 +332,8 @@ def cellmlFileToAntimony (CellMLFileName):
     
     ant = cellMLToAntimony('mymodel.cellml')
     """
-    if antimony.loadCellMLFile(CellMLFileName) == -1:
-       raise Exception ('Error calling loadCellMLFile')
-    antimony.loadCellMLFile(CellMLFileName)
-    return antimony.getAntimonyString (None)
+    return _conversion.loadCellML(CellMLFileName, lambda: antimony.getAntimonyString (None),
+                                  'Error calling loadCellMLFile')
  
     
 def cellmlFileToSBML (CellMLFileName):
@@ -269,10 +342,8 @@ def cellmlFileToSBML (CellMLFileName):
     
     sbmlStr = cellMLToSBML('mymodel.cellml')
     """
-    
-    if antimony.loadCellMLFile(CellMLFileName) < 0:
-       raise Exception ('Error calling loadCellMLFile'+ antimony.getLastError())
-    return antimony.getSBMLString (None)
+    return _conversion.loadCellML(CellMLFileName, lambda: antimony.getSBMLString (None),
+                                  'Error calling loadCellMLFile')
 
 
 def cellmlStrToAntimony (CellMLStr):
@@ -281,9 +352,8 @@ def cellmlStrToAntimony (CellMLStr):
     
     ant = cellMLStrToAntimony('mymodel.cellml')
     """
-    if antimony.loadCellMLFile(CellMLStr) < 0:
-       raise Exception ('Error calling cellMLStrToAntimony' + antimony.getLastError())
-    return antimony.getAntimonyString (None)
+    return _conversion.loadCellML(CellMLStr, lambda: antimony.getAntimonyString (None),
+                                  'Error calling cellMLStrToAntimony')
     
     
 def cellmlStrToSBML (CellMLStr):
@@ -292,9 +362,8 @@ def cellmlStrToSBML (CellMLStr):
     
     sbmlStr = cellMLStrToSBML('mymodel.cellml')
     """
-    if antimony.loadCellMLFile(CellMLStr) < 0:
-       raise Exception ('Error calling cellMLStrToSBML' + antimony.getLastError())
-    return antimony.getSBMLString (None)
+    return _conversion.loadCellML(CellMLStr, lambda: antimony.getSBMLString (None),
+                                  'Error calling cellMLStrToSBML')
 ##@}     
 
 # ---------------------------------------------------------------------
@@ -409,7 +478,311 @@ def gillespie (r, *args, **kwargs):
     r.setIntegrator(prev)
 
     return result
-##@} 
+
+##\brief Resample the event output of a Gillespie simulation onto a fixed time grid
+#
+#Example: result = te.resampleEvents (rr.gillespie (0, 40), numpy.linspace (0, 40, 41))
+#
+def resampleEvents (events, grid, out=None):
+    """
+    Resample the output of a Gillespie simulation without a fixed grid, one row per
+    reaction event with time in the first column, onto the times in grid. Between
+    events the state is constant, so each grid time gets the row of the last event
+    at or before it, or the first row if it lies before all events. Returns an
+    array of shape (len(grid), columns) with grid as the first column, written into
+    out if given. Event times must be increasing.
+
+    result = te.resampleEvents (rr.gillespie (0, 40), numpy.linspace (0, 40, 41))
+    """
+    events = numpy.asarray(events, dtype=float)
+    grid = numpy.asarray(grid, dtype=float)
+    if len(events) == 0:
+        raise ValueError("no events to resample")
+    index = numpy.searchsorted(events[:, 0], grid, side='right') - 1
+    numpy.clip(index, 0, len(events) - 1, out=index)
+    if out is None:
+        out = numpy.empty((len(grid), events.shape[1]))
+    numpy.take(events, index, axis=0, out=out)
+    out[:, 0] = grid
+    return out
+
+##\brief Resample several Gillespie simulations onto one time grid and stack them
+#
+#Example: ensemble = te.stackEvents ([rr.gillespie (0, 40) for i in range (100)], numpy.linspace (0, 40, 41))
+#
+def stackEvents (runs, grid):
+    """
+    Resample each of runs, event outputs of Gillespie simulations with the same
+    columns, onto grid with resampleEvents and return them as one array of shape
+    (len(runs), len(grid), columns).
+    """
+    grid = numpy.asarray(grid, dtype=float)
+    out = None
+    for i, events in enumerate(runs):
+        if out is None:
+            out = numpy.empty((len(runs), len(grid), numpy.shape(events)[1]))
+        resampleEvents(events, grid, out[i])
+    if out is None:
+        raise ValueError("no runs to resample")
+    return out
+
+class EnsembleStatistics (object):
+    """
+    Running summary of trajectories that all have the same shape, for example the
+    (points x selections) output of one Gillespie replicate. Memory does not grow
+    with the number of replicates:
+
+    - mean and variance at every point are updated with Welford's method, and
+      merged with Chan's formula
+    - quantiles at every point come from a KLL sketch (Karnin, Lang and Liberty
+      2016) that keeps about 3*sketchSize values per point. Quantiles are exact
+      while no more than sketchSize replicates have been added and otherwise have
+      a rank error of roughly 1/sketchSize. sketchSize=None switches them off.
+
+    add() takes one trajectory, addBlock() a stack of them and merge() another
+    EnsembleStatistics of the same shape, for example one filled in a worker
+    process. seed makes the sketch's choices, and so its quantiles, repeatable.
+
+    stats = EnsembleStatistics((41, 3))
+    for i in range(10000):
+        stats.add(rr.gillespie(0, 40, 41))
+    lower, median, upper = stats.quantile([0.05, 0.5, 0.95])
+    """
+    def __init__(self, shape, sketchSize=200, seed=None):
+        self.shape = tuple(shape)
+        self.count = 0
+        self.mean = numpy.zeros(self.shape)
+        self._m2 = numpy.zeros(self.shape)
+        self.sketchSize = sketchSize
+        # levels[h] holds values that each stand for 2**h replicates
+        self._levels = []
+        self._rng = numpy.random.RandomState(seed)
+
+    def add(self, trajectory):
+        self.addBlock(numpy.asarray(trajectory, dtype=float)[numpy.newaxis])
+
+    def addBlock(self, trajectories):
+        trajectories = numpy.asarray(trajectories, dtype=float)
+        n = len(trajectories)
+        if n == 0:
+            return
+        if trajectories.shape[1:] != self.shape:
+            raise ValueError('Expected trajectories of shape {0}, got {1}'.format(
+                self.shape, trajectories.shape[1:]))
+        blockMean = trajectories.mean(axis=0)
+        self._combine(n, blockMean, ((trajectories - blockMean) ** 2).sum(axis=0))
+        if self.sketchSize is not None:
+            self._addToLevel(0, trajectories)
+            self._compress()
+
+    def merge(self, other):
+        """Adds the replicates summarized by other, which is left unchanged."""
+        if other.shape != self.shape:
+            raise ValueError('Cannot merge statistics of shape {0} into {1}'.format(
+                other.shape, self.shape))
+        if other.count == 0:
+            return
+        self._combine(other.count, other.mean, other._m2)
+        if self.sketchSize is not None:
+            if other.sketchSize is None:
+                raise ValueError('Cannot merge statistics without quantiles')
+            for h, level in enumerate(other._levels):
+                self._addToLevel(h, level)
+            self._compress()
+
+    def _combine(self, n, mean, m2):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * (float(n) / total)
+        self._m2 += m2 + delta ** 2 * (float(self.count) * n / total)
+        self.count = total
+
+    def _addToLevel(self, h, values):
+        while len(self._levels) <= h:
+            self._levels.append(numpy.empty((0,) + self.shape))
+        self._levels[h] = numpy.concatenate([self._levels[h], values])
+
+    def _capacity(self, h):
+        # lower levels hold fewer values, so the total stays below about 3*sketchSize
+        depth = len(self._levels) - 1 - h
+        return max(2, int(numpy.ceil(self.sketchSize * (2. / 3) ** depth)))
+
+    def _compress(self):
+        h = 0
+        while h < len(self._levels):
+            level = self._levels[h]
+            if len(level) <= self._capacity(h):
+                h += 1
+                continue
+            # sort each point separately and pass every other value up one level,
+            # starting at a random one of the first two; one value stays if odd
+            level = numpy.sort(level, axis=0)
+            keep = len(level) % 2
+            offset = keep + self._rng.randint(2)
+            self._levels[h] = level[:keep]
+            self._addToLevel(h + 1, level[offset::2])
+            h = 0
+
+    def variance(self, ddof=1):
+        """Returns the variance at every point, by default with Bessel's correction."""
+        if self.count <= ddof:
+            return numpy.full(self.shape, numpy.nan)
+        return self._m2 / (self.count - ddof)
+
+    def std(self, ddof=1):
+        return numpy.sqrt(self.variance(ddof))
+
+    def quantile(self, q):
+        """Returns the q quantile at every point, the smallest kept value whose
+        cumulative weight reaches q*count. If q is a sequence, the result has one
+        row per entry of q."""
+        if self.sketchSize is None:
+            raise ValueError('Quantiles are switched off, sketchSize is None')
+        if self.count == 0:
+            raise ValueError('No replicates added')
+        values = numpy.concatenate(self._levels)
+        weights = numpy.concatenate([numpy.repeat(2.**h, len(level))
+                                     for h, level in enumerate(self._levels)])
+        order = numpy.argsort(values, axis=0)
+        values = numpy.take_along_axis(values, order, axis=0)
+        cumulative = weights[order].cumsum(axis=0)
+        probabilities = numpy.atleast_1d(numpy.asarray(q, dtype=float))
+        result = numpy.empty((len(probabilities),) + self.shape)
+        for i, p in enumerate(probabilities):
+            index = numpy.minimum((cumulative < p * self.count).sum(axis=0), len(values) - 1)
+            result[i] = numpy.take_along_axis(values, index[numpy.newaxis], axis=0)[0]
+        return result if numpy.ndim(q) else result[0]
+
+# RoadRunner instance owned by an ensemble worker process and its output selection
+_ensembleRR = None
+_ensembleSelections = None
+
+def _ensembleSeeds (seed, replicates):
+    """Returns distinct seeds for the replicates, drawn from a generator seeded with
+    seed. Replicate i gets the same seed whatever the number of replicates."""
+    rng = numpy.random.RandomState(seed)
+    seeds = rng.randint(1, 2**31 - 1, size=replicates)
+    while True:
+        unique, first = numpy.unique(seeds, return_index=True)
+        if len(unique) == replicates:
+            return seeds
+        repeated = numpy.setdiff1d(numpy.arange(replicates), first)
+        seeds[repeated] = rng.randint(1, 2**31 - 1, size=len(repeated))
+
+def _useGillespie (r):
+    """Makes the Gillespie integrator current with output on a fixed grid and returns
+    a function that puts back the previous integrator and settings."""
+    prev = r.integrator.getName()
+    r.setIntegrator('gillespie')
+    intg = r.integrator
+    settings = [(name, intg.getValue(name)) for name in ('seed', 'variable_step_size')]
+    intg.setValue('variable_step_size', False)
+    def restore():
+        for name, value in settings:
+            intg.setValue(name, value)
+        r.setIntegrator(prev)
+    return restore
+
+def _runReplicates (r, seeds, start, end, points, selections, summary, sketchSize):
+    """Runs one replicate per seed. Returns their stacked results, or if summary is
+    True an EnsembleStatistics that took each result as it finished."""
+    intg = r.integrator
+    shape = (points, len(selections))
+    if summary:
+        out = EnsembleStatistics(shape, sketchSize, seed=seeds[0])
+    else:
+        out = numpy.empty((len(seeds),) + shape)
+    for i, seed in enumerate(seeds):
+        intg.setValue('seed', float(seed))
+        r.reset()
+        result = r.simulate(start, end, points, selections)
+        if summary:
+            out.add(result)
+        else:
+            out[i] = result
+    return out
+
+def _initEnsembleWorker (sbml, selections, integratorSettings):
+    global _ensembleRR, _ensembleSelections
+    _ensembleRR = roadrunner.RoadRunner(sbml)
+    _applyIntegratorSettings(_ensembleRR, *integratorSettings)
+    _useGillespie(_ensembleRR)
+    _ensembleSelections = selections
+
+def _ensembleTask (task):
+    seeds, start, end, points, summary, sketchSize = task
+    return _runReplicates(_ensembleRR, seeds, start, end, points, _ensembleSelections,
+                          summary, sketchSize)
+
+##\brief Run many independent Gillespie simulations of the model on a fixed time grid
+#
+#Example: result = rr.gillespieEnsemble (1000, 0, 40, 41, seed=1234)
+#
+def gillespieEnsemble (self, replicates, start, end, points, selections=None, seed=None,
+                       workers=None, summary=False, blockSize=100, sketchSize=200):
+    """
+    Run replicates Gillespie simulations from the reset model, each recorded at
+    points times from start to end. Every replicate gets its own seed, derived from
+    seed, so the same seed gives the same ensemble whatever the number of workers.
+
+    selections defaults to the time course selections of the model. If workers is
+    greater than one, the SBML of the reset model and the settings of its Gillespie
+    integrator are sent once to a pool of that many processes, each of which compiles
+    the model once, and the replicates are shared among them in blocks of blockSize.
+
+    Returns an array of shape (replicates, points, len(selections)), or, if summary
+    is True, an EnsembleStatistics with the mean, variance and quantiles at every
+    point. Each block is then summarized where it runs, one replicate at a time,
+    and the block summaries are merged in order, so no trajectories are kept and
+    the result does not depend on the number of workers. sketchSize sets the
+    accuracy of the quantiles, see EnsembleStatistics.
+
+    rr = te.loada ('S1 -> S2; k1*S1; k1 = 0.1; S1 = 40')
+    stats = rr.gillespieEnsemble (10000, 0, 40, 41, seed=1, workers=4, summary=True)
+    lower, upper = stats.quantile ([0.05, 0.95])
+    """
+    if self.integrator is None:
+        raise ValueError("model is not loaded")
+    if selections is None:
+        selections = list(self.timeCourseSelections)
+    seeds = _ensembleSeeds(seed, replicates)
+    blocks = [seeds[i:i + blockSize] for i in range(0, replicates, blockSize)]
+    shape = (points, len(selections))
+    if summary:
+        result = EnsembleStatistics(shape, sketchSize, seed=seeds[0] if replicates else None)
+    else:
+        result = numpy.empty((replicates,) + shape)
+
+    def collect(i, block):
+        if summary:
+            result.merge(block)
+        else:
+            result[i * blockSize:i * blockSize + len(block)] = block
+
+    if workers is None or workers <= 1:
+        restore = _useGillespie(self)
+        try:
+            for i, blockSeeds in enumerate(blocks):
+                collect(i, _runReplicates(self, blockSeeds, start, end, points, selections,
+                                          summary, sketchSize))
+        finally:
+            restore()
+            self.reset()
+        return result
+
+    import multiprocessing
+    self.reset()
+    pool = multiprocessing.Pool(workers, _initEnsembleWorker,
+                                (self.getCurrentSBML(), selections, _integratorSettings(self, 'gillespie')))
+    try:
+        tasks = [(blockSeeds, start, end, points, summary, sketchSize) for blockSeeds in blocks]
+        for i, block in enumerate(pool.imap(_ensembleTask, tasks)):
+            collect(i, block)
+    finally:
+        pool.terminate()
+        pool.join()
+    return result
+##@}
 
 def RoadRunner(args):
     return roadrunner.RoadRunner(args)
@@ -418,18 +791,63 @@ def RoadRunner(args):
 ##\ingroup plotting
 #@{
 
-#\cond
-def plotWithLegend (r, result=None, loc='upper left', show=True):
+# Number of x intervals that long plots are reduced to, see decimationIndices
+_plotBuckets = 1000
+
+##\brief Set the number of x intervals that long curves are reduced to before plotting, None to plot every point
+def setPlotBuckets (buckets):
+    global _plotBuckets
+    _plotBuckets = buckets
+
+def getPlotBuckets ():
+    return _plotBuckets
+
+##\brief Returns the indices of the points that are kept when a long curve is drawn
+#
+#Example: index = te.decimationIndices (result[:,0], result[:,1:])
+#\return Returns a sorted array of row indices
+def decimationIndices (x, y, buckets=None):
     """
-    Plot an array and include a legend. The first argument must be a roadrunner variable. 
-    The second argument must be an array containing data to plot. The first column of the array will
-    be the x-axis and remaining columns the y-axis. Returns
-    a handle to the plotting object.
-    
-    plotWithLegend (r)
+    Divide the range of x into buckets intervals of equal
+    width and return the indices of the first and last point and, for every
+    interval, of the points where each column of y has its minimum and maximum.
+    Drawing only these points gives the same picture as drawing all of them when
+    each interval is about a pixel wide, with at most 2*buckets+2 points per
+    column. If there are not more points than that, or x is not sorted, all
+    indices are returned.
+
+    index = decimationIndices (result[:,0], result[:,1:])
+    plt.plot (result[index,0], result[index,1:])
     """
-    import matplotlib.pyplot as p
-    
+    if buckets is None:
+        buckets = _plotBuckets
+    x = numpy.asarray(x)
+    y = numpy.asarray(y)
+    if y.ndim == 1:
+        y = y[:, numpy.newaxis]
+    n = len(x)
+    if buckets is None or buckets <= 0 or n <= 2 * buckets + 2 or not x[-1] > x[0]:
+        return numpy.arange(n)
+    # curves that go back in x, such as phase portraits, are drawn in full
+    if not numpy.all(numpy.diff(x) >= 0):
+        return numpy.arange(n)
+    # points of a bucket are consecutive as x is sorted
+    edges = numpy.linspace(x[0], x[-1], buckets + 1)[1:-1]
+    starts = numpy.concatenate([[0], numpy.searchsorted(x, edges, side='right')])
+    starts = numpy.unique(starts[starts < n])
+    counts = numpy.diff(numpy.append(starts, n))
+    bucketOf = numpy.repeat(numpy.arange(len(starts)), counts)
+    keep = [numpy.array([0, n - 1])]
+    for column in y.T:
+        for extreme in (numpy.minimum, numpy.maximum):
+            values = extreme.reduceat(column, starts)
+            hits = numpy.flatnonzero(column == numpy.repeat(values, counts))
+            # first point of each bucket that reaches the extreme
+            first = numpy.unique(bucketOf[hits], return_index=True)[1]
+            keep.append(hits[first])
+    return numpy.unique(numpy.concatenate(keep))
+
+def _drawWithLegend (ax, r, result, loc):
     if not isinstance (r, roadrunner.RoadRunner):
         raise Exception ('First argument must be a roadrunner variable')
 
@@ -445,7 +863,8 @@ def plotWithLegend (r, result=None, loc='upper left', show=True):
        if columns-1 != len (legendItems):
            raise Exception ('Legend list must match result array')
        for i in range(columns-1):
-           plt.plot (result[:,0], result[:,i+1], linewidth=2.5, label=legendItems[i])           
+           index = decimationIndices (result[:,0], result[:,i+1])
+           ax.plot (result[index,0], result[index,i+1], linewidth=2.5, label=legendItems[i])
     else:
         # result is structured array
         if len(result.dtype.names) < 1:
@@ -454,9 +873,24 @@ def plotWithLegend (r, result=None, loc='upper left', show=True):
         time = result.dtype.names[0]
 
         for name in result.dtype.names[1:]:
-            p.plot(result[time], result[name], label=name)
+            index = decimationIndices (result[time], result[name])
+            ax.plot(result[time][index], result[name][index], label=name)
 
-    plt.legend (loc=loc)
+    ax.legend (loc=loc)
+
+#\cond
+def plotWithLegend (r, result=None, loc='upper left', show=True):
+    """
+    Plot an array and include a legend. The first argument must be a roadrunner variable. 
+    The second argument must be an array containing data to plot. The first column of the array will
+    be the x-axis and remaining columns the y-axis. Returns
+    a handle to the plotting object. Curves with many more points than
+    getPlotBuckets() are reduced to their minimum and maximum per interval of
+    time first, see decimationIndices.
+    
+    plotWithLegend (r)
+    """
+    _drawWithLegend (plt.gca(), r, result, loc)
 
     if show:
         plt.show()
@@ -499,15 +933,103 @@ def plotArray (*args, **kwargs):
     
     result = numpy.array([[1,2,3], [7.2,6.5,8.8], [9.8, 6.5, 4.3]])
     plotArray (result)
+
+    Long arrays are reduced as in plotWithLegend.
     """
     global tehold 
-    p = plt.plot (args[0][:,0], args[0][:,1:], linewidth=2.5, **kwargs)
+    index = decimationIndices (args[0][:,0], args[0][:,1:])
+    p = plt.plot (args[0][index,0], args[0][index,1:], linewidth=2.5, **kwargs)
     # If user is building a legend don't show the plot yet    
     if kwargs.has_key ('label'):
        return p
     if tehold == False:    
        plt.show()
     return p
+
+##\brief Create a matplotlib figure that is not managed by pyplot
+#
+#Example: fig = te.newFigure (figsize=(8, 6))
+#\return Returns a matplotlib Figure with an Agg canvas
+def newFigure (**kwargs):
+    """
+    Create a matplotlib Figure that draws with the Agg renderer and is not
+    registered with pyplot, so nothing is shown and the figure is freed as soon
+    as it is no longer referenced. Keyword arguments are passed to Figure, for
+    example figsize and dpi.
+
+    fig = newFigure (figsize=(8, 6))
+    """
+    _selectHeadlessBackend()
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+##\brief Draw a simulation result with a legend into a new figure, without pyplot
+#
+#Example: fig = te.figureWithLegend (r, result)
+#\return Returns a matplotlib Figure
+def figureWithLegend (r, result=None, loc='upper left', ax=None, **kwargs):
+    """
+    Like plotWithLegend, but draws into the axes ax, or into a new figure made by
+    newFigure with the remaining keyword arguments, and returns the figure
+    instead of showing it.
+
+    fig = figureWithLegend (r, r.simulate (0, 10, 100))
+    saveFigure (fig, 'result.png')
+    """
+    if ax is None:
+        ax = newFigure(**kwargs).add_subplot(111)
+    _drawWithLegend (ax, r, result, loc)
+    return ax.figure
+
+##\brief Draw an array into a new figure, without pyplot
+#
+#Example: fig = te.figureArray (m)
+#\return Returns a matplotlib Figure
+def figureArray (array, ax=None, figsize=None, dpi=None, **kwargs):
+    """
+    Like plotArray, but draws into the axes ax, or into a new figure made by
+    newFigure, and returns the figure instead of showing it. Other keyword
+    arguments are passed to plot.
+
+    fig = figureArray (result, label='Flux')
+    """
+    if ax is None:
+        ax = newFigure(figsize=figsize, dpi=dpi).add_subplot(111)
+    index = decimationIndices (array[:,0], array[:,1:])
+    ax.plot (array[index,0], array[index,1:], linewidth=2.5, **kwargs)
+    return ax.figure
+
+##\brief Save a figure to a file, PNG or SVG depending on the file extension
+#
+#Example: te.saveFigure (fig, 'result.svg')
+def saveFigure (fig, fileName, format=None, **kwargs):
+    """
+    Save a figure made by newFigure, figureWithLegend or figureArray. The format,
+    for example 'png' or 'svg', is taken from the file name unless it is given.
+    Other keyword arguments are passed to Figure.savefig.
+
+    saveFigure (fig, 'result.png', dpi=150)
+    """
+    fig.savefig(fileName, format=format, **kwargs)
+
+##\brief Save a simulation result, plotted with a legend, to a file without pyplot
+#
+#Example: rr.savePlot ('result.png')
+def savePlot (self, fileName, result=None, loc='upper left', format=None, **kwargs):
+    """
+    Plot result, by default the last simulation result, with a legend and save it
+    to fileName without showing it. Nothing is kept once the file is written, so
+    this can be called for thousands of plots in constant memory. Keyword
+    arguments are passed to newFigure.
+
+    for k in values:
+        r.k1 = k
+        r.savePlot ('k1_%g.png' % k, r.simulate (0, 10, 100))
+    """
+    saveFigure(figureWithLegend(self, result, loc, **kwargs), fileName, format=format)
     
 ##\brief Plot results from a simulation carried out by the simulate or gillespie functions. This is a roadrunner method.
 #
@@ -581,7 +1103,7 @@ def loadTestModel (str):
     """
     Loads the test model into roadrunner
     """
-    return roadrunner.testing.getRoadRunner(str)
+    return _testing.getRoadRunner(str)
 
 ##\brief Returns the SBML for a particular test model
 #
@@ -592,7 +1114,7 @@ def getTestModel (str):
     """
     Returns the model as a string from the test directory
     """
-    return roadrunner.testing.getData (str)
+    return _testing.getData (str)
     
 ##\brief Returns the list of possible test models
 #
@@ -601,7 +1123,7 @@ def getTestModel (str):
 #\return Returns the list of available test model names
 def listTestModels():
     modelList = []
-    fileList = roadrunner.testing.dir ('*.xml')
+    fileList = _testing.dir ('*.xml')
     for pathName in fileList:
         modelList.append (os.path.basename (pathName))
     return modelList
@@ -631,7 +1153,321 @@ def resetAll (self):
     """
     self.reset(roadrunner.SelectionRecord.TIME | roadrunner.SelectionRecord.RATE | \
                roadrunner.SelectionRecord.FLOATING | roadrunner.SelectionRecord.GLOBAL_PARAMETER)
-##@} 
+##@}
+
+# ---------------------------------------------------------------------
+##\ingroup values
+#@{
+
+# Value types that are read and written as whole vectors, as the ids method name of
+# the model, the format of an id, and the getter and setter method names. As with
+# model[id], S1 is the amount of a species and [S1] its concentration. They are set
+# in this order, so that concentrations apply to the new compartment volumes.
+_valueGroups = [('getCompartmentIds', '{0}', 'getCompartmentVolumes', 'setCompartmentVolumes'),
+                ('getGlobalParameterIds', '{0}', 'getGlobalParameterValues', 'setGlobalParameterValues'),
+                ('getFloatingSpeciesIds', '{0}', 'getFloatingSpeciesAmounts', 'setFloatingSpeciesAmounts'),
+                ('getFloatingSpeciesIds', '[{0}]', 'getFloatingSpeciesConcentrations', 'setFloatingSpeciesConcentrations'),
+                ('getBoundarySpeciesIds', '[{0}]', 'getBoundarySpeciesConcentrations', 'setBoundarySpeciesConcentrations')]
+
+class ValueHandle (object):
+    """
+    Reads and writes a fixed list of model values with one call per value type.
+    The ids are resolved to indices once, so that set() and get() only pass arrays
+    to the global parameter, species amount or concentration and compartment volume
+    methods of the model. Ids mean the same as in model[id], S1 is an amount and
+    [S1] a concentration. Other ids that the model knows, such as init(S1), are set
+    and read one at a time. A handle stays valid as long as the same model is loaded.
+
+    h = rr.getValueHandle (['k1', 'k2', 'S1'])
+    for values in samples:
+        h.set (values)
+        ...
+    """
+    def __init__(self, rr, ids):
+        self.rr = rr
+        self.ids = [str(id) for id in ids]
+        self.groups = []
+        model = rr.model
+        positions = dict((id, i) for i, id in enumerate(self.ids))
+        for getIds, form, getter, setter in _valueGroups:
+            modelIndex, columns = [], []
+            for index, id in enumerate(getattr(model, getIds)()):
+                id = form.format(id)
+                if id in positions:
+                    modelIndex.append(index)
+                    columns.append(positions.pop(id))
+            if modelIndex:
+                self.groups.append((getter, setter, numpy.array(modelIndex, dtype=numpy.int32),
+                                    numpy.array(columns)))
+        if positions:
+            keys = set(model.keys())
+            for id in positions:
+                if id not in keys:
+                    raise ValueError('"{0}" cannot be found in loaded model'.format(id))
+        self.others = sorted(positions.items(), key=lambda item: item[1])
+
+    def set(self, values):
+        """Sets the values of the ids to values, given in the same order. Values
+        other than parameters, species and compartments are set first."""
+        values = numpy.asarray(values, dtype=float)
+        model = self.rr.model
+        # setting an initial value also resets the species to their initial values
+        for id, column in self.others:
+            model[id] = values[column]
+        for getter, setter, modelIndex, columns in self.groups:
+            getattr(model, setter)(modelIndex, values[columns])
+
+    def get(self, out=None):
+        """Returns the values of the ids as an array, written into out if given."""
+        if out is None:
+            out = numpy.empty(len(self.ids))
+        model = self.rr.model
+        for getter, setter, modelIndex, columns in self.groups:
+            out[columns] = getattr(model, getter)(modelIndex)
+        for id, column in self.others:
+            out[column] = model[id]
+        return out
+
+##\brief Returns a handle that sets and reads a list of model values in bulk
+#
+#Example: h = rr.getValueHandle (['k1', 'k2']); h.set ([0.1, 0.2])
+#
+def getValueHandle (self, ids):
+    """
+    Returns a ValueHandle for ids, to set or read them many times without looking
+    up their names again.
+    """
+    return ValueHandle(self, ids)
+
+##\brief Set several model values with one call per value type
+#
+#Example: rr.setValues (['k1', 'k2'], [0.1, 0.2])
+#
+def setValues (self, ids, values):
+    """
+    Set the model values ids, a list of ids or a ValueHandle, to values. In loops,
+    pass a handle from getValueHandle so the ids are only resolved once.
+
+    rr.setValues (['k1', 'S1'], [0.1, 10])
+    """
+    if not isinstance(ids, ValueHandle):
+        ids = ValueHandle(self, ids)
+    ids.set(values)
+
+##\brief Get several model values with one call per value type
+#
+#Example: values = rr.getValues (['k1', 'k2'])
+#
+def getValues (self, ids):
+    """
+    Returns the model values ids, a list of ids or a ValueHandle, as an array.
+    """
+    if not isinstance(ids, ValueHandle):
+        ids = ValueHandle(self, ids)
+    return ids.get()
+
+# Values kept by a ModelSnapshot, as (getter, setter) method names of the model, in
+# the order they are restored. Initial values come first, because setting them can
+# reset the species. The initial values of global parameters are not included, the
+# model only has a pointer based getter for them.
+_snapshotGroups = [('getCompartmentInitVolumes', 'setCompartmentInitVolumes'),
+                   ('getFloatingSpeciesInitConcentrations', 'setFloatingSpeciesInitConcentrations'),
+                   ('getCompartmentVolumes', 'setCompartmentVolumes'),
+                   ('getBoundarySpeciesConcentrations', 'setBoundarySpeciesConcentrations'),
+                   ('getGlobalParameterValues', 'setGlobalParameterValues'),
+                   ('getConservedMoietyValues', 'setConservedMoietyValues'),
+                   ('getFloatingSpeciesConcentrations', 'setFloatingSpeciesConcentrations')]
+
+class ModelSnapshot (object):
+    """
+    The state of a model at one moment: its time, compartment volumes, species
+    concentrations, global parameters and conserved moiety totals, and the initial
+    volumes and concentrations that reset() returns to. restore() puts them back with one call per
+    value type, which is much cheaper than a reset, so many runs can branch from a
+    state that took a long simulation to reach. Values defined by assignment rules
+    are left out.
+
+    Event triggers are evaluated again from the restored values when the next
+    simulation starts. roadrunner does not expose delayed events that are waiting to
+    fire, so these are not part of a snapshot.
+    """
+    def __init__(self, rr):
+        model = rr.model
+        self.time = model.getTime()
+        self.values = [numpy.array(getattr(model, getter)()) for getter, setter in _snapshotGroups]
+        # indices of the values that can be set, found on the first restore that needs them
+        self._settable = [None] * len(_snapshotGroups)
+
+    def restore(self, rr):
+        model = rr.model
+        for i, (getter, setter) in enumerate(_snapshotGroups):
+            values = self.values[i]
+            if len(values) == 0:
+                continue
+            assign = getattr(model, setter)
+            index = self._settable[i]
+            if index is None:
+                try:
+                    assign(values)
+                    continue
+                except RuntimeError:
+                    # some values are defined by assignment rules
+                    index = self._settable[i] = _settableIndices(values, assign)
+            if len(index):
+                assign(index, values[index])
+        # setting initial values resets the time, so it is set last
+        model.setTime(self.time)
+
+def _settableIndices (values, setter):
+    settable = []
+    for i in range(len(values)):
+        try:
+            setter(numpy.array([i], dtype=numpy.int32), values[i:i + 1])
+            settable.append(i)
+        except RuntimeError:
+            pass
+    return numpy.array(settable, dtype=numpy.int32)
+
+##\brief Returns a snapshot of the current state of the model, see restore()
+#
+#Example: snap = rr.snapshot ()
+#
+def snapshot (self):
+    """
+    Returns a ModelSnapshot of the current state of the model, which restore() puts
+    back. For example, simulate to a steady state once and start every perturbation
+    from there:
+
+    rr.simulate (0, 1000)
+    snap = rr.snapshot ()
+    for k in values:
+        rr.restore (snap)
+        rr.k1 = k
+        result = rr.simulate (1000, 1100, 101)
+    """
+    return ModelSnapshot(self)
+
+##\brief Put the model back into the state saved by snapshot()
+#
+#Example: rr.restore (snap)
+#
+def restore (self, snap):
+    """
+    Put the model back into the state saved in snap by snapshot(). The next
+    simulation should start at the time of the snapshot, snap.time.
+    """
+    snap.restore(self)
+
+def _integratorSettings (r, name=None):
+    """Returns the name of the current integrator of r, or name, and a dictionary of
+    its settings. The current integrator is left as it was."""
+    current = r.integrator.getName()
+    if name is None:
+        name = current
+    r.setIntegrator(name)
+    intg = r.integrator
+    settings = dict((key, intg.getValue(key)) for key in intg.getSettings())
+    r.setIntegrator(current)
+    return name, settings
+
+def _applyIntegratorSettings (r, name, settings):
+    """Makes the integrator name current on r with settings, as returned by
+    _integratorSettings, for example in a worker process that built r from SBML."""
+    r.setIntegrator(name)
+    intg = r.integrator
+    # only change what differs, CVODE rejects some settings that merely repeat defaults
+    for key, value in settings.items():
+        if intg.getValue(key) != value:
+            intg.setValue(key, value)
+
+class PreEquilibration (object):
+    """
+    Brings the reset model to an equilibrated state before the runs of a scan or a
+    fit, and remembers that state, so that every run starts from it instead of
+    repeating the burn-in. Used through the preEquilibration attribute of
+    ParameterScan and SteadyStateScan, the preEquilibration argument of GridScan
+    and the PRE_EQUILIBRATE option of DiffEvolution.
+
+    duration - length of a burn-in simulation, or None to solve for the steady state
+    upstream - ids of values that are set before equilibrating. There is one
+               equilibrated state per distinct combination of their values. All
+               other values a run changes are set on that state.
+    maxSize - number of equilibrated states kept, the least recently used are dropped
+
+    The equilibrated state is taken back to the time of the reset model, so runs
+    cover the same times as without pre-equilibration. equilibrations counts how
+    often the model was equilibrated.
+
+    p = ParameterScan (rr)
+    p.preEquilibration = PreEquilibration (1000, upstream=['Xo'])
+    """
+    def __init__(self, duration=None, upstream=(), maxSize=128):
+        self.duration = duration
+        self.upstream = [str(id) for id in upstream]
+        self.maxSize = maxSize
+        self.equilibrations = 0
+        self.base = None
+        self.states = OrderedDict()
+        self.handles = {}
+
+    def __getstate__(self):
+        # worker processes only need the settings, they equilibrate their own model
+        state = self.__dict__.copy()
+        state['base'] = None
+        state['states'] = OrderedDict()
+        state['handles'] = {}
+        return state
+
+    def key(self):
+        """Returns the settings that results depend on, for SimulationCache keys."""
+        return ('preEquilibration', self.duration, sorted(self.upstream))
+
+    def start(self, rr):
+        """Resets rr and takes its state as the starting point of equilibration. The
+        states remembered so far are kept if that state did not change."""
+        rr.reset()
+        base = ModelSnapshot(rr)
+        # value handles are bound to the model, which may have been loaded again
+        self.handles = {}
+        if self.base is None or not (self.base.time == base.time and all(
+                numpy.array_equal(a, b) for a, b in zip(self.base.values, base.values))):
+            self.base = base
+            self.states.clear()
+
+    def split(self, assignments):
+        """Splits a list of (id, value) pairs into the upstream pairs and the others."""
+        upstream = [(str(id), value) for id, value in assignments if id in self.upstream]
+        others = [(id, value) for id, value in assignments if id not in self.upstream]
+        return upstream, others
+
+    def state(self, rr, upstream=()):
+        """Returns the ModelSnapshot of the model equilibrated with the upstream
+        (id, value) pairs set, equilibrating it first if that has not been done yet."""
+        if self.base is None:
+            self.start(rr)
+        key = tuple(sorted((id, float(value)) for id, value in upstream))
+        if key in self.states:
+            state = self.states.pop(key)
+        else:
+            self.base.restore(rr)
+            if key:
+                ids = tuple(id for id, value in key)
+                handle = self.handles.get(ids)
+                if handle is None or handle.rr is not rr:
+                    handle = self.handles[ids] = ValueHandle(rr, ids)
+                handle.set([value for id, value in key])
+            if self.duration is None:
+                rr.steadyState()
+            else:
+                rr.simulate(self.base.time, self.base.time + self.duration, 2)
+            rr.model.setTime(self.base.time)
+            state = ModelSnapshot(rr)
+            self.equilibrations += 1
+        self.states[key] = state
+        while len(self.states) > self.maxSize:
+            self.states.popitem(last=False)
+        return state
+##@}
 
 # --------------------------------------------------------------------- 
 # Routines to support the Jarnac compatibility layer
@@ -911,12 +1747,14 @@ def getNumRateRules (self):
 roadrunner.RoadRunner.getSeed = getSeed
 roadrunner.RoadRunner.setSeed = setSeed
 roadrunner.RoadRunner.gillespie = gillespie
+roadrunner.RoadRunner.gillespieEnsemble = gillespieEnsemble
 roadrunner.RoadRunner.getRatesOfChange = getRatesOfChange
 roadrunner.RoadRunner.exportToMatlab = exportToMatlab
 roadrunner.RoadRunner.getMatlab = getMatlab
 roadrunner.RoadRunner.getAntimony = getAntimony
 roadrunner.RoadRunner.plotAS = roadrunner.RoadRunner.plot
 roadrunner.RoadRunner.plot = plot
+roadrunner.RoadRunner.savePlot = savePlot
 
 roadrunner.noticesOff = noticesOff
 roadrunner.noticesOn = noticesOn  
@@ -927,6 +1765,12 @@ roadrunner.listTestModels = listTestModels
 roadrunner.RoadRunner.resetToOrigin = resetToOrigin
 roadrunner.RoadRunner.resetAll = resetAll
 
+roadrunner.RoadRunner.getValueHandle = getValueHandle
+roadrunner.RoadRunner.setValues = setValues
+roadrunner.RoadRunner.getValues = getValues
+roadrunner.RoadRunner.snapshot = snapshot
+roadrunner.RoadRunner.restore = restore
+
 # Model flattening routines, saves user from having
 # to type r.model.methodname and from having to 
 # recall where the method is
@@ -23,6 +23,9 @@ class ParameterSlider():
                            to determine maximum value of slider
     sliderStepFactor (optional) - scale factor divided with parameter value,
                                   to determine step size of slider
+    cache (optional) - SimulationCache that keeps the simulation of each slider
+                       setting, so returning to a setting only plots it again
+                       (with plotWithLegend instead of simulateAndPlot)
 
     Example Usage:
 
@@ -49,7 +52,8 @@ class ParameterSlider():
                  maxFactor=2,
                  sliderStepFactor=10,
                  selection=None,
-                 simulateAndPlot=simulateAndPlot
+                 simulateAndPlot=simulateAndPlot,
+                 cache=None
                  ):
 
         if paramIds is None:
@@ -57,15 +61,28 @@ class ParameterSlider():
         paramMap = {}
 
         def runSim(start=0, stop=100, steps=100, **paramMap):
-            r.reset()
-            for k, v in paramMap.items():
+            if cache is not None:
                 try:
-                    key = k.encode('ascii', 'ignore')
-                    r[key] = v
+                    import tellurium as te
+                    values = [(k.encode('ascii', 'ignore'), v) for k, v in paramMap.items()]
+                    if selection is None:
+                        result = cache.simulate(r, values, start, stop, steps)
+                    else:
+                        result = cache.simulate(r, values, start, stop, steps, selection)
+                    te.plotWithLegend(r, result)
                 except:
-                    # error in setting model variable
+                    # error in simulation
                     e = sys.exc_info()
                     print e
+                return
+
+            r.reset()
+            try:
+                handle.set([paramMap[id] for id in handle.ids])
+            except:
+                # error in setting model variable
+                e = sys.exc_info()
+                print e
 
             try:
                 simulateAndPlot(r, start, stop, steps, selection)
@@ -87,6 +104,9 @@ class ParameterSlider():
                 e = sys.exc_info()
                 print e
 
+        # sets all slider values with one call per value type
+        handle = r.getValueHandle(paramMap.keys())
+
         interact(runSim,
                  start=widgets.FloatTextWidget(min=0, value=0),
                  stop=widgets.FloatTextWidget(min=0, value=100),
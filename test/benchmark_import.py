@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Measures how long 'import tellurium' takes in a fresh interpreter and checks that
+the heavy optional subsystems are only imported on first use. Exits with status 1
+if any of them is imported by 'import tellurium' alone, or if the median import
+time is above --max-seconds.
+
+python benchmark_import.py --repeat 5 --max-seconds 1.5
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+# Modules that 'import tellurium' must not load
+LAZY_MODULES = ['matplotlib.pyplot', 'mpl_toolkits.mplot3d', 'roadrunner.testing',
+                'tellurium.tecombine', 'tellurium.SedmlToRr', 'tellurium.tephrasedml',
+                'libsedml', 'phrasedml', 'sbml2matlab', 'IPython',
+                'tellurium.ParameterScan', 'tellurium.Export', 'tellurium.analysis',
+                'tellurium.notebooktools', 'tellurium.optimization',
+                'tellurium.visualization', 'tellurium.widgets']
+
+MEASURE = '''
+import sys, time, json, resource
+start = time.time()
+import tellurium
+seconds = time.time() - start
+print(json.dumps({'seconds': seconds,
+                  'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  'loaded': [m for m in %r if sys.modules.get(m) is not None]}))
+''' % LAZY_MODULES
+
+
+def measure():
+    output = subprocess.check_output([sys.executable, '-c', MEASURE])
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=None)
+    args = parser.parse_args()
+
+    runs = [measure() for i in range(args.repeat)]
+    seconds = sorted(run['seconds'] for run in runs)
+    median = seconds[len(seconds) // 2]
+    print 'import tellurium: median %.3f s, min %.3f s, max %.3f s over %d runs' % (
+        median, seconds[0], seconds[-1], len(runs))
+    print 'peak RSS: %d KB' % max(run['maxrss'] for run in runs)
+
+    failed = False
+    loaded = sorted(set(m for run in runs for m in run['loaded']))
+    if loaded:
+        print 'FAIL: imported eagerly: %s' % ', '.join(loaded)
+        failed = True
+    if args.max_seconds is not None and median > args.max_seconds:
+        print 'FAIL: median import time above %.3f s' % args.max_seconds
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
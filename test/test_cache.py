@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of SimulationCache and of cached batches of simulations.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+import numpy as np
+import tellurium as te
+from tellurium.ParameterScan import NpyAppendOutput
+from tellurium.ParameterScan._parallel import simulateMany
+from tellurium.optimization import DiffEvolution
+
+MODEL = '''
+S1 -> S2; k1*S1
+S2 -> S3; k2*S2
+k1 = 0.5; k2 = 0.2; S1 = 10
+'''
+
+
+class SimulationCacheTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+        self.cache = te.SimulationCache(maxSize=10)
+
+    def test_repeated_simulation_is_a_hit(self):
+        first = self.cache.simulate(self.rr, {'k1': 0.3}, 0, 10, 11)
+        second = self.cache.simulate(self.rr, {'k1': 0.3}, 0, 10, 11)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertTrue(np.array_equal(first, second))
+        self.assertEqual(self.rr.k1, 0.5)
+
+    def test_selections_are_part_of_the_key(self):
+        self.cache.simulate(self.rr, {}, 0, 10, 11)
+        self.rr.timeCourseSelections = ['time', 'S3']
+        result = self.cache.simulate(self.rr, {}, 0, 10, 11)
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(result.shape, (11, 2))
+
+    def test_integrator_settings_are_part_of_the_key(self):
+        self.cache.simulate(self.rr, {}, 0, 10, 11)
+        self.rr.integrator.setValue('relative_tolerance', 1e-10)
+        self.cache.simulate(self.rr, {}, 0, 10, 11)
+        self.assertEqual(self.cache.misses, 2)
+        self.cache.simulate(self.rr, {}, 0, 10, 11)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_integrator_is_selected_for_the_run(self):
+        cvode = self.cache.simulate(self.rr, {}, 0, 10, 11)
+        rk4 = self.cache.simulate(self.rr, {}, 0, 10, 11, integrator='rk4')
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(self.rr.integrator.getName(), 'cvode')
+        self.rr.setIntegrator('rk4')
+        self.assertTrue(np.array_equal(rk4, self.rr.simulate(0, 10, 11)))
+        self.assertFalse(np.array_equal(rk4, cvode))
+
+    def test_directory(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache = te.SimulationCache(maxSize=10, directory=directory)
+            expected = cache.simulate(self.rr, {'k2': 1.}, 0, 10, 11)
+            cache = te.SimulationCache(maxSize=10, directory=directory)
+            result = cache.simulate(self.rr, {'k2': 1.}, 0, 10, 11)
+            self.assertEqual(cache.hits, 1)
+            self.assertTrue(np.array_equal(result, expected))
+        finally:
+            shutil.rmtree(directory)
+
+
+class CachedSimulateManyTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+        self.assignments = [[('k1', k1)] for k1 in np.linspace(0.1, 1, 6)]
+        self.selection = ['time', 'S1', 'S2']
+
+    def test_hits_and_misses_are_written_in_order(self):
+        expected = simulateMany(self.rr, self.assignments, 0, 10, 11, self.selection)
+        cache = te.SimulationCache()
+        # warm the cache with every other row, so hits and misses alternate
+        simulateMany(self.rr, self.assignments[1::2], 0, 10, 11, self.selection, cache=cache)
+        directory = tempfile.mkdtemp()
+        try:
+            out = NpyAppendOutput(os.path.join(directory, 'scan.npy')).open(len(self.assignments))
+            simulateMany(self.rr, self.assignments, 0, 10, 11, self.selection, out=out, cache=cache)
+            result = np.array(out.close())
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual((cache.hits, cache.misses), (3, 6))
+        self.assertTrue(np.allclose(result, expected))
+
+
+def simFcn(rr, params):
+    rr.reset()
+    rr.model.setGlobalParameterValues(np.asarray(params, dtype=float))
+    return rr.simulate(0, 10, 11, ['time', 'S1', 'S2'])
+
+
+def fitnessFcn(sim):
+    return float(((sim[:, 1:] - 1) ** 2).sum())
+
+
+def makeFitness(target):
+    def fitness(sim):
+        return float(((sim[:, 1:] - target) ** 2).sum())
+    return fitness
+
+
+class FunctionKeyTest (unittest.TestCase):
+    def setUp(self):
+        self.cache = te.SimulationCache()
+
+    def test_closures_with_different_values_differ(self):
+        self.assertEqual(self.cache.key(makeFitness(1.0)), self.cache.key(makeFitness(1.0)))
+        self.assertNotEqual(self.cache.key(makeFitness(1.0)), self.cache.key(makeFitness(2.0)))
+        self.assertEqual(self.cache.key(makeFitness(np.ones(3))), self.cache.key(makeFitness(np.ones(3))))
+        self.assertNotEqual(self.cache.key(makeFitness(np.ones(3))), self.cache.key(makeFitness(np.zeros(3))))
+
+    def test_code_and_defaults_are_part_of_the_key(self):
+        first = lambda sim: sim.sum()
+        second = lambda sim: sim.max()
+        self.assertNotEqual(self.cache.key(first), self.cache.key(second))
+        self.assertNotEqual(self.cache.key(lambda sim, scale=1: scale * sim.sum()),
+                            self.cache.key(lambda sim, scale=2: scale * sim.sum()))
+
+    def test_global_data_is_part_of_the_key(self):
+        global TARGET
+        TARGET = 1.0
+        first = self.cache.key(fitnessWithGlobal)
+        TARGET = 2.0
+        self.assertNotEqual(self.cache.key(fitnessWithGlobal), first)
+
+    def test_recursive_function(self):
+        def countdown(n):
+            return n if n <= 0 else countdown(n - 1)
+        self.assertEqual(self.cache.key(countdown), self.cache.key(countdown))
+
+
+TARGET = 1.0
+
+
+def fitnessWithGlobal(sim):
+    return float(((sim[:, 1:] - TARGET) ** 2).sum())
+
+
+class CachedDiffEvolutionTest (unittest.TestCase):
+    def evolve(self, cache, fitness=fitnessFcn):
+        np.random.seed(5)
+        de = DiffEvolution(te.loada(MODEL), fitness, simFcn, POPULATION=8, MAX_GENS=4,
+                           FITNESS_THRESHOLD=0, CACHE=cache, paramRangeDict={'k1': (0, 1), 'k2': (0, 1)})
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            de.start()
+        finally:
+            sys.stdout = stdout
+        return de
+
+    def test_repeated_run_is_not_simulated_again(self):
+        cache = te.SimulationCache(maxSize=100)
+        first = self.evolve(cache)
+        misses = cache.misses
+        self.assertEqual(misses, 4 * 8)
+        second = self.evolve(cache)
+        self.assertEqual(cache.misses, misses)
+        self.assertEqual(cache.hits, 4 * 8)
+        for a, b in zip(first.generations, second.generations):
+            self.assertTrue(np.array_equal(a['members'], b['members']))
+            self.assertTrue(np.array_equal(a['fitness'], b['fitness']))
+
+    def test_fitness_closures_do_not_share_results(self):
+        cache = te.SimulationCache(maxSize=100)
+        first = self.evolve(cache, makeFitness(0.0))
+        second = self.evolve(cache, makeFitness(100.0))
+        alone = te.SimulationCache(maxSize=100)
+        expected = self.evolve(alone, makeFitness(100.0))
+        # only members that come up again within the second run are found
+        self.assertEqual(cache.hits, alone.hits)
+        self.assertNotEqual(first.BEST_FITNESS, second.BEST_FITNESS)
+        self.assertTrue(np.array_equal(second.generations[-1]['fitness'],
+                                       expected.generations[-1]['fitness']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the conversion between Antimony and SBML.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import threading
+import unittest
+import antimony
+import tellurium as te
+import tellurium._conversion as conversion
+
+MODEL = 'S1 -> S2; k1*S1; k1 = 0.1; S1 = 10'
+
+
+class ConversionTest (unittest.TestCase):
+    def setUp(self):
+        te.clearConversionCache()
+
+    def tearDown(self):
+        te.setConversionCacheSize(100)
+        te.clearConversionCache()
+
+    def test_round_trip(self):
+        sbml = te.antimonyTosbml(MODEL)
+        self.assertIn('<sbml', sbml)
+        antimonyStr = te.sbmlToAntimony(sbml)
+        self.assertIn('k1 = 0.1', antimonyStr)
+        r = te.loada(antimonyStr)
+        self.assertEqual((r.k1, r.S1), (0.1, 10))
+
+    def test_results_are_remembered(self):
+        first = te.antimonyTosbml(MODEL)
+        self.assertEqual(len(conversion._cache), 1)
+        self.assertIs(te.antimonyTosbml(MODEL), first)
+        te.setConversionCacheSize(0)
+        self.assertEqual(len(conversion._cache), 0)
+        self.assertEqual(te.antimonyTosbml(MODEL), first)
+        self.assertEqual(len(conversion._cache), 0)
+
+    def test_antimony_table_is_cleared(self):
+        te.antimonyTosbml('model named; S1 -> S2; k1*S1; k1 = 1; end')
+        self.assertEqual(antimony.getNumFiles(), 0)
+        self.assertNotIn('named', antimony.getModuleNames())
+
+    def test_errors(self):
+        self.assertRaises(Exception, te.antimonyTosbml, 'S1 -> ; k1*')
+        # a failed load leaves nothing behind for the next conversion
+        self.assertIn('<sbml', te.antimonyTosbml(MODEL))
+
+    def test_threads(self):
+        models = ['S1 -> S2; k1*S1; k1 = {0}; S1 = 10'.format(i) for i in range(20)]
+        results = [None] * len(models)
+
+        def convert(i):
+            results[i] = te.antimonyTosbml(models[i])
+        threads = [threading.Thread(target=convert, args=(i,)) for i in range(len(models))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i, sbml in enumerate(results):
+            self.assertEqual(te.loadSBMLModel(sbml).k1, i)
+
+
+if __name__ == '__main__':
+    unittest.main()
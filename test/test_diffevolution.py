@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the differential evolution optimizer.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+import numpy as np
+import tellurium as te
+from tellurium.optimization import DiffEvolution, squaredErrorInChunks
+from tellurium.optimization.DiffEvolution import _evaluatePartial
+from tellurium.optimization._strategies import STRATEGIES, createStrategy, distinctIndices
+
+MODEL = 'S1 -> S2; k1*S1; S2 -> S3; k2*S2; k1 = 0.3; k2 = 0.15; S1 = 10; S2 = 0; S3 = 0'
+SELECTIONS = ['time', 'S1', 'S2']
+OBSERVED = np.array(te.loada(MODEL).simulate(0, 20, 41, SELECTIONS))
+RANGES = {'k1': (0, 1), 'k2': (0, 1)}
+
+
+def simFcn(rr, params):
+    rr.reset()
+    rr.model.setGlobalParameterValues(np.asarray(params, dtype=float))
+    return rr.simulate(0, 20, 41, SELECTIONS)
+
+
+def fitnessFcn(sim):
+    return float(((sim[:, 1:] - OBSERVED[:, 1:]) ** 2).sum())
+
+
+def evolve(seed=1, **options):
+    """Runs a small optimization from seed without printing its summary."""
+    settings = dict(paramRangeDict=RANGES, POPULATION=12, MAX_GENS=8, FITNESS_THRESHOLD=0)
+    settings.update(options)
+    np.random.seed(seed)
+    return finish(DiffEvolution(te.loada(MODEL), fitnessFcn, simFcn, **settings))
+
+
+def finish(de):
+    stdout, sys.stdout = sys.stdout, StringIO()
+    try:
+        de.start()
+    finally:
+        sys.stdout = stdout
+    return de
+
+
+def sameGenerations(first, second):
+    if len(first.generations) != len(second.generations):
+        return False
+    return all(np.array_equal(a['members'], b['members']) and np.array_equal(a['fitness'], b['fitness'])
+               for a, b in zip(first.generations, second.generations))
+
+
+class WorkersTest (unittest.TestCase):
+    def test_workers_use_the_integrator_settings(self):
+        members = np.random.RandomState(0).uniform(0, 1, size=(8, 2))
+        fitness = []
+        for workers in (None, 2):
+            rr = te.loada(MODEL)
+            # a loose tolerance changes the fitness enough to tell the settings apart
+            rr.integrator.setValue('relative_tolerance', 1e-2)
+            rr.integrator.setValue('absolute_tolerance', 1e-2)
+            de = DiffEvolution(rr, fitnessFcn, simFcn, paramRangeDict=RANGES, POPULATION=8,
+                               WORKERS=workers)
+            try:
+                fitness.append(de.evaluateMembers(members)[0])
+            finally:
+                de.closePool()
+        self.assertTrue(np.array_equal(fitness[0], fitness[1]))
+
+    def test_workers_give_the_same_run(self):
+        serial = evolve()
+        pooled = evolve(WORKERS=2)
+        self.assertEqual(len(pooled.generations), 8)
+        self.assertTrue(sameGenerations(serial, pooled))
+        self.assertIsNone(pooled.pool)
+
+
+class PopulationTest (unittest.TestCase):
+    def test_generations_hold_arrays(self):
+        de = evolve()
+        self.assertEqual(len(de.generations), 8)
+        for gen in de.generations:
+            self.assertEqual(gen['members'].shape, (12, 2))
+            self.assertEqual(gen['fitness'].shape, (12,))
+            self.assertEqual(len(gen['sim']), 12)
+        first = de.generations[0]['members']
+        self.assertTrue((first >= 0).all() and (first <= 1).all())
+        # a member is only replaced by a better one
+        for previous, gen in zip(de.generations[:-1], de.generations[1:]):
+            self.assertTrue((gen['fitness'] <= previous['fitness']).all())
+        best = de.generations[-1]['fitness'].argmin()
+        self.assertEqual(de.BEST_FITNESS, de.generations[-1]['fitness'][best])
+        self.assertEqual(de.getBestMember().params, de.generations[-1]['members'][best].tolist())
+        self.assertEqual(fitnessFcn(de.generations[-1]['sim'][best]), de.BEST_FITNESS)
+
+    def test_trial_members_are_non_negative(self):
+        np.random.seed(0)
+        de = DiffEvolution(te.loada(MODEL), fitnessFcn, simFcn, paramRangeDict=RANGES, POPULATION=12)
+        members = np.random.uniform(-1, 0, (12, 2))
+        self.assertTrue((de.createTrialMembers(members, np.arange(12.)) >= 0).all())
+        de.NON_NEGATIVE = False
+        self.assertTrue((de.createTrialMembers(members, np.arange(12.)) < 0).any())
+
+
+class HistoryTest (unittest.TestCase):
+    def test_best_keeps_the_best_member_of_earlier_generations(self):
+        full = evolve()
+        reduced = evolve(HISTORY='best')
+        self.assertEqual(len(reduced.generations), len(full.generations))
+        for gen, reducedGen in zip(full.generations[:-1], reduced.generations[:-1]):
+            best = gen['fitness'].argmin()
+            self.assertTrue(np.array_equal(reducedGen['members'], gen['members'][best:best + 1]))
+            self.assertTrue(np.array_equal(reducedGen['fitness'], gen['fitness'][best:best + 1]))
+            self.assertEqual(len(reducedGen['sim']), 1)
+        self.assertTrue(np.array_equal(reduced.generations[-1]['members'], full.generations[-1]['members']))
+
+    def test_directory_keeps_full_generations(self):
+        directory = tempfile.mkdtemp()
+        try:
+            full = evolve()
+            saved = evolve(HISTORY=directory)
+            for i, gen in enumerate(full.generations[:-1]):
+                loaded = saved.loadGeneration(i)
+                self.assertTrue(np.array_equal(loaded['members'], gen['members']))
+                self.assertTrue(np.array_equal(loaded['fitness'], gen['fitness']))
+                self.assertTrue(np.array_equal(loaded['sim'][0], gen['sim'][0]))
+        finally:
+            shutil.rmtree(directory)
+
+
+class CheckpointTest (unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'run.npz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resumed_run_matches_uninterrupted_run(self):
+        for strategy in ('current/1', 'jde', 'shade'):
+            full = evolve(MAX_GENS=10, STRATEGY=strategy)
+            evolve(MAX_GENS=6, STRATEGY=strategy, CHECKPOINT=self.path, CHECKPOINT_INTERVAL=3)
+            np.random.seed(99)
+            resumed = DiffEvolution.resume(self.path, te.loada(MODEL), fitnessFcn, simFcn, MAX_GENS=10)
+            self.assertEqual(len(resumed.generations), 6)
+            self.assertEqual(resumed.STRATEGY, strategy)
+            finish(resumed)
+            self.assertEqual(resumed.BEST_FITNESS, full.BEST_FITNESS)
+            self.assertTrue(np.array_equal(resumed.generations[-1]['members'],
+                                           full.generations[-1]['members']))
+            self.assertTrue(np.array_equal(resumed.generations[-1]['fitness'],
+                                           full.generations[-1]['fitness']))
+
+    def test_options_can_be_changed_on_resume(self):
+        evolve(MAX_GENS=3, CHECKPOINT=self.path, CHECKPOINT_INTERVAL=3)
+        resumed = DiffEvolution.resume(self.path, te.loada(MODEL), fitnessFcn, simFcn,
+                                       MAX_GENS=5, WORKERS=2, SAVE_RESULTS=False)
+        self.assertEqual((resumed.POPULATION, resumed.WORKERS, resumed.SAVE_RESULTS), (12, 2, False))
+        finish(resumed)
+        self.assertEqual(len(resumed.generations), 5)
+
+
+class PartialFitnessTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+        self.partial = squaredErrorInChunks(OBSERVED, SELECTIONS[1:], chunks=4)
+
+    def test_contributions_add_up_to_the_fitness(self):
+        params = [0.5, 0.4]
+        contributions = list(self.partial(self.rr, params))
+        self.assertEqual(len(contributions), 4)
+        self.assertTrue(np.isclose(sum(contributions), fitnessFcn(simFcn(self.rr, params)), rtol=1e-4))
+
+    def test_evaluation_stops_at_the_bound(self):
+        params = [0.5, 0.4]
+        contributions = np.cumsum(list(self.partial(self.rr, params)))
+        bound = (contributions[0] + contributions[1]) / 2
+        fitness, sim = _evaluatePartial(self.rr, self.partial, params, bound)
+        self.assertEqual(fitness, contributions[1])
+        self.assertIsNone(sim)
+
+    def test_run_keeps_the_results_of_winners(self):
+        de = evolve(PARTIAL_FITNESS=self.partial)
+        full = evolve()
+        self.assertLess(de.BEST_FITNESS, de.generations[0]['fitness'].min())
+        self.assertTrue(np.isclose(de.BEST_FITNESS, full.BEST_FITNESS, rtol=1e-3))
+        for gen in de.generations:
+            for fitness, sim in zip(gen['fitness'], gen['sim']):
+                self.assertTrue(np.isclose(fitnessFcn(sim), fitness, rtol=1e-4))
+        self.assertRaises(ValueError, DiffEvolution, self.rr, fitnessFcn, simFcn, POPULATION=12,
+                          PARTIAL_FITNESS=self.partial, ASYNC=True)
+
+
+class StrategyTest (unittest.TestCase):
+    def test_distinct_indices(self):
+        np.random.seed(0)
+        picks = distinctIndices(6, 3, exclude=np.arange(6)[::-1])
+        for row, pick in enumerate(picks):
+            self.assertEqual(len(set(pick)), 3)
+            self.assertNotIn(row, pick)
+            self.assertNotIn(5 - row, pick)
+            self.assertTrue((pick >= 0).all() and (pick < 6).all())
+
+    def test_adaptive_strategies_start_from_the_rates(self):
+        np.random.seed(0)
+        jde = createStrategy('jde', 0.7, 0.3)
+        jde.tau = 0
+        F, CR = jde.parameters(5)
+        self.assertTrue(np.array_equal(F, np.repeat(0.7, 5)))
+        self.assertTrue(np.array_equal(CR, np.repeat(0.3, 5)))
+        shade = createStrategy('shade', 0.7, 0.3)
+        shade.parameters(5)
+        self.assertTrue(np.array_equal(shade.memoryF, np.repeat(0.7, 5)))
+        self.assertTrue(np.array_equal(shade.memoryCR, np.repeat(0.3, 5)))
+
+    def test_population_must_exceed_the_picks(self):
+        for name, strategy in STRATEGIES.items():
+            with self.assertRaises(ValueError):
+                DiffEvolution(te.loada(MODEL), fitnessFcn, simFcn, paramRangeDict=RANGES,
+                              POPULATION=strategy.picks, STRATEGY=name)
+            evolve(POPULATION=strategy.picks + 1, STRATEGY=name, MAX_GENS=2)
+
+    def test_every_strategy_improves_the_fit(self):
+        for name in sorted(STRATEGIES):
+            de = evolve(POPULATION=20, MAX_GENS=15, STRATEGY=name)
+            first = de.generations[0]['fitness'].min()
+            self.assertEqual(de.STRATEGY, name)
+            self.assertLess(de.BEST_FITNESS, first)
+
+
+if __name__ == '__main__':
+    unittest.main()
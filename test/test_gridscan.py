@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of GridScan.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import tellurium as te
+from tellurium.ParameterScan import GridScan
+
+MODEL = '''
+S1 -> S2; k1*S1
+S2 -> S3; k2*S2
+k1 = 0.5; k2 = 0.2; S1 = 10
+'''
+
+
+class GridScanTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+        self.parameters = {'k2': [0.1, 0.2, 0.4], 'k1': [0.3, 0.6]}
+
+    def test_grid_points(self):
+        scan = GridScan(self.rr, self.parameters, ['S1', 'S3'], endTime=10, numberOfPoints=11)
+        result = scan.run()
+        self.assertEqual(scan.parameters, ['k1', 'k2'])
+        self.assertEqual(scan.selections, ['time', 'S1', 'S3'])
+        self.assertEqual(result.shape, (2, 3, 11, 3))
+        self.assertEqual((self.rr.k1, self.rr.k2), (0.5, 0.2))
+        for i, k1 in enumerate(scan.values[0]):
+            for j, k2 in enumerate(scan.values[1]):
+                self.rr.reset()
+                self.rr.k1, self.rr.k2 = k1, k2
+                expected = self.rr.simulate(0, 10, 11, ['time', 'S1', 'S3'])
+                self.assertTrue(np.allclose(result[i, j], expected))
+
+    def test_unknown_parameter(self):
+        self.assertRaises(ValueError, GridScan, self.rr, {'k3': [1, 2]}, ['S1'])
+
+    def test_interrupted_scan_resumes(self):
+        expected = GridScan(self.rr, self.parameters, ['S1'], endTime=10, numberOfPoints=11).run()
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'grid.npy')
+            first = GridScan(self.rr, self.parameters, ['S1'], endTime=10, numberOfPoints=11,
+                             filename=filename)
+            self.assertEqual(first.runChunk(4), 4)
+            self.assertFalse(first.isFinished())
+            second = GridScan(self.rr, self.parameters, ['S1'], endTime=10, numberOfPoints=11,
+                              filename=filename)
+            result = second.run(chunkSize=1)
+            self.assertEqual(second.completed, 6)
+            self.assertTrue(np.allclose(result, expected))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
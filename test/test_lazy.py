@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the lazy loading of optional subsystems.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import sys
+import json
+import subprocess
+import unittest
+from tellurium._lazy import LazyModule
+
+# Imports tellurium in a fresh interpreter, then uses ParameterScan, and prints which
+# of the optional modules were loaded after each step
+LOADED = '''
+import sys, json
+modules = ['matplotlib.pyplot', 'IPython', 'tellurium.ParameterScan', 'tellurium.optimization',
+           'tellurium.tecombine', 'roadrunner.testing']
+loaded = lambda: [m for m in modules if sys.modules.get(m) is not None]
+import tellurium as te
+print(json.dumps(loaded()))
+te.ParameterScan.GridScan
+print(json.dumps(loaded()))
+'''
+
+
+class LazyModuleTest (unittest.TestCase):
+    def test_import_tellurium_loads_no_optional_module(self):
+        lines = subprocess.check_output([sys.executable, '-c', LOADED]).strip().splitlines()
+        self.assertEqual(json.loads(lines[-2]), [])
+        self.assertEqual(json.loads(lines[-1]), ['tellurium.ParameterScan'])
+
+    def test_module_is_imported_on_first_use(self):
+        calls = []
+        module = LazyModule('json', lambda: calls.append(1))
+        self.assertIn('not loaded', repr(module))
+        self.assertEqual(calls, [])
+        self.assertEqual(module.loads('[1]'), [1])
+        module.dumps
+        self.assertEqual(calls, [1])
+        self.assertIn('dumps', dir(module))
+
+    def test_missing_module_fails_on_use(self):
+        module = LazyModule('tellurium_no_such_module')
+        with self.assertRaises(ImportError):
+            module.anything
+
+
+if __name__ == '__main__':
+    unittest.main()
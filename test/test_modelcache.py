@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the cache of loaded models behind loada and loadSBMLModel.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import os
+import sys
+import subprocess
+import unittest
+import tellurium as te
+import tellurium.tellurium as tt
+
+MODEL = 'S1 -> S2; k1*S1; k1 = 0.1; S1 = 10'
+
+# Saves a model state like a roadrunner with saveState would, prints the directory
+# of the state file and exits, after which the directory should be gone
+SAVE_AND_EXIT = '''
+import tellurium.tellurium as tt
+class Saving (object):
+    def saveState(self, fileName):
+        open(fileName, 'wb').close()
+print(tt._saveModelState(Saving(), 'key'))
+'''
+
+
+class SavingRoadRunner (object):
+    """Stands in for a roadrunner version that can save the state of a compiled model."""
+    def saveState(self, fileName):
+        with open(fileName, 'wb') as f:
+            f.write('state')
+
+
+class ModelCacheTest (unittest.TestCase):
+    def setUp(self):
+        te.clearModelCache()
+
+    def tearDown(self):
+        te.setModelCacheSize(20)
+        te.clearModelCache()
+
+    def test_loading_again_is_a_hit(self):
+        first = te.loada(MODEL)
+        first.k1 = 0.5
+        second = te.loada(MODEL)
+        self.assertEqual(te.getModelCacheStats(), {'hits': 1, 'misses': 1, 'size': 1})
+        self.assertEqual(second.k1, 0.1)
+        self.assertIsNot(first, second)
+
+    def test_size_limits_the_cache(self):
+        te.setModelCacheSize(2)
+        for k1 in (0.1, 0.2, 0.3):
+            te.loada('S1 -> S2; k1*S1; k1 = {0}; S1 = 10'.format(k1))
+        self.assertEqual(te.getModelCacheStats()['size'], 2)
+        te.setModelCacheSize(0)
+        self.assertEqual(te.getModelCacheStats()['size'], 0)
+        te.loada(MODEL)
+        self.assertEqual(te.getModelCacheStats()['size'], 0)
+
+    def test_state_file_is_removed_on_eviction(self):
+        stateFile = tt._saveModelState(SavingRoadRunner(), 'evicted')
+        self.assertTrue(os.path.exists(stateFile))
+        self.assertEqual(os.path.dirname(stateFile), tt._modelCacheDir)
+        tt._modelCache['evicted'] = ('<sbml/>', stateFile)
+        te.setModelCacheSize(0)
+        self.assertFalse(os.path.exists(stateFile))
+
+    def test_state_directory_is_removed_at_exit(self):
+        directory = os.path.dirname(subprocess.check_output([sys.executable, '-c', SAVE_AND_EXIT])
+                                    .split()[-1])
+        self.assertTrue(directory.startswith(os.path.join(tt.tempfile.gettempdir(), 'tellurium_models_')))
+        self.assertFalse(os.path.exists(directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
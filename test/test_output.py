@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the output sinks that scans write their results to.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import tellurium as te
+from tellurium.ParameterScan import (GridScan, SamplingScan, ArrayOutput, MemmapOutput,
+                                     NpyAppendOutput, HDF5Output)
+from tellurium.ParameterScan._output import reduceTrajectories
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+MODEL = 'S1 -> S2; k1*S1; k1 = 0.5; S1 = 10'
+
+
+def trajectories(count):
+    time = np.linspace(0, 1, 5)
+    return np.array([np.column_stack([time, i * time, -time]) for i in range(count)])
+
+
+class ReductionTest (unittest.TestCase):
+    def test_reductions(self):
+        runs = trajectories(3)
+        self.assertTrue(np.array_equal(reduceTrajectories(runs, 'final'), runs[:, -1, 1:]))
+        self.assertTrue(np.array_equal(reduceTrajectories(runs, 'min'), runs[:, :, 1:].min(axis=1)))
+        self.assertTrue(np.array_equal(reduceTrajectories(runs, 'max'), runs[:, :, 1:].max(axis=1)))
+        self.assertTrue(np.allclose(reduceTrajectories(runs, 'auc'), [[0, -0.5], [0.5, -0.5], [1, -0.5]]))
+        self.assertRaises(ValueError, ArrayOutput, 'median')
+
+
+class SinkTest (unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def fill(self, output):
+        runs = trajectories(4)
+        with output.open(4):
+            output[0] = runs[0]
+            output[1:4] = runs[1:]
+        return runs
+
+    def test_array_and_memmap(self):
+        for output in (ArrayOutput(), MemmapOutput(os.path.join(self.directory, 'scan.npy'))):
+            runs = self.fill(output)
+            self.assertTrue(np.array_equal(output.result, runs))
+
+    def test_append_needs_order(self):
+        output = NpyAppendOutput(os.path.join(self.directory, 'scan.npy'), reduction='final')
+        runs = self.fill(output)
+        self.assertTrue(np.array_equal(output.result, runs[:, -1, 1:]))
+        output.open(4)
+        output[0] = runs[0]
+        with self.assertRaises(ValueError):
+            output[2] = runs[2]
+
+    @unittest.skipIf(h5py is None, 'requires h5py')
+    def test_hdf5_file_is_closed(self):
+        filename = os.path.join(self.directory, 'scan.h5')
+        output = HDF5Output(filename)
+        runs = self.fill(output)
+        self.assertTrue(np.array_equal(output.result, runs))
+        # an open handle would keep the file from being opened for writing again
+        with h5py.File(filename, 'w') as f:
+            self.assertNotIn('scan', f)
+
+    @unittest.skipIf(h5py is None, 'requires h5py')
+    def test_scans_close_hdf5_output(self):
+        rr = te.loada(MODEL)
+        grid = GridScan(rr, {'k1': [0.1, 0.2, 0.3]}, ['S1'], endTime=5, numberOfPoints=6,
+                        output=HDF5Output(os.path.join(self.directory, 'grid.h5')))
+        expected = GridScan(rr, {'k1': [0.1, 0.2, 0.3]}, ['S1'], endTime=5, numberOfPoints=6).run()
+        self.assertTrue(np.allclose(np.asarray(grid.run()).reshape(expected.shape), expected))
+        self.assertIsNone(grid.output._file)
+        sampling = SamplingScan(rr, {'k1': (0.1, 1)}, ['S1'], 8, endTime=5, numberOfPoints=6, seed=1,
+                                output=HDF5Output(os.path.join(self.directory, 'sampling.h5')))
+        self.assertEqual(sampling.run().shape, (8, 6, 2))
+        self.assertIsNone(sampling.output._file)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of batches of simulations run serially and in a pool of worker processes.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import unittest
+import numpy as np
+import tellurium as te
+from tellurium.ParameterScan import _parallel
+from tellurium.ParameterScan._parallel import simulateMany, simulateSamples
+
+MODEL = '''
+S1 -> S2; k1*S1
+S2 -> S3; k2*S2
+k1 = 0.5; k2 = 0.2; S1 = 10
+'''
+
+
+class SimulateManyTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+        self.assignments = [[('k1', k1), ('k2', k2)]
+                            for k1 in np.linspace(0.1, 1, 4) for k2 in (0.1, 0.3)]
+        self.selection = ['time', 'S1', 'S2', 'S3']
+
+    def test_workers_match_serial(self):
+        serial = simulateMany(self.rr, self.assignments, 0, 10, 21, self.selection)
+        pooled = simulateMany(self.rr, self.assignments, 0, 10, 21, self.selection, workers=2)
+        self.assertTrue(np.allclose(serial, pooled, rtol=1e-6, atol=1e-9))
+
+    def test_results_do_not_depend_on_order(self):
+        serial = simulateMany(self.rr, self.assignments, 0, 10, 21, self.selection)
+        reverse = simulateMany(self.rr, self.assignments[::-1], 0, 10, 21, self.selection)
+        self.assertTrue(np.array_equal(serial, reverse[::-1]))
+
+    def test_workers_use_the_integrator_settings(self):
+        # a loose tolerance changes the results enough to tell the settings apart
+        self.rr.integrator.setValue('relative_tolerance', 1e-2)
+        self.rr.integrator.setValue('absolute_tolerance', 1e-2)
+        serial = simulateMany(self.rr, self.assignments, 0, 10, 21, self.selection)
+        pooled = simulateMany(self.rr, self.assignments, 0, 10, 21, self.selection, workers=2)
+        self.assertTrue(np.array_equal(serial, pooled))
+
+    def test_integrator_is_used_for_the_batch(self):
+        expected = te.loada(MODEL)
+        expected.setIntegrator('rk4')
+        for key, value in self.assignments[0]:
+            expected.model[key] = value
+        expected = expected.simulate(0, 10, 21, self.selection)
+        for workers in (None, 2):
+            result = simulateMany(self.rr, self.assignments[:1], 0, 10, 21, self.selection,
+                                  integrator='rk4', workers=workers)
+            self.assertTrue(np.array_equal(result[0], expected))
+            self.assertEqual(self.rr.integrator.getName(), 'cvode')
+        cvode = simulateMany(self.rr, self.assignments[:1], 0, 10, 21, self.selection)
+        self.assertFalse(np.array_equal(cvode[0], expected))
+
+    def test_ids_are_resolved_once_per_batch(self):
+        built = []
+        handle = _parallel.ValueHandle
+
+        class CountingHandle (handle):
+            def __init__(self, rr, ids):
+                built.append(ids)
+                handle.__init__(self, rr, ids)
+        _parallel.ValueHandle = CountingHandle
+        try:
+            result = simulateMany(self.rr, self.assignments, 0, 10, 21, self.selection)
+        finally:
+            _parallel.ValueHandle = handle
+        self.assertEqual(built, [('k1', 'k2')])
+        for assignment, run in zip(self.assignments, result):
+            expected = te.loada(MODEL)
+            for key, value in assignment:
+                expected.model[key] = value
+            self.assertTrue(np.array_equal(run, expected.simulate(0, 10, 21, self.selection)))
+
+    def test_model_values_are_left_unchanged(self):
+        simulateMany(self.rr, self.assignments, 0, 10, 21, self.selection)
+        self.assertEqual((self.rr.k1, self.rr.k2), (0.5, 0.2))
+
+
+class SimulateSamplesTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+        self.samples = np.random.RandomState(0).uniform(0.1, 1, size=(10, 2))
+        self.selection = ['time', 'S1', 'S2']
+
+    def test_matches_simulate_many(self):
+        assignments = [zip(['k1', 'k2'], sample) for sample in self.samples]
+        expected = simulateMany(self.rr, assignments, 0, 10, 11, self.selection)
+        result = simulateSamples(self.rr, ['k1', 'k2'], self.samples, 0, 10, 11, self.selection)
+        self.assertTrue(np.allclose(result, expected))
+
+    def test_integrator_is_used_for_the_batch(self):
+        assignments = [zip(['k1', 'k2'], sample) for sample in self.samples]
+        expected = simulateMany(self.rr, assignments, 0, 10, 11, self.selection, integrator='rk4')
+        for workers in (None, 2):
+            result = simulateSamples(self.rr, ['k1', 'k2'], self.samples, 0, 10, 11, self.selection,
+                                     integrator='rk4', workers=workers)
+            self.assertTrue(np.allclose(result, expected, rtol=1e-12, atol=0))
+            self.assertEqual(self.rr.integrator.getName(), 'cvode')
+
+    def test_workers_use_the_integrator_settings(self):
+        self.rr.integrator.setValue('relative_tolerance', 1e-2)
+        self.rr.integrator.setValue('absolute_tolerance', 1e-2)
+        serial = simulateSamples(self.rr, ['k1', 'k2'], self.samples, 0, 10, 11, self.selection)
+        pooled = simulateSamples(self.rr, ['k1', 'k2'], self.samples, 0, 10, 11, self.selection,
+                                 workers=2)
+        self.assertTrue(np.array_equal(serial, pooled))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the simulations behind the ParameterScan plots.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import unittest
+import numpy as np
+import tellurium as te
+from tellurium.ParameterScan import ParameterScan, SteadyStateScan, ArrayOutput
+
+MODEL = '''
+S1 -> S2; k1*S1
+S2 -> S3; k2*S2
+k1 = 0.5; k2 = 0.2; S1 = 10
+'''
+
+
+def simulateWith(rr, id, value, *args):
+    rr.reset()
+    previous = rr[id]
+    rr[id] = value
+    result = rr.simulate(*args)
+    rr[id] = previous
+    return result
+
+
+class GraduatedSimTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+        self.scan = ParameterScan(self.rr)
+        self.scan.value = 'k1'
+        self.scan.startValue = 0.1
+        self.scan.endValue = 1
+        self.scan.polyNumber = 4
+        self.scan.endTime = 10
+        self.scan.numberOfPoints = 11
+        self.scan.selection = ['S1', 'S2']
+
+    def test_result_holds_one_column_per_value(self):
+        result = self.scan.graduatedSim()
+        self.assertIs(result, self.scan.scanResult)
+        self.assertEqual(result.shape, (11, 4, 3))
+        for i, k1 in enumerate(np.linspace(0.1, 1, 4)):
+            expected = simulateWith(self.rr, 'k1', k1, 0, 10, 11, ['time', 'S1', 'S2'])
+            self.assertTrue(np.allclose(result[:, i], expected))
+        self.assertEqual(self.rr.k1, 0.5)
+
+    def test_workers_match_serial(self):
+        serial = self.scan.graduatedSim().copy()
+        self.scan.selection = ['S1', 'S2']
+        self.scan.workers = 2
+        self.assertTrue(np.allclose(self.scan.graduatedSim(), serial, rtol=1e-6, atol=1e-9))
+
+    def test_output_sink(self):
+        expected = self.scan.graduatedSim()
+        self.scan.selection = ['S1', 'S2']
+        self.scan.output = ArrayOutput('final')
+        result = self.scan.graduatedSim()
+        self.assertEqual(result.shape, (4, 2))
+        self.assertTrue(np.allclose(result, expected[-1, :, 1:]))
+
+
+class SurfaceSimTest (unittest.TestCase):
+    def test_surface(self):
+        rr = te.loada(MODEL)
+        scan = ParameterScan(rr)
+        scan.independent = ['Time', 'k1']
+        scan.dependent = 'S2'
+        scan.startValue = 0.1
+        scan.endValue = 1
+        scan.endTime = 10
+        scan.numberOfPoints = 6
+        X, Y, Z = scan.surfaceSim()
+        self.assertEqual(X.shape, (6, 6))
+        self.assertTrue(np.allclose(X[0], np.linspace(0, 10, 6)))
+        self.assertTrue(np.allclose(Y[:, 0], np.linspace(0.1, 1, 6)))
+        self.assertEqual(rr.k1, 0.5)
+        for row, k1 in zip(Z, Y[:, 0]):
+            expected = simulateWith(rr, 'k1', k1, 0, 10, 6, ['S2'])
+            self.assertTrue(np.allclose(row, expected[:, 0]))
+
+
+class SteadyStateScanTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada('$X -> S1; k0*X; S1 -> S2; k1*S1; S2 -> ; k2*S2; X = 1; k0 = 2; k1 = 0.5; k2 = 1')
+        self.scan = SteadyStateScan(self.rr)
+        self.scan.value = 'k1'
+        self.scan.startValue = 0.5
+        self.scan.endValue = 5
+        self.scan.numberOfPoints = 10
+        self.scan.selection = ['S1', 'S2']
+
+    def test_steady_states(self):
+        result = self.scan.steadyStateSim()
+        k1 = np.linspace(0.5, 5, 10)
+        self.assertTrue(np.allclose(result[:, 0], k1))
+        self.assertTrue(np.allclose(result[:, 1], 2 / k1, rtol=1e-5))
+        self.assertTrue(np.allclose(result[:, 2], 2., rtol=1e-5))
+
+    def test_steady_state_selections_are_left_unchanged(self):
+        self.rr.steadyStateSelections = ['S2']
+        self.scan.steadyStateSim()
+        self.assertEqual(self.rr.steadyStateSelections, ['S2'])
+        self.scan.value = 'k9'
+        self.assertRaises(Exception, self.scan.steadyStateSim)
+        self.assertEqual(self.rr.steadyStateSelections, ['S2'])
+
+    def test_continuation_matches_restarts(self):
+        expected = self.scan.steadyStateSim()
+        self.scan.continuation = True
+        self.assertTrue(np.allclose(self.scan.steadyStateSim(), expected, rtol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the pyplot-free figure helpers and the decimation of long curves.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+import numpy as np
+import tellurium as te
+
+# Imports a plotting subpackage as if on a machine without a display and prints
+# whether pyplot was loaded by the import and the backend pyplot ends up with
+HEADLESS = '''
+import os, sys
+os.environ.pop('DISPLAY', None)
+os.environ.pop('MPLBACKEND', None)
+import tellurium.ParameterScan
+print('matplotlib.pyplot' in sys.modules)
+import tellurium as te
+te.plt.figure()
+print(te.plt.get_backend().lower())
+'''
+
+
+class DecimationTest (unittest.TestCase):
+    def test_sorted_curve_keeps_extremes(self):
+        x = np.linspace(0, 10, 100000)
+        y = np.column_stack([np.sin(50 * x), np.cos(3 * x)])
+        index = te.decimationIndices(x, y, buckets=100)
+        self.assertLessEqual(len(index), 2 * 2 * 100 + 2)
+        self.assertEqual(index[0], 0)
+        self.assertEqual(index[-1], len(x) - 1)
+        for column in y.T:
+            self.assertEqual(column[index].min(), column.min())
+            self.assertEqual(column[index].max(), column.max())
+
+    def test_short_curve_is_not_decimated(self):
+        x = np.arange(10.)
+        self.assertTrue(np.array_equal(te.decimationIndices(x, x, buckets=100), np.arange(10)))
+
+    def test_unsorted_x_is_not_decimated(self):
+        # a spiral that ends to the right of where it starts
+        t = np.linspace(0, 40 * np.pi, 20000)
+        x = np.cos(t) * (1 + t / 10.)
+        self.assertGreater(x[-1], x[0])
+        y = np.sin(t) * (1 + t / 10.)
+        self.assertTrue(np.array_equal(te.decimationIndices(x, y, buckets=100), np.arange(len(x))))
+
+    def test_limit_cycle_is_plotted_in_full(self):
+        t = np.linspace(0, 20 * np.pi, 20000)
+        cycle = np.column_stack([np.cos(t) + t * 1e-3, np.sin(t)])
+        fig = te.figureArray(cycle)
+        line = fig.axes[0].lines[0]
+        self.assertTrue(np.array_equal(line.get_xdata(), cycle[:, 0]))
+        self.assertTrue(np.array_equal(line.get_ydata(), cycle[:, 1]))
+
+    def test_buckets_setting(self):
+        previous = te.getPlotBuckets()
+        try:
+            te.setPlotBuckets(None)
+            x = np.linspace(0, 1, 10000)
+            self.assertEqual(len(te.decimationIndices(x, x)), len(x))
+        finally:
+            te.setPlotBuckets(previous)
+
+
+class FigureTest (unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.rr = te.loada('S1 -> S2; k1*S1; k1 = 0.5; S1 = 10')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_new_figure_is_not_managed_by_pyplot(self):
+        fig = te.newFigure(figsize=(4, 3), dpi=50)
+        self.assertEqual(tuple(fig.get_size_inches()), (4, 3))
+        self.assertNotIn(fig, [te.plt.figure(n) for n in te.plt.get_fignums()])
+
+    def test_figure_with_legend(self):
+        result = self.rr.simulate(0, 10, 11)
+        fig = te.figureWithLegend(self.rr, result)
+        ax = fig.axes[0]
+        self.assertEqual([line.get_label() for line in ax.lines], ['[S1]', '[S2]'])
+        self.assertTrue(np.array_equal(ax.lines[0].get_ydata(), result[:, 1]))
+        self.assertEqual(ax.get_legend().get_texts()[1].get_text(), '[S2]')
+
+    def test_save_figures(self):
+        self.rr.simulate(0, 10, 11)
+        for name in ('plot.png', 'plot.svg'):
+            fileName = os.path.join(self.directory, name)
+            self.rr.savePlot(fileName, figsize=(3, 2))
+            self.assertGreater(os.path.getsize(fileName), 0)
+        with open(os.path.join(self.directory, 'plot.png'), 'rb') as f:
+            self.assertEqual(f.read(4), '\x89PNG')
+        with open(os.path.join(self.directory, 'plot.svg')) as f:
+            self.assertIn('<svg', f.read())
+
+
+class HeadlessBackendTest (unittest.TestCase):
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'headless selection is for Linux')
+    def test_parameter_scan_does_not_load_pyplot(self):
+        output = subprocess.check_output([sys.executable, '-c', HEADLESS]).split()
+        self.assertEqual(output[-2:], ['False', 'agg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
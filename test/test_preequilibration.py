@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of PreEquilibration in scans and fits.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import sys
+import unittest
+from StringIO import StringIO
+import numpy as np
+import tellurium as te
+import tellurium.tellurium
+from tellurium import PreEquilibration
+from tellurium.ParameterScan import GridScan, ParameterScan, SteadyStateScan
+from tellurium.optimization import DiffEvolution
+
+MODEL = '''
+J0: $Xo -> S1; k0*Xo
+J1: S1 -> S2; k1*S1
+J2: S2 -> ; k2*S2
+k0 = 0.5; k1 = 0.4; k2 = 0.2; Xo = 1
+'''
+SELECTIONS = ['time', 'S1', 'S2']
+
+
+def burnIn(upstream, others, duration=50, endTime=10, numberOfPoints=11):
+    """Simulates a new model with upstream set for duration, then with others set
+    from there, and returns the result with the times shifted back to zero."""
+    # reset() keeps changed global parameters, so start from a new model
+    rr = te.loada(MODEL)
+    for id, value in upstream:
+        rr.model[id] = value
+    rr.simulate(0, duration, 2)
+    for id, value in others:
+        rr.model[id] = value
+    result = np.array(rr.simulate(duration, duration + endTime, numberOfPoints, SELECTIONS))
+    result[:, 0] -= duration
+    return result
+
+
+class GridScanTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+        self.parameters = {'Xo': [1, 2], 'k2': [0.1, 0.2, 0.4]}
+
+    def scan(self, preEquilibration, **options):
+        return GridScan(self.rr, self.parameters, SELECTIONS[1:], endTime=10, numberOfPoints=11,
+                        preEquilibration=preEquilibration, **options).run()
+
+    def test_matches_a_manual_burn_in(self):
+        preEquilibration = PreEquilibration(50, upstream=['Xo'])
+        result = self.scan(preEquilibration)
+        self.assertEqual(preEquilibration.equilibrations, 2)
+        for i, xo in enumerate(self.parameters['Xo']):
+            for j, k2 in enumerate(self.parameters['k2']):
+                expected = burnIn([('Xo', xo)], [('k2', k2)])
+                self.assertTrue(np.allclose(result[i, j], expected, rtol=1e-5, atol=1e-8))
+        self.assertEqual(self.rr.model.getTime(), 0)
+
+    def test_states_are_reused(self):
+        preEquilibration = PreEquilibration(50, upstream=['Xo'])
+        first = self.scan(preEquilibration)
+        second = self.scan(preEquilibration)
+        self.assertEqual(preEquilibration.equilibrations, 2)
+        self.assertTrue(np.array_equal(first, second))
+        # a different reset model makes the states stale
+        self.rr.k0 = 1
+        self.scan(preEquilibration)
+        self.assertEqual(preEquilibration.equilibrations, 4)
+
+    def test_upstream_ids_are_resolved_once(self):
+        built = []
+        handle = tellurium.tellurium.ValueHandle
+
+        class CountingHandle (handle):
+            def __init__(self, rr, ids):
+                built.append(ids)
+                handle.__init__(self, rr, ids)
+        tellurium.tellurium.ValueHandle = CountingHandle
+        try:
+            self.scan(PreEquilibration(50, upstream=['Xo']))
+        finally:
+            tellurium.tellurium.ValueHandle = handle
+        self.assertEqual(built, [('Xo',)])
+
+    def test_workers_match_serial(self):
+        serial = self.scan(PreEquilibration(50, upstream=['Xo']))
+        pooled = self.scan(PreEquilibration(50, upstream=['Xo']), workers=2)
+        self.assertTrue(np.allclose(serial, pooled, rtol=1e-6, atol=1e-9))
+
+    def test_cached_results_depend_on_the_burn_in(self):
+        cache = te.SimulationCache()
+        self.scan(PreEquilibration(50, upstream=['Xo']), cache=cache)
+        self.scan(PreEquilibration(20, upstream=['Xo']), cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 12))
+        self.scan(PreEquilibration(20, upstream=['Xo']), cache=cache)
+        self.assertEqual(cache.hits, 6)
+
+
+class ScanTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+
+    def test_graduated_sim_starts_from_the_burn_in(self):
+        scan = ParameterScan(self.rr)
+        scan.value = 'k2'
+        scan.startValue, scan.endValue, scan.polyNumber = 0.1, 0.5, 3
+        scan.endTime, scan.numberOfPoints = 10, 11
+        scan.selection = ['S1', 'S2']
+        scan.preEquilibration = PreEquilibration(50)
+        result = scan.graduatedSim()
+        self.assertEqual(scan.preEquilibration.equilibrations, 1)
+        for i, k2 in enumerate(np.linspace(0.1, 0.5, 3)):
+            expected = burnIn([], [('k2', k2)])
+            self.assertTrue(np.allclose(result[:, i], expected, rtol=1e-5, atol=1e-8))
+
+    def test_steady_state_scan(self):
+        expected = SteadyStateScan(self.rr)
+        expected.value, expected.startValue, expected.endValue = 'k2', 0.1, 0.5
+        expected.numberOfPoints, expected.selection = 5, ['S1', 'S2']
+        scan = SteadyStateScan(self.rr)
+        scan.value, scan.startValue, scan.endValue = 'k2', 0.1, 0.5
+        scan.numberOfPoints, scan.selection = 5, ['S1', 'S2']
+        scan.preEquilibration = PreEquilibration()
+        self.assertTrue(np.allclose(scan.steadyStateSim(), expected.steadyStateSim(), rtol=1e-6))
+        self.assertEqual(scan.preEquilibration.equilibrations, 1)
+
+
+OBSERVED = burnIn([], [('k1', 0.3), ('k2', 0.15)], numberOfPoints=21)
+RANGES = {'k0': (0.2, 1), 'k1': (0, 1), 'k2': (0, 1)}
+
+
+def simFcn(rr, params):
+    # the model is already in the equilibrated state, so it is not reset
+    rr.model.setGlobalParameterValues(np.asarray(params, dtype=float))
+    return rr.simulate(0, 10, 21, SELECTIONS)
+
+
+def fitnessFcn(sim):
+    return float(((sim[:, 1:] - OBSERVED[:, 1:]) ** 2).sum())
+
+
+class DiffEvolutionTest (unittest.TestCase):
+    def evolve(self, **options):
+        np.random.seed(3)
+        de = DiffEvolution(te.loada(MODEL), fitnessFcn, simFcn, paramRangeDict=RANGES,
+                           POPULATION=10, MAX_GENS=5, FITNESS_THRESHOLD=0,
+                           PRE_EQUILIBRATE=PreEquilibration(50, upstream=['k0']), **options)
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            de.start()
+        finally:
+            sys.stdout = stdout
+        return de
+
+    def test_members_start_from_the_burn_in(self):
+        de = self.evolve()
+        gen = de.generations[-1]
+        for params, fitness in zip(gen['members'][:3], gen['fitness'][:3]):
+            upstream = [('k0', params[0])]
+            expected = burnIn(upstream, zip(['k1', 'k2'], params[1:]), numberOfPoints=21)
+            self.assertTrue(np.isclose(fitnessFcn(expected), fitness, rtol=1e-4, atol=1e-8))
+
+    def test_workers_match_serial(self):
+        serial = self.evolve()
+        pooled = self.evolve(WORKERS=2)
+        for a, b in zip(serial.generations, pooled.generations):
+            self.assertTrue(np.array_equal(a['members'], b['members']))
+            self.assertTrue(np.allclose(a['fitness'], b['fitness'], rtol=1e-6))
+
+    def test_async_is_rejected(self):
+        self.assertRaises(ValueError, DiffEvolution, te.loada(MODEL), fitnessFcn, simFcn,
+                          paramRangeDict=RANGES, POPULATION=10, ASYNC=True,
+                          PRE_EQUILIBRATE=PreEquilibration(50))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of SamplingScan and its Latin hypercube and Sobol designs.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import unittest
+import numpy as np
+import tellurium as te
+from tellurium.ParameterScan import SamplingScan
+from tellurium.ParameterScan.SamplingScan import sobolDirections, sobolPoints
+
+MODEL = '''
+S1 -> S2; k1*S1
+S2 -> S3; k2*S2
+k1 = 0.5; k2 = 0.2; S1 = 10
+'''
+RANGES = {'k1': (0.1, 1), 'k2': (0, 5)}
+
+
+class DesignTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+
+    def test_latin_hypercube_has_one_sample_per_stratum(self):
+        scan = SamplingScan(self.rr, RANGES, ['S1'], 50, seed=3)
+        design = scan.getDesign(0, 50)
+        lower, upper = np.array([0.1, 0]), np.array([1, 5])
+        strata = np.floor((design - lower) / (upper - lower) * 50).astype(int)
+        for column in strata.T:
+            self.assertTrue(np.array_equal(np.sort(column), np.arange(50)))
+
+    def test_seed_gives_the_same_design(self):
+        first = SamplingScan(self.rr, RANGES, ['S1'], 20, seed=3).getDesign(0, 20)
+        second = SamplingScan(self.rr, RANGES, ['S1'], 20, seed=3).getDesign(0, 20)
+        self.assertTrue(np.array_equal(first, second))
+
+    def test_sobol_points(self):
+        points = sobolPoints(sobolDirections(2), 0, 4)
+        self.assertTrue(np.array_equal(points, [[0, 0], [0.5, 0.5], [0.75, 0.25], [0.25, 0.75]]))
+        # the first 2**k points put one point into each interval of width 2**-k
+        points = sobolPoints(sobolDirections(5), 0, 64)
+        for column in points.T:
+            self.assertTrue(np.array_equal(np.sort(np.floor(column * 64)), np.arange(64)))
+        self.assertTrue(np.array_equal(sobolPoints(sobolDirections(3), 10, 20),
+                                       sobolPoints(sobolDirections(3), 0, 20)[10:]))
+
+
+class RunTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+
+    def test_every_sample_is_simulated(self):
+        scan = SamplingScan(self.rr, RANGES, ['S1', 'S2'], 10, method='sobol', endTime=10,
+                            numberOfPoints=11, batchSize=3)
+        result = scan.run()
+        self.assertEqual(result.shape, (10, 11, 3))
+        self.assertEqual((self.rr.k1, self.rr.k2), (0.5, 0.2))
+        for sample, run in zip(scan.getDesign(0, 10), result):
+            self.rr.reset()
+            self.rr.k1, self.rr.k2 = sample
+            self.assertTrue(np.allclose(run, self.rr.simulate(0, 10, 11, ['time', 'S1', 'S2'])))
+
+    def test_workers_match_serial(self):
+        serial = SamplingScan(self.rr, RANGES, ['S1'], 12, seed=1, numberOfPoints=11).run()
+        pooled = SamplingScan(self.rr, RANGES, ['S1'], 12, seed=1, numberOfPoints=11, workers=2).run()
+        self.assertTrue(np.allclose(serial, pooled, rtol=1e-6, atol=1e-9))
+
+
+if __name__ == '__main__':
+    unittest.main()
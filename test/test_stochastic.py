@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of Gillespie ensembles and of the summaries and resampling of their results.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import unittest
+import numpy as np
+import tellurium as te
+import tellurium.tellurium as tt
+
+MODEL = 'S1 -> S2; k1*S1; k1 = 0.1; S1 = 40'
+
+
+class GillespieEnsembleTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+
+    def test_seed_gives_the_same_ensemble(self):
+        first = self.rr.gillespieEnsemble(20, 0, 10, 11, seed=1)
+        second = self.rr.gillespieEnsemble(20, 0, 10, 11, seed=1)
+        other = self.rr.gillespieEnsemble(20, 0, 10, 11, seed=2)
+        self.assertEqual(first.shape, (20, 11, 3))
+        self.assertTrue(np.array_equal(first, second))
+        self.assertFalse(np.array_equal(first, other))
+
+    def test_replicates_differ_and_keep_the_integrator(self):
+        result = self.rr.gillespieEnsemble(20, 0, 10, 11, seed=1)
+        self.assertGreater(len(set(result[:, -1, 1])), 1)
+        self.assertTrue(np.array_equal(result[:, :, 0], np.tile(np.linspace(0, 10, 11), (20, 1))))
+        self.assertEqual(self.rr.integrator.getName(), 'cvode')
+
+    def test_workers_match_serial(self):
+        serial = self.rr.gillespieEnsemble(50, 0, 10, 11, seed=3, blockSize=10)
+        pooled = self.rr.gillespieEnsemble(50, 0, 10, 11, seed=3, blockSize=10, workers=2)
+        self.assertTrue(np.array_equal(serial, pooled))
+
+    def test_workers_use_the_gillespie_settings(self):
+        self.rr.setIntegrator('gillespie')
+        self.rr.integrator.setValue('nonnegative', True)
+        self.rr.setIntegrator('cvode')
+        tt._initEnsembleWorker(self.rr.getCurrentSBML(), ['time', 'S1'],
+                               tt._integratorSettings(self.rr, 'gillespie'))
+        worker = tt._ensembleRR.integrator
+        self.assertEqual(worker.getName(), 'gillespie')
+        self.assertTrue(worker.getValue('nonnegative'))
+        self.assertFalse(worker.getValue('variable_step_size'))
+
+
+class EnsembleMomentsTest (unittest.TestCase):
+    def test_mean_and_variance(self):
+        data = np.random.RandomState(0).normal(3, 2, size=(500, 4, 2))
+        stats = te.EnsembleStatistics((4, 2), sketchSize=None)
+        for trajectory in data[:7]:
+            stats.add(trajectory)
+        stats.addBlock(data[7:300])
+        stats.addBlock(data[300:])
+        self.assertEqual(stats.count, 500)
+        self.assertTrue(np.allclose(stats.mean, data.mean(axis=0)))
+        self.assertTrue(np.allclose(stats.variance(), data.var(axis=0, ddof=1)))
+        self.assertTrue(np.allclose(stats.std(ddof=0), data.std(axis=0)))
+
+    def test_summary_matches_the_ensemble(self):
+        rr = te.loada(MODEL)
+        runs = rr.gillespieEnsemble(200, 0, 10, 11, seed=4, blockSize=30)
+        stats = rr.gillespieEnsemble(200, 0, 10, 11, seed=4, blockSize=30, summary=True)
+        self.assertEqual(stats.count, 200)
+        self.assertTrue(np.allclose(stats.mean, runs.mean(axis=0)))
+        self.assertTrue(np.allclose(stats.variance(), runs.var(axis=0, ddof=1)))
+
+    def test_wrong_shape(self):
+        stats = te.EnsembleStatistics((4, 2))
+        self.assertRaises(ValueError, stats.add, np.zeros((3, 2)))
+        self.assertTrue(np.isnan(stats.variance()).all())
+
+
+def exactQuantile(data, q):
+    """The smallest value whose rank reaches q*len(data), at every point."""
+    ordered = np.sort(data, axis=0)
+    return ordered[max(int(np.ceil(q * len(data))) - 1, 0)]
+
+
+class EnsembleQuantileTest (unittest.TestCase):
+    def setUp(self):
+        self.data = np.random.RandomState(1).exponential(size=(20000, 3, 2))
+
+    def test_exact_while_the_sketch_is_not_full(self):
+        stats = te.EnsembleStatistics((3, 2), sketchSize=200)
+        stats.addBlock(self.data[:150])
+        for q in (0, 0.05, 0.5, 0.95, 1):
+            self.assertTrue(np.array_equal(stats.quantile(q), exactQuantile(self.data[:150], q)))
+        self.assertEqual(stats.quantile([0.1, 0.9]).shape, (2, 3, 2))
+
+    def test_rank_error_is_small(self):
+        stats = te.EnsembleStatistics((3, 2), sketchSize=200, seed=0)
+        for block in np.split(self.data, 40):
+            stats.addBlock(block)
+        self.assertLess(sum(len(level) for level in stats._levels), 3 * 200)
+        ordered = np.sort(self.data, axis=0)
+        for q in (0.05, 0.5, 0.95):
+            estimate = stats.quantile(q)
+            rank = (ordered <= estimate).sum(axis=0) / float(len(self.data))
+            self.assertLess(np.abs(rank - q).max(), 0.02)
+
+    def test_merging_matches_adding(self):
+        parts = [te.EnsembleStatistics((3, 2), sketchSize=100, seed=i) for i in range(4)]
+        for part, block in zip(parts, np.split(self.data[:2000], 4)):
+            part.addBlock(block)
+        merged = te.EnsembleStatistics((3, 2), sketchSize=100, seed=9)
+        for part in parts:
+            merged.merge(part)
+        self.assertEqual(merged.count, 2000)
+        self.assertTrue(np.allclose(merged.mean, self.data[:2000].mean(axis=0)))
+        self.assertTrue(np.allclose(merged.variance(), self.data[:2000].var(axis=0, ddof=1)))
+        ordered = np.sort(self.data[:2000], axis=0)
+        rank = (ordered <= merged.quantile(0.5)).sum(axis=0) / 2000.
+        self.assertLess(np.abs(rank - 0.5).max(), 0.03)
+        self.assertRaises(ValueError, merged.merge, te.EnsembleStatistics((2, 2)))
+
+    def test_workers_give_the_same_quantiles(self):
+        rr = te.loada(MODEL)
+        serial = rr.gillespieEnsemble(400, 0, 10, 11, seed=2, blockSize=50, summary=True, sketchSize=30)
+        pooled = rr.gillespieEnsemble(400, 0, 10, 11, seed=2, blockSize=50, summary=True, sketchSize=30,
+                                      workers=2)
+        self.assertTrue(np.array_equal(serial.quantile([0.1, 0.5, 0.9]), pooled.quantile([0.1, 0.5, 0.9])))
+
+    def test_quantiles_switched_off(self):
+        stats = te.EnsembleStatistics((3, 2), sketchSize=None)
+        stats.addBlock(self.data[:10])
+        self.assertRaises(ValueError, stats.quantile, 0.5)
+
+
+def resampleNaively(events, grid):
+    out = np.empty((len(grid), events.shape[1]))
+    for i, t in enumerate(grid):
+        before = [row for row in events if row[0] <= t]
+        out[i] = before[-1] if before else events[0]
+        out[i, 0] = t
+    return out
+
+
+class ResampleEventsTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+        self.rr.setIntegrator('gillespie')
+        self.rr.integrator.setValue('seed', 7)
+        self.events = np.array(self.rr.simulate(0, 20))
+        self.rr.setIntegrator('cvode')
+
+    def test_matches_a_naive_resampling(self):
+        grid = np.linspace(-1, 25, 53)
+        result = te.resampleEvents(self.events, grid)
+        self.assertTrue(np.array_equal(result, resampleNaively(self.events, grid)))
+
+    def test_grid_times_at_events(self):
+        grid = self.events[:5, 0]
+        result = te.resampleEvents(self.events, grid)
+        self.assertTrue(np.array_equal(result, self.events[:5]))
+
+    def test_out_and_stacking(self):
+        grid = np.linspace(0, 20, 11)
+        out = np.empty((11, self.events.shape[1]))
+        self.assertIs(te.resampleEvents(self.events, grid, out), out)
+        stacked = te.stackEvents([self.events, self.events[:10]], grid)
+        self.assertEqual(stacked.shape, (2, 11, self.events.shape[1]))
+        self.assertTrue(np.array_equal(stacked[0], out))
+        self.assertTrue(np.array_equal(stacked[1], resampleNaively(self.events[:10], grid)))
+        self.assertRaises(ValueError, te.resampleEvents, np.empty((0, 3)), grid)
+        self.assertRaises(ValueError, te.stackEvents, [], grid)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the bulk value helpers and of model snapshots.
+
+python -m unittest discover -s test -p "test_*.py"
+"""
+import unittest
+import numpy as np
+import tellurium as te
+
+MODEL = '''
+compartment cell = 2
+species S1 in cell, S2 in cell, $Xo in cell
+J1: S1 -> S2; k1*S1
+J2: S2 -> S1; k2*S2
+J3: Xo -> S1; k3*Xo
+k1 = 0.5; k2 = 0.2; k3 = 0.1
+S1 = 10; S2 = 1; Xo = 2
+'''
+
+# S1 + S2 is conserved, and the event changes the state halfway through the run
+EVENT_MODEL = '''
+J1: S1 -> S2; k1*S1
+J2: S2 -> S1; k2*S2
+k1 = 0.5; k2 = 0.2; S1 = 10; S2 = 0
+ratio := S2 / (S1 + S2)
+E1: at (time > 6): k1 = 2
+'''
+
+
+class ValueHandleTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(MODEL)
+
+    def test_values_are_set_and_read_in_the_given_order(self):
+        ids = ['S2', 'k3', 'cell', 'Xo', 'k1', '[S1]']
+        values = [3., 0.3, 4., 5., 0.7, 6.]
+        self.rr.setValues(ids, values)
+        for id, value in zip(ids, values):
+            self.assertEqual(self.rr.model[id], value)
+        self.assertTrue(np.array_equal(self.rr.getValues(ids), values))
+
+    def test_matches_setting_one_at_a_time(self):
+        # volumes are set before concentrations, so they come first here too
+        ids = ['cell', 'k1', 'S1', 'k2', '[S2]']
+        values = [1.5, 0.9, 4., 0.05, 3.]
+        other = te.loada(MODEL)
+        for id, value in zip(ids, values):
+            other.model[id] = value
+        self.rr.setValues(ids, values)
+        self.assertTrue(np.array_equal(self.rr.simulate(0, 10, 11), other.simulate(0, 10, 11)))
+
+    def test_handle_is_reused(self):
+        handle = self.rr.getValueHandle(['k2', 'k1'])
+        out = np.empty(2)
+        for k in np.linspace(0.1, 1, 5):
+            self.rr.setValues(handle, [k, 2 * k])
+            self.assertEqual((self.rr.k1, self.rr.k2), (2 * k, k))
+            self.assertIs(handle.get(out), out)
+            self.assertTrue(np.array_equal(out, [k, 2 * k]))
+            self.assertTrue(np.array_equal(self.rr.getValues(handle), [k, 2 * k]))
+
+    def test_initial_values_are_set_first(self):
+        # setting init(S1) resets S1, so the concentration has to be set afterwards
+        self.rr.setValues(['S1', 'init(S1)'], [3., 7.])
+        self.assertTrue(np.array_equal(self.rr.getValues(['S1', 'init(S1)']), [3, 7]))
+        self.rr.reset()
+        self.assertEqual(self.rr.model['S1'], 7)
+
+    def test_unknown_id(self):
+        self.assertRaises(ValueError, self.rr.getValueHandle, ['k1', 'k9'])
+
+
+class SnapshotTest (unittest.TestCase):
+    def setUp(self):
+        self.rr = te.loada(EVENT_MODEL)
+        self.rr.conservedMoietyAnalysis = True
+        self.rr.timeCourseSelections = ['time', 'S1', 'S2', 'ratio', 'k1']
+
+    def test_restored_run_continues_like_the_original(self):
+        self.rr.simulate(0, 5, 51)
+        snap = self.rr.snapshot()
+        expected = self.rr.simulate(5, 10, 51)
+        self.assertEqual(self.rr.k1, 2)
+        self.rr.reset()
+        self.rr.S1, self.rr.k2 = 1, 0.9
+        self.rr.restore(snap)
+        self.assertEqual(self.rr.model.getTime(), snap.time)
+        self.assertEqual(snap.time, 5)
+        self.assertEqual(self.rr.k1, 0.5)
+        result = self.rr.simulate(snap.time, 10, 51)
+        self.assertTrue(np.allclose(result, expected, rtol=1e-6, atol=1e-9))
+
+    def test_conserved_total_is_restored(self):
+        snap = self.rr.snapshot()
+        # changing the initial amounts changes the conserved total
+        self.rr.setValues(['init(S1)', 'init(S2)'], [1., 1.])
+        self.rr.reset()
+        self.rr.restore(snap)
+        self.assertEqual((self.rr.S1, self.rr.S2), (10, 0))
+        result = self.rr.simulate(0, 5, 11)
+        self.assertTrue(np.allclose(result[:, 1] + result[:, 2], 10))
+
+    def test_reset_after_restore_returns_to_the_snapshot_initial_values(self):
+        self.rr['init(S1)'] = 4
+        snap = self.rr.snapshot()
+        self.rr['init(S1)'] = 8
+        self.rr.restore(snap)
+        self.rr.reset()
+        self.assertEqual(self.rr.S1, 4)
+
+    def test_many_runs_branch_from_one_state(self):
+        self.rr.simulate(0, 3, 31)
+        snap = self.rr.snapshot()
+        results = []
+        for k2 in (0.1, 0.2, 0.1):
+            self.rr.restore(snap)
+            self.rr.k2 = k2
+            results.append(self.rr.simulate(snap.time, 10, 71))
+        self.assertTrue(np.array_equal(results[0], results[2]))
+        self.assertFalse(np.allclose(results[0], results[1]))
+        self.assertTrue(np.allclose(results[0][:, 0], np.linspace(3, 10, 71)))
+
+
+if __name__ == '__main__':
+    unittest.main()